@@ -0,0 +1,124 @@
+"""
+This module contains the AdmissionControlMiddleware class, which puts an AdmissionController in
+front of the routes that accept uploads. A request keeps its slot until its response has been sent
+in full, including the body of a streaming response, and may not upload more than it was admitted
+with.
+"""
+
+import logging
+from typing import Iterable
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.service.admission_controller import AdmissionController, AdmissionRejected
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+class AdmissionControlMiddleware:
+    """
+    This class is an ASGI middleware that admits the POST requests of a set of paths through an
+    admission controller. A request is counted with its Content-Length, or with
+    unknown_length_bytes if it does not declare one, and is answered with the status code and
+    Retry-After header of its rejection if it is not admitted. The bytes of its body are counted
+    as they are received, and an upload that goes over its admitted size, e.g. a chunked upload
+    longer than unknown_length_bytes, is answered with a 413 response, or cut short if its
+    response has already started.
+
+    Attributes:
+        app (ASGIApp): The application the admitted requests are passed to.
+        admission_controller (AdmissionController): The controller that admits the requests.
+        paths (set[str]): The paths of the admitted routes.
+        unknown_length_bytes (int): The size counted for a request without a Content-Length.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        admission_controller: AdmissionController,
+        paths: Iterable[str],
+        unknown_length_bytes: int,
+    ) -> None:
+        self.app: ASGIApp = app
+        self.admission_controller: AdmissionController = admission_controller
+        self.paths: set[str] = set(paths)
+        self.unknown_length_bytes: int = unknown_length_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        request_bytes: int = self.request_bytes(scope)
+        try:
+            await self.admission_controller.acquire(request_bytes)
+        except AdmissionRejected as rejection:
+            await self._respond_rejected(rejection, scope, receive, send)
+            return
+
+        received_bytes: int = 0
+        response_started: bool = False
+
+        async def receive_admitted() -> Message:
+            nonlocal received_bytes
+            message: Message = await receive()
+            if message["type"] == "http.request":
+                received_bytes += len(message.get("body", b""))
+                if received_bytes > request_bytes:
+                    raise AdmissionRejected(
+                        413,
+                        f"The upload is larger than the {request_bytes} bytes it was "
+                        "admitted with",
+                    )
+            return message
+
+        async def send_admitted(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, receive_admitted, send_admitted)
+        except AdmissionRejected as rejection:
+            logger.info(rejection.detail)
+            if response_started:
+                raise
+            await self._respond_rejected(rejection, scope, receive, send)
+        finally:
+            self.admission_controller.release(request_bytes)
+
+    def request_bytes(self, scope: Scope) -> int:
+        """
+        This method returns the size a request is admitted with: its Content-Length, or
+        unknown_length_bytes if the header is missing or invalid.
+
+        Args:
+            scope (Scope): The ASGI scope of the request.
+        """
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                try:
+                    return max(int(value), 0)
+                except ValueError:
+                    break
+        return self.unknown_length_bytes
+
+    async def _respond_rejected(
+        self, rejection: AdmissionRejected, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        headers: dict[str, str] = (
+            {"Retry-After": str(rejection.retry_after)}
+            if rejection.retry_after is not None
+            else {}
+        )
+        response: JSONResponse = JSONResponse(
+            status_code=rejection.status_code,
+            content={"detail": rejection.detail},
+            headers=headers,
+        )
+        await response(scope, receive, send)
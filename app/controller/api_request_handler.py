@@ -1,62 +1,582 @@
 """
-This module contains the function that handles a mobile data purchase request. It takes a request as
-input, processes the request into multiple sets of customer information, validates the customer
-information, records the transaction in the database, generates a PDF invoice, and returns a JSON
-response with the status and BAN of each request.
+This module contains the functions that handle a mobile data purchase request. They take a request
+as input, stream the request into chunks of customer information, validate the customer information,
+record the transaction in the database, generate a PDF invoice, and return either a JSON response
+with the status and BAN of each request or a stream of NDJSON lines with the result of every order.
 """
 
+import asyncio
+import json
 import logging
+import uuid
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Union,
+)
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.requests import ClientDisconnect
+from starlette.types import Receive, Scope, Send
 from app.service.db_service import DataBaseService
 from app.validation.validator import CreditRequestValidator
-from app.service.parser import parse_csv_content
-from app.model.mobile_data_sell_order import MobileDataSellOrder
-from app.service.invoice_generator import InvoiceGenerator
-from app.validation.validation_interface import validate_sell_orders
+from app.service.parser import stream_row_chunks
+from app.service.stage_executor import (
+    INVOICE_STAGE,
+    PARSE_STAGE,
+    RECORD_STAGE,
+    VALIDATE_STAGE,
+    StageExecutor,
+    run_stage,
+)
+from app.service.staged_pipeline import PipelineStage, StagedPipeline
+from app.model.invoice_render_result import InvoiceRenderResult
+from app.model.mobile_data_sell_order import SellOrderParseError
+from app.model.sell_order_batch import SellOrderBatch, decode_error_codes
+from app.service.parallel_invoice_renderer import ParallelInvoiceRenderer
+from app.service.invoice_job_queue import InvoiceJobQueue
+from app.service.invoice_cache import InvoiceCache
+from app.service.invoice_dispatch import dispatch_invoices
+from app.service.write_behind_writer import WriteBehindWriter
+from app.validation.validation_interface import validate_sell_order_batch
+
+if TYPE_CHECKING:
+    from app.service.invoice_generator import InvoiceGenerator
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
+NDJSON_MEDIA_TYPE: str = "application/x-ndjson"
+UNPARSEABLE_STATUS: str = "Unparseable"
+ERROR_STATUS: str = "Error"
+# The invoice status of an order: rendered by the request, failed to render, committed as an
+# invoice job for the queue workers, or rendered when it is first downloaded
+INVOICE_GENERATED_STATUS: str = "Generated"
+INVOICE_FAILED_STATUS: str = "Failed"
+INVOICE_QUEUED_STATUS: str = "Queued"
+INVOICE_DEFERRED_STATUS: str = "Deferred"
+
+
+class InvoiceOutcome(NamedTuple):
+    """
+    This class holds the invoice status of one order, and the error of a failed invoice.
+    """
+
+    status: str
+    error: Optional[str] = None
+
+
+class ProcessedSellOrderChunk(NamedTuple):
+    """
+    This class holds the outcome of one chunk of a purchase request once its orders have been
+    validated and recorded.
+
+    Attributes:
+        parse_errors (list[SellOrderParseError]): The rows of the chunk that could not be parsed.
+        batch (SellOrderBatch): The validated and recorded orders of the chunk.
+        row_indexes (list[int]): The row index of every order of the batch within the upload.
+        invoice_outcomes (Optional[list[InvoiceOutcome]]): The invoice outcome of every order of
+            the batch, once its invoices have been handled.
+    """
+
+    parse_errors: list[SellOrderParseError]
+    batch: SellOrderBatch
+    row_indexes: list[int]
+    invoice_outcomes: Optional[list[InvoiceOutcome]] = None
+
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    This class is a StreamingResponse whose body is produced while the request body is still being
+    read. StreamingResponse may listen for a client disconnect on receive() while it streams, which
+    would take the messages of the request body away from the body iterator, so this class only
+    sends the ASGI messages of the response and never calls receive(). A client that disconnects
+    while uploading is noticed by the request stream, which raises a ClientDisconnect.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": self.status_code,
+                    "headers": self.raw_headers,
+                }
+            )
+            async for chunk in self.body_iterator:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(self.charset)
+                await send(
+                    {"type": "http.response.body", "body": chunk, "more_body": True}
+                )
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            # The body iterator holds the upload pipeline, which is stopped if a send fails
+            aclose = getattr(self.body_iterator, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        if self.background is not None:
+            await self.background()
+
 
 async def handle_mobile_data_sell_request(
     api_request: Request,
-    db_session: Session,
+    db_session: Union[Session, AsyncSession],
     validator: CreditRequestValidator,
-    invoice_generator: InvoiceGenerator,
+    invoice_generator: "InvoiceGenerator",
+    chunk_size: int = 1000,
+    write_chunk_size: Optional[int] = None,
+    executor: Optional[StageExecutor] = None,
+    invoice_renderer: Optional[ParallelInvoiceRenderer] = None,
+    invoice_job_queue: Optional[InvoiceJobQueue] = None,
+    invoice_cache: Optional[InvoiceCache] = None,
+    transaction_writer: Optional[WriteBehindWriter] = None,
+    stage_workers: Optional[Mapping[str, int]] = None,
+    queue_size: int = 2,
 ) -> JSONResponse:
     """
-    This function handles a mobile data sell request. It takes a request as input, validates,
-    records, generates PDF invoices, and returns a JSON response with the status and BAN of each
-    request.
+    This function handles a mobile data sell request. It returns a JSON response with the status,
+    BAN and invoice status of each request, plus the invoice error of any invoice that failed and
+    the parse errors of any row that could not be read, once the whole request has been
+    processed. The transactions are recorded with a new upload id, returned in the X-Upload-Id
+    response header.
+
+    Args:
+        See process_mobile_data_sell_request.
+    """
+    responses: dict = {}
+    upload_id: str = str(uuid.uuid4())
+
+    async for processed_chunk in process_mobile_data_sell_request(
+        api_request,
+        db_session,
+        validator,
+        invoice_generator,
+        upload_id,
+        chunk_size=chunk_size,
+        write_chunk_size=write_chunk_size,
+        executor=executor,
+        invoice_renderer=invoice_renderer,
+        invoice_job_queue=invoice_job_queue,
+        invoice_cache=invoice_cache,
+        transaction_writer=transaction_writer,
+        stage_workers=stage_workers,
+        queue_size=queue_size,
+    ):
+        for parse_error in processed_chunk.parse_errors:
+            responses[f"Parse errors for row {parse_error.row_index}"] = (
+                parse_error.errors
+            )
+        for billing_account_number, status, invoice_outcome in zip(
+            processed_chunk.batch.billing_account_number.tolist(),
+            processed_chunk.batch.statuses().tolist(),
+            _invoice_outcomes(processed_chunk),
+        ):
+            responses[f"Status for BAN {billing_account_number}"] = status
+            responses[f"Invoice status for BAN {billing_account_number}"] = (
+                invoice_outcome.status
+            )
+            if invoice_outcome.error is not None:
+                responses[f"Invoice error for BAN {billing_account_number}"] = (
+                    invoice_outcome.error
+                )
+
+    return JSONResponse(content=responses, headers={"X-Upload-Id": upload_id})
+
+
+def handle_mobile_data_sell_request_ndjson(
+    api_request: Request,
+    db_service: DataBaseService,
+    validator: CreditRequestValidator,
+    invoice_generator: "InvoiceGenerator",
+    chunk_size: int = 1000,
+    write_chunk_size: Optional[int] = None,
+    executor: Optional[StageExecutor] = None,
+    invoice_renderer: Optional[ParallelInvoiceRenderer] = None,
+    invoice_job_queue: Optional[InvoiceJobQueue] = None,
+    invoice_cache: Optional[InvoiceCache] = None,
+    transaction_writer: Optional[WriteBehindWriter] = None,
+    stage_workers: Optional[Mapping[str, int]] = None,
+    queue_size: int = 2,
+) -> RequestStreamingResponse:
+    """
+    This function handles a mobile data sell request with a streaming NDJSON response. One line is
+    sent per order, in row order, as soon as the chunk of the order has been recorded and its
+    invoices handled, so duplicate BANs each get their own line and no response map is kept. Each
+    line carries the row index, BAN, status, error codes and invoice status of the order, and the
+    invoice error of a failed invoice; rows that could not be parsed have the status "Unparseable"
+    and their parse errors. If the request fails once the response
+    has started, its upload is discarded and the stream ends with a line with the status "Error",
+    the upload id and the error instead of the remaining orders.
+
+    The response body outlives the FastAPI dependencies of the route, so the database session is
+    opened from the database service for the duration of the stream.
+
+    Args:
+        db_service (DataBaseService): The database service the session is opened from.
+        See process_mobile_data_sell_request for the other arguments.
+    """
+    upload_id: str = str(uuid.uuid4())
+
+    async def ndjson_lines() -> AsyncIterator[str]:
+        try:
+            async with db_service.request_session() as db_session:
+                async for processed_chunk in process_mobile_data_sell_request(
+                    api_request,
+                    db_session,
+                    validator,
+                    invoice_generator,
+                    upload_id,
+                    chunk_size=chunk_size,
+                    write_chunk_size=write_chunk_size,
+                    executor=executor,
+                    invoice_renderer=invoice_renderer,
+                    invoice_job_queue=invoice_job_queue,
+                    invoice_cache=invoice_cache,
+                    transaction_writer=transaction_writer,
+                    stage_workers=stage_workers,
+                    queue_size=queue_size,
+                ):
+                    yield "".join(
+                        json.dumps(result) + "\n"
+                        for result in build_order_results(processed_chunk)
+                    )
+        except ClientDisconnect:
+            raise
+        except Exception as error:
+            # The 200 status has already been sent, so the failure is reported in the body
+            logger.exception(f"The NDJSON response of upload {upload_id} failed")
+            yield json.dumps(
+                {
+                    "status": ERROR_STATUS,
+                    "upload_id": upload_id,
+                    "error": f"{type(error).__name__}: {error}",
+                }
+            ) + "\n"
+
+    return RequestStreamingResponse(
+        ndjson_lines(),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"X-Upload-Id": upload_id},
+    )
+
+
+def build_order_results(processed_chunk: ProcessedSellOrderChunk) -> list[dict]:
+    """
+    This function builds the result of every row of a processed chunk, ordered by row index.
+
+    Args:
+        processed_chunk (ProcessedSellOrderChunk): The processed chunk.
+    """
+    batch: SellOrderBatch = processed_chunk.batch
+    results: list[dict] = []
+    for row_index, billing_account_number, status, error_mask, invoice_outcome in zip(
+        processed_chunk.row_indexes,
+        batch.billing_account_number.tolist(),
+        batch.statuses().tolist(),
+        batch.error_mask.tolist(),
+        _invoice_outcomes(processed_chunk),
+    ):
+        result: dict = {
+            "row_index": row_index,
+            "billing_account_number": billing_account_number,
+            "status": status,
+            "error_codes": decode_error_codes(error_mask),
+            "invoice_status": invoice_outcome.status,
+        }
+        if invoice_outcome.error is not None:
+            result["invoice_error"] = invoice_outcome.error
+        results.append(result)
+    results += [
+        {
+            "row_index": parse_error.row_index,
+            "billing_account_number": (
+                parse_error.row[5] if len(parse_error.row) > 5 else None
+            ),
+            "status": UNPARSEABLE_STATUS,
+            "error_codes": [],
+            "parse_errors": parse_error.errors,
+        }
+        for parse_error in processed_chunk.parse_errors
+    ]
+    return sorted(results, key=lambda result: result["row_index"])
+
+
+async def process_mobile_data_sell_request(
+    api_request: Request,
+    db_session: Union[Session, AsyncSession],
+    validator: CreditRequestValidator,
+    invoice_generator: "InvoiceGenerator",
+    upload_id: str,
+    chunk_size: int = 1000,
+    write_chunk_size: Optional[int] = None,
+    executor: Optional[StageExecutor] = None,
+    invoice_renderer: Optional[ParallelInvoiceRenderer] = None,
+    invoice_job_queue: Optional[InvoiceJobQueue] = None,
+    invoice_cache: Optional[InvoiceCache] = None,
+    transaction_writer: Optional[WriteBehindWriter] = None,
+    stage_workers: Optional[Mapping[str, int]] = None,
+    queue_size: int = 2,
+) -> AsyncIterator[ProcessedSellOrderChunk]:
+    """
+    This function processes a mobile data sell request. It streams the request body in columnar
+    batches of orders and runs them through a staged pipeline: each batch is parsed, validated,
+    recorded and has its PDF invoices generated, with every stage working on a different batch at
+    the same time. Batches wait between stages in bounded queues, so a slow stage holds back the
+    reading of the request body. Each chunk is yielded, in request order, with the invoice outcome
+    of every order, as soon as its invoices have been handled, while the next chunks are already
+    being recorded. An invoice that fails does not fail the upload. If the upload fails part way,
+    e.g. the client disconnects, the transactions already recorded for it are discarded before
+    the error is raised, so a failed upload leaves nothing behind and can be retried as a whole.
+
+    When an executor is given, every CPU-heavy stage is dispatched to its pool and awaited, so the
+    event loop keeps serving other requests while this one is processed.
 
     Args:
         api_request (Request): The API request containing the CSV content.
-        db_session (Session): The database session for interacting with the database.
+        db_session (Union[Session, AsyncSession]): The database session for interacting with the
+            database. Writes through an AsyncSession are awaited instead of blocking the event
+            loop.
         validator (CreditRequestValidator): The validator for validating the credit requests.
         invoice_generator (InvoiceGenerator): The invoice generator for generating PDF invoices.
+        upload_id (str): The id the transactions of the request are recorded with.
+        chunk_size (int): The maximum number of orders processed together.
+        write_chunk_size (int, optional): The maximum number of transactions committed together.
+        executor (StageExecutor, optional): The executor the stages are dispatched to. Stages run
+            on the event loop if not provided.
+        invoice_renderer (ParallelInvoiceRenderer, optional): The process pool that renders the
+            PDF invoices. The invoice generator renders them if not provided.
+        invoice_job_queue (InvoiceJobQueue, optional): The queue the invoices are enqueued on. If
+            provided, an invoice job is committed with each transaction and the invoices are
+            rendered in the background instead of before the response is returned.
+        invoice_cache (InvoiceCache, optional): The cache of invoices rendered on demand. If
+            provided, no invoice is rendered; the cached invoices of the recorded BANs are removed
+            so their next download renders the new transaction.
+        transaction_writer (WriteBehindWriter, optional): The writer the transactions are handed
+            to. If provided, they are group-committed with those of concurrent requests instead
+            of through db_session. The rows of each chunk are then committed whole, so
+            write_chunk_size is not used and a failed write raises the database error instead
+            of a TransactionChunkError.
+        stage_workers (Mapping[str, int], optional): The number of chunks each stage processes
+            at the same time. Stages that are not listed have one worker. The record stage always
+            has one since it writes through the single db_session, and the invoice stage always
+            has one so the invoices of a BAN ordered twice are rendered in upload order.
+        queue_size (int): The maximum number of chunks waiting in front of each stage.
     """
+    enqueue_invoice_jobs: bool = invoice_job_queue is not None
+
+    # Step 1: Parse the rows into a batch of sell orders
+    async def parse(row_chunk: tuple[int, list[list[str]]]) -> ProcessedSellOrderChunk:
+        first_row_index, rows = row_chunk
+        batch: SellOrderBatch
+        parse_errors: list[SellOrderParseError]
+        batch, parse_errors = await run_stage(
+            executor, PARSE_STAGE, SellOrderBatch.from_rows, rows, first_row_index
+        )
+        for parse_error in parse_errors:
+            logger.info(
+                "Skipping unparseable row %s: %s",
+                parse_error.row_index,
+                parse_error.errors,
+            )
+        unparseable_rows: set[int] = {
+            parse_error.row_index for parse_error in parse_errors
+        }
+        row_indexes: list[int] = [
+            row_index
+            for row_index in range(first_row_index, first_row_index + len(rows))
+            if row_index not in unparseable_rows
+        ]
+        return ProcessedSellOrderChunk(parse_errors, batch, row_indexes)
+
+    # Step 2: Validate the mobile data sell orders
+    async def validate(chunk: ProcessedSellOrderChunk) -> ProcessedSellOrderChunk:
+        if not len(chunk.batch):
+            return chunk
+        validated_batch: SellOrderBatch = await run_stage(
+            executor, VALIDATE_STAGE, validate_sell_order_batch, chunk.batch, validator
+        )
+        return chunk._replace(batch=validated_batch)
 
-    # Prep Step: Parse the CSV content into a list of MobileDataSellOrder objects
-    sell_orders: list[MobileDataSellOrder] = parse_csv_content(await api_request.body())
+    # Step 3: Record the transaction in the database. A write that has started is finished even
+    # if the pipeline is cancelled, so that a failed upload can be discarded completely
+    async def record(chunk: ProcessedSellOrderChunk) -> ProcessedSellOrderChunk:
+        if not len(chunk.batch):
+            return chunk
+        if transaction_writer is not None:
+            # The rows are built on the record stage, which the writer does not block
+            transaction_rows: list[dict] = await run_stage(
+                executor,
+                RECORD_STAGE,
+                DataBaseService.build_transaction_rows_from_batch,
+                chunk.batch,
+                upload_id,
+            )
+            await _finish_before_cancelling(
+                transaction_writer.write(transaction_rows, enqueue_invoice_jobs)
+            )
+        elif isinstance(db_session, AsyncSession):
+            await _finish_before_cancelling(
+                DataBaseService.record_transaction_batch_async(
+                    chunk.batch,
+                    db_session,
+                    chunk_size=write_chunk_size,
+                    enqueue_invoice_jobs=enqueue_invoice_jobs,
+                    upload_id=upload_id,
+                )
+            )
+        else:
+            await _finish_before_cancelling(
+                run_stage(
+                    executor,
+                    RECORD_STAGE,
+                    DataBaseService.record_transaction_batch,
+                    chunk.batch,
+                    db_session,
+                    write_chunk_size,
+                    enqueue_invoice_jobs,
+                    upload_id,
+                )
+            )
+        return chunk
 
-    # Step 1: Validate the mobile data sell orders
-    validated_sell_orders = validate_sell_orders(sell_orders, validator)
+    # Step 4: Generate PDF invoices, let the queue workers know about the new jobs, or leave them
+    # to be rendered on demand. The orders are already recorded, so an invoice stage that fails
+    # only fails their invoices
+    async def generate_invoices(
+        chunk: ProcessedSellOrderChunk,
+    ) -> ProcessedSellOrderChunk:
+        if not len(chunk.batch):
+            return chunk
+        invoice_outcomes: list[InvoiceOutcome]
+        try:
+            invoice_results: Optional[list[InvoiceRenderResult]] = (
+                await dispatch_invoices(
+                    chunk.batch,
+                    invoice_generator,
+                    executor=executor,
+                    invoice_renderer=invoice_renderer,
+                    invoice_job_queue=invoice_job_queue,
+                    invoice_cache=invoice_cache,
+                )
+            )
+        except Exception as error:
+            logger.exception(
+                f"Failed to generate the PDF invoices of upload {upload_id}"
+            )
+            invoice_outcomes = [
+                InvoiceOutcome(
+                    INVOICE_FAILED_STATUS, f"{type(error).__name__}: {error}"
+                )
+            ] * len(chunk.batch)
+        else:
+            if invoice_results is None:
+                invoice_outcomes = [
+                    InvoiceOutcome(
+                        INVOICE_QUEUED_STATUS
+                        if invoice_job_queue is not None
+                        else INVOICE_DEFERRED_STATUS
+                    )
+                ] * len(chunk.batch)
+            else:
+                invoice_outcomes = [
+                    (
+                        InvoiceOutcome(INVOICE_GENERATED_STATUS)
+                        if invoice_result.success
+                        else InvoiceOutcome(INVOICE_FAILED_STATUS, invoice_result.error)
+                    )
+                    for invoice_result in invoice_results
+                ]
+        return chunk._replace(invoice_outcomes=invoice_outcomes)
 
-    # Step 2: Record the transaction in the database
-    DataBaseService.record_transactions(validated_sell_orders, db_session)
+    workers: Mapping[str, int] = stage_workers or {}
+    pipeline: StagedPipeline = StagedPipeline(
+        [
+            PipelineStage(PARSE_STAGE, parse, workers.get(PARSE_STAGE, 1)),
+            PipelineStage(VALIDATE_STAGE, validate, workers.get(VALIDATE_STAGE, 1)),
+            PipelineStage(RECORD_STAGE, record),
+            PipelineStage(INVOICE_STAGE, generate_invoices),
+        ],
+        queue_size=queue_size,
+    )
 
-    # Step 3: Generate PDF invoices
-    invoice_generator.generate_pdf_invoices(validated_sell_orders)
+    # Step 5: Stream the CSV content through the stages as chunks of rows, handing the validated
+    # and recorded orders, with their invoice outcomes, to the caller. If the upload fails part
+    # way, the chunks it already recorded are discarded, so that the client can retry the whole
+    # upload
+    try:
+        async for processed_chunk in pipeline.run(
+            stream_row_chunks(api_request.stream(), chunk_size)
+        ):
+            yield processed_chunk
+    except Exception:
+        logger.exception(f"Upload {upload_id} failed; discarding its transactions")
+        await discard_upload(db_session, upload_id, executor, invoice_cache)
+        raise
 
-    # Step 4: Construct the responses
-    responses: dict = {}
 
-    for sell_order in validated_sell_orders:
-        responses[f"Status for BAN {sell_order.billing_account_number}"] = (
-            sell_order.status
+async def discard_upload(
+    db_session: Union[Session, AsyncSession],
+    upload_id: str,
+    executor: Optional[StageExecutor] = None,
+    invoice_cache: Optional[InvoiceCache] = None,
+) -> None:
+    """
+    This function deletes the transactions and invoice jobs recorded for a failed upload. The cached
+    invoices of their billing account numbers are removed, since they may show a deleted
+    transaction. PDF invoices already rendered eagerly for the upload are left on disk; they are
+    replaced by the next invoice of their billing account number.
+
+    Args:
+        db_session (Union[Session, AsyncSession]): The database session of the upload.
+        upload_id (str): The id the transactions of the upload were recorded with.
+        executor (StageExecutor, optional): The executor the record stage is dispatched to.
+        invoice_cache (InvoiceCache, optional): The cache of invoices rendered on demand.
+    """
+    billing_account_numbers: list[str]
+    if isinstance(db_session, AsyncSession):
+        billing_account_numbers = await DataBaseService.discard_upload_async(
+            upload_id, db_session
         )
+    else:
+        billing_account_numbers = await run_stage(
+            executor,
+            RECORD_STAGE,
+            DataBaseService.discard_upload,
+            upload_id,
+            db_session,
+        )
+    if invoice_cache is not None:
+        invoice_cache.invalidate(set(billing_account_numbers))
+
+
+async def _finish_before_cancelling(awaitable: Awaitable[Any]) -> Any:
+    """
+    This function awaits a write that must not be abandoned half way. If the caller is cancelled,
+    the write is still awaited to completion before the cancellation is propagated, so nothing is
+    committed after the caller has stopped.
+
+    Args:
+        awaitable (Awaitable[Any]): The write to await.
+    """
+    write: asyncio.Future = asyncio.ensure_future(awaitable)
+    try:
+        return await asyncio.shield(write)
+    except asyncio.CancelledError:
+        await asyncio.gather(write, return_exceptions=True)
+        raise
+
 
-    # Step 5: Return the JSON response
-    return JSONResponse(content=responses)
+def _invoice_outcomes(processed_chunk: ProcessedSellOrderChunk) -> list[InvoiceOutcome]:
+    if processed_chunk.invoice_outcomes is not None:
+        return processed_chunk.invoice_outcomes
+    # Only a chunk without orders skips the invoice stage
+    return [InvoiceOutcome(INVOICE_DEFERRED_STATUS)] * len(processed_chunk.batch)
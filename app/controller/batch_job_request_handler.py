@@ -0,0 +1,153 @@
+"""
+This module contains the functions that handle batch job requests. They create a batch job from an
+uploaded CSV file, report the progress of a job, and stream the results of a job as NDJSON lines.
+"""
+
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.controller.api_request_handler import NDJSON_MEDIA_TYPE, UNPARSEABLE_STATUS
+from app.model.batch_job import BatchJob, BatchJobParseError
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.model.sell_order_batch import decode_error_codes, encode_error_messages
+from app.service.batch_job_runner import BatchJobRunner
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+BATCH_JOB_STATUS_FIELDS: set[str] = {
+    "id",
+    "status",
+    "next_row_index",
+    "rows_recorded",
+    "rows_unparseable",
+    "attempts",
+    "error",
+    "created_at",
+    "updated_at",
+}
+
+# Number of results read from the database at a time while streaming the results of a job
+BATCH_JOB_RESULT_PAGE_SIZE: int = 1000
+
+
+async def handle_batch_job_create_request(
+    api_request: Request, batch_job_runner: BatchJobRunner
+) -> JSONResponse:
+    """
+    This function handles a batch job request. It stores the uploaded CSV file and returns a 202
+    response with the id and status of the new job as soon as the upload has been stored. The job
+    is processed in the background.
+
+    Args:
+        api_request (Request): The API request containing the CSV content.
+        batch_job_runner (BatchJobRunner): The runner that stores and processes batch jobs.
+    """
+    job: BatchJob = await batch_job_runner.create_job(api_request.stream())
+    return JSONResponse(
+        status_code=202,
+        content=jsonable_encoder(job, include=BATCH_JOB_STATUS_FIELDS),
+        headers={"Location": f"/batch-jobs/{job.id}"},
+    )
+
+
+async def handle_batch_job_status_request(
+    job_id: str, batch_job_runner: BatchJobRunner
+) -> JSONResponse:
+    """
+    This function handles a batch job status request. It returns a JSON response with the status
+    and progress of the job, or a 404 response if the job does not exist.
+
+    Args:
+        job_id (str): The id of the job.
+        batch_job_runner (BatchJobRunner): The runner that stores and processes batch jobs.
+    """
+    job: Optional[BatchJob] = await asyncio.to_thread(batch_job_runner.get_job, job_id)
+    if job is None:
+        return _job_not_found(job_id)
+
+    return JSONResponse(content=jsonable_encoder(job, include=BATCH_JOB_STATUS_FIELDS))
+
+
+async def handle_batch_job_results_request(
+    job_id: str, batch_job_runner: BatchJobRunner
+) -> Response:
+    """
+    This function handles a batch job results request. It streams one NDJSON line per transaction
+    recorded by the job so far, in upload order, with the BAN, status and error codes of the
+    order, followed by one line per row that could not be parsed. The status of the job is
+    returned in the X-Batch-Job-Status header, since the results of a running job are partial.
+    It returns a 404 response if the job does not exist.
+
+    Args:
+        job_id (str): The id of the job.
+        batch_job_runner (BatchJobRunner): The runner that stores and processes batch jobs.
+    """
+    job: Optional[BatchJob] = await asyncio.to_thread(batch_job_runner.get_job, job_id)
+    if job is None:
+        return _job_not_found(job_id)
+
+    async def ndjson_lines() -> AsyncIterator[str]:
+        after_rowid: int = 0
+        while page := await asyncio.to_thread(
+            batch_job_runner.load_transaction_page,
+            job_id,
+            after_rowid,
+            BATCH_JOB_RESULT_PAGE_SIZE,
+        ):
+            yield "".join(
+                json.dumps(_transaction_result(transaction)) + "\n"
+                for _, transaction in page
+            )
+            after_rowid = page[-1][0]
+
+        after_id: int = 0
+        while parse_errors := await asyncio.to_thread(
+            batch_job_runner.load_parse_error_page,
+            job_id,
+            after_id,
+            BATCH_JOB_RESULT_PAGE_SIZE,
+        ):
+            yield "".join(
+                json.dumps(_parse_error_result(parse_error)) + "\n"
+                for parse_error in parse_errors
+            )
+            after_id = parse_errors[-1].id  # type: ignore
+
+    return StreamingResponse(
+        ndjson_lines(),
+        media_type=NDJSON_MEDIA_TYPE,
+        headers={"X-Batch-Job-Status": job.status},
+    )
+
+
+def _transaction_result(transaction: MobileDataPurchaseTransaction) -> dict:
+    validation_errors: list[str] = (
+        transaction.validation_errors.split(", ")
+        if transaction.validation_errors
+        else []
+    )
+    return {
+        "billing_account_number": transaction.billing_account_number,
+        "status": transaction.status,
+        "error_codes": decode_error_codes(encode_error_messages(validation_errors)),
+    }
+
+
+def _parse_error_result(parse_error: BatchJobParseError) -> dict:
+    return {
+        "row_index": parse_error.row_index,
+        "status": UNPARSEABLE_STATUS,
+        "error_codes": [],
+        "parse_errors": json.loads(parse_error.errors),
+    }
+
+
+def _job_not_found(job_id: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=404, content={"detail": f"No batch job with id {job_id}"}
+    )
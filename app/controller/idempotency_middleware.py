@@ -0,0 +1,384 @@
+"""
+This module contains the IdempotencyMiddleware class, which makes the routes that accept uploads
+idempotent. A request is identified by its Idempotency-Key header or, without one, by a hash of
+its path, Accept header and body. A retry of a completed request gets the stored response back
+without being processed again, and a retry that arrives while the original is still running waits
+for it. An Idempotency-Key is bound to the hash of the request it was first used with; reusing it
+for a different request gets a 422 response.
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import tempfile
+import time
+from typing import Iterable, NamedTuple, Optional
+from fastapi.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.model.idempotency_record import IDEMPOTENCY_COMPLETED, IdempotencyRecord
+from app.service.idempotency_store import IdempotencyStore
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+# Number of bytes of a spooled request body replayed at a time
+SPOOL_READ_SIZE: int = 64 * 1024
+
+
+class SpooledBody(NamedTuple):
+    """
+    This class describes the part of a request body read into a spool.
+
+    Attributes:
+        body_hash (Optional[str]): The hash of the path, Accept header and body, or None if the
+            body is larger than the spool cap and was only partly read.
+        disconnected (bool): Whether the client disconnected before sending the whole body.
+    """
+
+    body_hash: Optional[str]
+    disconnected: bool = False
+
+
+class IdempotencyMiddleware:
+    """
+    This class is an ASGI middleware that deduplicates the POST requests of a set of paths through
+    an idempotency store. Successful responses of at most max_stored_bytes are stored and replayed
+    with an Idempotent-Replayed header; other responses, and streamed responses that ended without
+    a body, release their key so a retry is processed again.
+
+    Attributes:
+        app (ASGIApp): The application the requests are passed to.
+        idempotency_store (IdempotencyStore): The store of the idempotency records.
+        paths (set[str]): The paths of the idempotent routes.
+        wait_timeout (float): The number of seconds a retry waits for the original request before
+            it gets a 409 response.
+        poll_interval (float): The number of seconds between two checks of a request running in
+            another worker process.
+        max_stored_bytes (int): The size of the largest response body stored for replay.
+        spool_memory_bytes (int): The number of bytes of a hashed request body kept in memory
+            before it is spooled to disk.
+        max_spooled_bytes (int): The size of the largest request body that is hashed. Larger
+            bodies are passed on as they arrive; without an Idempotency-Key they are not
+            deduplicated, and with one the key is bound to their path, Accept header and
+            Content-Length only.
+        heartbeat_interval (float): The number of seconds between two touches of the record of a
+            running request, which keep it from being presumed lost. It must be shorter than the
+            stale_after of the store.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        idempotency_store: IdempotencyStore,
+        paths: Iterable[str],
+        wait_timeout: float = 60.0,
+        poll_interval: float = 0.5,
+        max_stored_bytes: int = 16 * 1024 * 1024,
+        spool_memory_bytes: int = 1024 * 1024,
+        max_spooled_bytes: int = 16 * 1024 * 1024,
+        heartbeat_interval: float = 60.0,
+    ) -> None:
+        if heartbeat_interval >= idempotency_store.stale_after:
+            raise ValueError(
+                "heartbeat_interval must be shorter than the stale_after of the store"
+            )
+
+        self.app: ASGIApp = app
+        self.idempotency_store: IdempotencyStore = idempotency_store
+        self.paths: set[str] = set(paths)
+        self.wait_timeout: float = wait_timeout
+        self.poll_interval: float = poll_interval
+        self.max_stored_bytes: int = max_stored_bytes
+        self.spool_memory_bytes: int = spool_memory_bytes
+        self.max_spooled_bytes: int = max_spooled_bytes
+        self.heartbeat_interval: float = heartbeat_interval
+        self._running_requests: dict[str, asyncio.Event] = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or scope["path"] not in self.paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        idempotency_key: Optional[str] = _header(scope, b"idempotency-key")
+        content_length: Optional[str] = _header(scope, b"content-length")
+        if (
+            content_length is not None
+            and content_length.isdigit()
+            and int(content_length) > self.max_spooled_bytes
+        ):
+            if idempotency_key is None:
+                logger.info(
+                    f"Not deduplicating a request of {content_length} bytes without an "
+                    "Idempotency-Key"
+                )
+                await self.app(scope, receive, send)
+                return
+            await self._call_once(
+                f"key:{idempotency_key}",
+                _unspooled_request_hash(scope),
+                scope,
+                receive,
+                send,
+            )
+            return
+
+        with tempfile.SpooledTemporaryFile(max_size=self.spool_memory_bytes) as spool:
+            spooled_body: SpooledBody = await _spool_body(
+                scope, receive, spool, self.max_spooled_bytes
+            )
+            if spooled_body.disconnected:
+                logger.info("The client disconnected before sending the whole request")
+                return
+            spool.seek(0)
+            if spooled_body.body_hash is None:
+                if idempotency_key is None:
+                    logger.info(
+                        f"Not deduplicating a request of more than {self.max_spooled_bytes} "
+                        "bytes without an Idempotency-Key"
+                    )
+                    await self.app(scope, _replay_body(spool, receive, True), send)
+                    return
+                await self._call_once(
+                    f"key:{idempotency_key}",
+                    _unspooled_request_hash(scope),
+                    scope,
+                    _replay_body(spool, receive, True),
+                    send,
+                )
+                return
+            await self._call_once(
+                (
+                    f"key:{idempotency_key}"
+                    if idempotency_key is not None
+                    else f"sha256:{spooled_body.body_hash}"
+                ),
+                spooled_body.body_hash,
+                scope,
+                _replay_body(spool, receive, False),
+                send,
+            )
+
+    async def _call_once(
+        self,
+        key: str,
+        request_hash: str,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        deadline: float = time.monotonic() + self.wait_timeout
+
+        # Only one request per key of this worker claims it, the others wait for it to finish
+        while (running_request := self._running_requests.get(key)) is not None:
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                await self._respond_still_running(key, scope, receive, send)
+                return
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(running_request.wait(), remaining)
+
+        self._running_requests[key] = asyncio.Event()
+        try:
+            await self._claim_and_call(
+                key, request_hash, deadline, scope, receive, send
+            )
+        finally:
+            self._running_requests.pop(key).set()
+
+    async def _claim_and_call(
+        self,
+        key: str,
+        request_hash: str,
+        deadline: float,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+    ) -> None:
+        while True:
+            record: Optional[IdempotencyRecord] = await asyncio.to_thread(
+                self.idempotency_store.claim, key, request_hash
+            )
+            if record is None:
+                break
+            if record.request_hash is not None and record.request_hash != request_hash:
+                await _respond_key_reused(key, scope, receive, send)
+                return
+            if record.status == IDEMPOTENCY_COMPLETED:
+                logger.info(f"Replaying the stored response of request {key}")
+                await _replay_response(record, send)
+                return
+
+            # The request is running in another worker process
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                await self._respond_still_running(key, scope, receive, send)
+                return
+            await asyncio.sleep(min(self.poll_interval, remaining))
+
+        response_start: dict = {}
+        body_parts: list[bytes] = []
+        stored_bytes: int = 0
+        complete: bool = False
+
+        async def capturing_send(message: Message) -> None:
+            nonlocal stored_bytes, complete
+            if message["type"] == "http.response.start":
+                response_start.update(message)
+            elif message["type"] == "http.response.body":
+                body: bytes = message.get("body", b"")
+                stored_bytes += len(body)
+                if stored_bytes <= self.max_stored_bytes:
+                    body_parts.append(body)
+                complete = not message.get("more_body", False)
+            await send(message)
+
+        heartbeat: asyncio.Task = asyncio.create_task(self._keep_claimed(key))
+        try:
+            await self.app(scope, receive, capturing_send)
+        finally:
+            heartbeat.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await heartbeat
+            status_code: int = response_start.get("status", 500)
+            # A streamed response has no Content-Length, and one without a body did not finish its
+            # work, e.g. an NDJSON stream that failed before its first line
+            streamed: bool = not any(
+                name.lower() == b"content-length"
+                for name, _ in response_start.get("headers", [])
+            )
+            if (
+                complete
+                and 200 <= status_code < 300
+                and stored_bytes <= self.max_stored_bytes
+                and (stored_bytes > 0 or not streamed)
+            ):
+                await asyncio.to_thread(
+                    self.idempotency_store.complete,
+                    key,
+                    status_code,
+                    [
+                        (name.decode("latin-1"), value.decode("latin-1"))
+                        for name, value in response_start.get("headers", [])
+                    ],
+                    b"".join(body_parts),
+                )
+            else:
+                logger.info(f"Not storing the response of request {key}")
+                await asyncio.to_thread(self.idempotency_store.release, key)
+
+    async def _keep_claimed(self, key: str) -> None:
+        # A long upload would otherwise be presumed lost after stale_after and run again by a retry
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await asyncio.to_thread(self.idempotency_store.touch, key)
+            except Exception as error:
+                logger.warning(f"Failed to touch the running request {key}: {error}")
+
+    async def _respond_still_running(
+        self, key: str, scope: Scope, receive: Receive, send: Send
+    ) -> None:
+        logger.warning(f"Gave up waiting for the running request {key}")
+        response: JSONResponse = JSONResponse(
+            status_code=409,
+            content={"detail": "The same request is still being processed"},
+            headers={"Retry-After": str(max(int(self.poll_interval), 1))},
+        )
+        await response(scope, receive, send)
+
+
+async def _respond_key_reused(
+    key: str, scope: Scope, receive: Receive, send: Send
+) -> None:
+    logger.warning(f"Rejecting a different request with the idempotency key {key}")
+    response: JSONResponse = JSONResponse(
+        status_code=422,
+        content={"detail": "The Idempotency-Key was used for a different request"},
+    )
+    await response(scope, receive, send)
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for header_name, value in scope["headers"]:
+        if header_name == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _spool_body(
+    scope: Scope,
+    receive: Receive,
+    spool: tempfile.SpooledTemporaryFile,
+    max_spooled_bytes: int,
+) -> SpooledBody:
+    # The path and Accept header are hashed too, since they change the response of the body
+    digest = hashlib.sha256()
+    digest.update(scope["path"].encode())
+    digest.update(b"\0" + (_header(scope, b"accept") or "").encode() + b"\0")
+    spooled_bytes: int = 0
+    more_body: bool = True
+    while more_body:
+        message: Message = await receive()
+        if message["type"] == "http.disconnect":
+            return SpooledBody(None, disconnected=True)
+        body: bytes = message.get("body", b"")
+        digest.update(body)
+        await asyncio.to_thread(spool.write, body)
+        spooled_bytes += len(body)
+        more_body = message.get("more_body", False)
+        if more_body and spooled_bytes > max_spooled_bytes:
+            return SpooledBody(None)
+    return SpooledBody(digest.hexdigest())
+
+
+def _unspooled_request_hash(scope: Scope) -> str:
+    # A body larger than the spool cap is not hashed, so its key is bound to its path, Accept
+    # header and Content-Length only
+    digest = hashlib.sha256()
+    digest.update(scope["path"].encode())
+    digest.update(b"\0" + (_header(scope, b"accept") or "").encode() + b"\0")
+    digest.update(b"unspooled:" + (_header(scope, b"content-length") or "").encode())
+    return digest.hexdigest()
+
+
+def _replay_body(
+    spool: tempfile.SpooledTemporaryFile, receive: Receive, more_body: bool
+) -> Receive:
+    # more_body tells whether the rest of the body is still to be received after the spool
+    exhausted: bool = False
+
+    async def replay_receive() -> Message:
+        nonlocal exhausted
+        if exhausted:
+            return await receive()
+        body: bytes = await asyncio.to_thread(spool.read, SPOOL_READ_SIZE)
+        exhausted = len(body) < SPOOL_READ_SIZE
+        return {
+            "type": "http.request",
+            "body": body,
+            "more_body": more_body or not exhausted,
+        }
+
+    return replay_receive
+
+
+async def _replay_response(record: IdempotencyRecord, send: Send) -> None:
+    headers: list[list[str]] = json.loads(record.response_headers or "[]")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": record.status_code,
+            "headers": [
+                (name.encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ]
+            + [(b"idempotent-replayed", b"true")],
+        }
+    )
+    await send({"type": "http.response.body", "body": record.response_body or b""})
@@ -0,0 +1,142 @@
+"""
+This module contains the functions that handle invoice requests. They serve the PDF invoice of a
+billing account number, rendering it on first access, stream ZIP archives of the invoices of an
+upload or of several billing account numbers, and report the status of invoice jobs.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Optional
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from app.model.invoice_job import InvoiceJob
+from app.service.invoice_archive import InvoiceArchive
+from app.service.invoice_cache import InvoiceCache, etag_matches, invoice_etag
+from app.service.invoice_job_queue import InvoiceJobQueue
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+INVOICE_JOB_STATUS_FIELDS: set[str] = {
+    "id",
+    "status",
+    "attempts",
+    "error",
+    "created_at",
+    "updated_at",
+}
+
+
+async def handle_invoice_status_request(
+    billing_account_number: str,
+    invoice_job_queue: InvoiceJobQueue,
+) -> JSONResponse:
+    """
+    This function handles an invoice status request. It returns a JSON response with the status of
+    every invoice job of the billing account number, oldest first, or a 404 response if the billing
+    account number has no invoice jobs.
+
+    Args:
+        billing_account_number (str): The billing account number.
+        invoice_job_queue (InvoiceJobQueue): The queue holding the invoice jobs.
+    """
+    jobs: list[InvoiceJob] = await asyncio.to_thread(
+        invoice_job_queue.get_jobs, billing_account_number
+    )
+    if not jobs:
+        return JSONResponse(
+            status_code=404,
+            content={
+                "detail": f"No invoice jobs for BAN {billing_account_number}",
+            },
+        )
+
+    return JSONResponse(
+        content={
+            "billing_account_number": billing_account_number,
+            "invoices": [
+                jsonable_encoder(job, include=INVOICE_JOB_STATUS_FIELDS) for job in jobs
+            ],
+        }
+    )
+
+
+async def handle_invoice_request(
+    billing_account_number: str,
+    if_none_match: Optional[str],
+    invoice_cache: InvoiceCache,
+) -> Response:
+    """
+    This function handles an invoice download request. It returns the PDF invoice of the billing
+    account number, rendering and caching it first if needed, or a 304 response if the client
+    already has the current version. It returns a 404 response if the billing account number has
+    no recorded transaction.
+
+    Args:
+        billing_account_number (str): The billing account number.
+        if_none_match (Optional[str]): The If-None-Match header of the request, if any.
+        invoice_cache (InvoiceCache): The cache of rendered PDF invoices.
+    """
+    invoice_path: Optional[str] = await invoice_cache.get_invoice(
+        billing_account_number
+    )
+    if invoice_path is None:
+        return JSONResponse(
+            status_code=404,
+            content={"detail": f"No transaction for BAN {billing_account_number}"},
+        )
+
+    etag: str = invoice_etag(invoice_path)
+    headers: dict[str, str] = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        invoice_path,
+        media_type="application/pdf",
+        filename=os.path.basename(invoice_path),
+        headers=headers,
+    )
+
+
+async def handle_invoice_archive_request(
+    upload_id: Optional[str],
+    billing_account_numbers: Optional[list[str]],
+    invoice_archive: InvoiceArchive,
+) -> Response:
+    """
+    This function handles an invoice archive request. It streams a ZIP archive of the PDF invoices
+    of an upload, of a list of billing account numbers, or of both. It returns a 400 response if
+    neither is given and a 404 response if they select no billing account number.
+
+    Args:
+        upload_id (Optional[str]): The id of the upload whose invoices are archived.
+        billing_account_numbers (Optional[list[str]]): The billing account numbers whose
+            invoices are archived.
+        invoice_archive (InvoiceArchive): The streamer of invoice archives.
+    """
+    if upload_id is None and not billing_account_numbers:
+        return JSONResponse(
+            status_code=400,
+            content={"detail": "Provide an upload_id or billing_account_number"},
+        )
+
+    selected_billing_account_numbers: list[str] = list(billing_account_numbers or [])
+    if upload_id is not None:
+        selected_billing_account_numbers += await asyncio.to_thread(
+            invoice_archive.load_upload_billing_account_numbers, upload_id
+        )
+    if not selected_billing_account_numbers:
+        return JSONResponse(
+            status_code=404,
+            content={"detail": f"No transactions for upload {upload_id}"},
+        )
+
+    archive_name: str = f"invoices_{upload_id or 'selection'}.zip"
+    return StreamingResponse(
+        invoice_archive.stream(selected_billing_account_numbers),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{archive_name}"'},
+    )
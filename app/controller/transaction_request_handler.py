@@ -0,0 +1,104 @@
+"""
+This module contains the function that handles transaction query requests. It returns a page of the
+recorded transactions matching the filters of the request, with the card numbers masked and without
+the CVVs and dates of birth.
+"""
+
+import asyncio
+import datetime
+import logging
+from typing import Optional
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.model.sell_order_batch import decode_error_codes, encode_error_messages
+from app.service.transaction_query import TransactionPage, TransactionQuery
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+# Number of trailing card number digits left unmasked in transaction query responses
+UNMASKED_CARD_DIGITS: int = 4
+
+
+async def handle_transaction_query_request(
+    transaction_query: TransactionQuery,
+    limit: int,
+    cursor: Optional[str] = None,
+    billing_account_number: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+) -> JSONResponse:
+    """
+    This function handles a transaction query request. It returns a JSON response with a page of
+    the matching transactions, oldest first, and the cursor of the next page, which is null on the
+    last page. It returns a 400 response if the cursor is invalid.
+
+    Args:
+        transaction_query (TransactionQuery): The service that reads the transactions.
+        limit (int): The maximum number of transactions in the page.
+        cursor (str, optional): The next_cursor of the previous page.
+        billing_account_number (str, optional): Only return the transactions of this billing
+            account number.
+        status (str, optional): Only return the transactions with this status.
+        created_from (datetime.datetime, optional): Only return the transactions created at or
+            after this time.
+        created_to (datetime.datetime, optional): Only return the transactions created before
+            this time.
+    """
+    try:
+        page: TransactionPage = await asyncio.to_thread(
+            transaction_query.find_transactions,
+            limit,
+            cursor,
+            billing_account_number,
+            status,
+            created_from,
+            created_to,
+        )
+    except ValueError as error:
+        logger.warning(str(error))
+        return JSONResponse(status_code=400, content={"detail": str(error)})
+
+    return JSONResponse(
+        content={
+            "transactions": [
+                _transaction_summary(transaction) for transaction in page.transactions
+            ],
+            "next_cursor": page.next_cursor,
+        }
+    )
+
+
+def mask_card_number(credit_card_number: str) -> str:
+    """
+    This function replaces every digit of a card number but the last UNMASKED_CARD_DIGITS with an
+    asterisk.
+
+    Args:
+        credit_card_number (str): The card number.
+    """
+    masked_length: int = max(len(credit_card_number) - UNMASKED_CARD_DIGITS, 0)
+    return "*" * masked_length + credit_card_number[masked_length:]
+
+
+def _transaction_summary(transaction: MobileDataPurchaseTransaction) -> dict:
+    validation_errors: list[str] = (
+        transaction.validation_errors.split(", ")
+        if transaction.validation_errors
+        else []
+    )
+    return jsonable_encoder(
+        {
+            "id": transaction.id,
+            "name": transaction.name,
+            "credit_card_number": mask_card_number(transaction.credit_card_number),
+            "billing_account_number": transaction.billing_account_number,
+            "requested_mobile_data": transaction.requested_mobile_data,
+            "status": transaction.status,
+            "error_codes": decode_error_codes(encode_error_messages(validation_errors)),
+            "upload_id": transaction.upload_id,
+            "created_at": transaction.created_at,
+        }
+    )
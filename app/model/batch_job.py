@@ -0,0 +1,72 @@
+"""
+This module contains the BatchJob class, a purchase request whose upload is stored on disk and
+processed in the background, and the BatchJobParseError class, a row of such an upload that could
+not be parsed. The checkpoint of a job is committed in the same database transaction as the
+transactions of each of its chunks, so a job interrupted by a restart resumes after its last
+recorded chunk without recording any row twice.
+"""
+
+from sqlmodel import SQLModel, Field
+from typing import Optional
+import datetime
+import uuid
+
+BATCH_JOB_PENDING: str = "pending"
+BATCH_JOB_RUNNING: str = "running"
+BATCH_JOB_DONE: str = "done"
+BATCH_JOB_FAILED: str = "failed"
+
+
+class BatchJob(SQLModel, table=True):
+    """
+    This class represents a purchase request processed in the background.
+
+    Attributes:
+        id (str): The id of the job, also the upload id of its transactions.
+        status (str): "pending", "running", "done" or "failed".
+        upload_path (str): The path of the stored upload.
+        next_row_index (int): The checkpoint of the job: the index of the first row not yet
+            recorded.
+        rows_recorded (int): The number of transactions recorded.
+        rows_unparseable (int): The number of rows that could not be parsed.
+        rows_invoiced (Optional[int]): The number of recorded transactions whose invoices were
+            dispatched, so a resumed job dispatches those of the chunks recorded before it was
+            interrupted. It is not tracked when the invoice jobs are committed with the
+            transactions.
+        attempts (int): The number of times a worker has claimed the job.
+        error (Optional[str]): The error of the last failed attempt.
+        created_at (datetime.datetime): When the job was created.
+        updated_at (datetime.datetime): When the job last changed.
+    """
+
+    id: Optional[str] = Field(
+        default_factory=lambda: str(uuid.uuid4()), primary_key=True
+    )
+    status: str = Field(default=BATCH_JOB_PENDING, index=True)
+    upload_path: str
+    next_row_index: int = Field(default=0)
+    rows_recorded: int = Field(default=0)
+    rows_unparseable: int = Field(default=0)
+    # Nullable so that existing databases get the column; their jobs count as fully invoiced
+    rows_invoiced: Optional[int] = Field(default=0)
+    attempts: int = Field(default=0)
+    error: Optional[str] = Field(default=None)
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    updated_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+
+
+class BatchJobParseError(SQLModel, table=True):
+    """
+    This class represents a row of a batch job upload that could not be parsed.
+
+    Attributes:
+        id (Optional[int]): The id of the parse error.
+        job_id (str): The id of the BatchJob of the row.
+        row_index (int): The index of the row within the upload.
+        errors (str): The parse errors of the row, as a JSON list.
+    """
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    job_id: str = Field(index=True)
+    row_index: int
+    errors: str
@@ -0,0 +1,39 @@
+"""
+This module contains the IdempotencyRecord class, the stored outcome of a purchase request
+identified by its Idempotency-Key header or by a hash of its body. A retry of a completed request
+is answered with the stored response instead of being processed again.
+"""
+
+from sqlmodel import SQLModel, Field
+from typing import Optional
+import datetime
+
+IDEMPOTENCY_IN_PROGRESS: str = "in_progress"
+IDEMPOTENCY_COMPLETED: str = "completed"
+
+
+class IdempotencyRecord(SQLModel, table=True):
+    """
+    This class represents a purchase request that has been started or completed.
+
+    Attributes:
+        key (str): The idempotency key of the request.
+        status (str): "in_progress" or "completed".
+        request_hash (Optional[str]): The hash of the path, Accept header and body of the request,
+            which a retry with the same key must match.
+        status_code (Optional[int]): The status code of the response, once completed.
+        response_headers (Optional[str]): The headers of the response, as a JSON list of
+            [name, value] pairs, once completed.
+        response_body (Optional[bytes]): The body of the response, once completed.
+        created_at (datetime.datetime): When the request was started.
+        updated_at (datetime.datetime): When the request was started or completed.
+    """
+
+    key: str = Field(primary_key=True)
+    status: str = Field(default=IDEMPOTENCY_IN_PROGRESS)
+    request_hash: Optional[str] = Field(default=None)
+    status_code: Optional[int] = Field(default=None)
+    response_headers: Optional[str] = Field(default=None)
+    response_body: Optional[bytes] = Field(default=None)
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    updated_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
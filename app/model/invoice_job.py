@@ -0,0 +1,44 @@
+"""
+This module contains the InvoiceJob class, a durable queue entry for the PDF invoice of one recorded
+transaction. Jobs are inserted in the same database transaction as the purchase transactions they
+belong to and are drained by the workers of the InvoiceJobQueue.
+"""
+
+from sqlmodel import SQLModel, Field
+from typing import Optional
+import datetime
+import uuid
+
+INVOICE_JOB_PENDING: str = "pending"
+INVOICE_JOB_RENDERING: str = "rendering"
+INVOICE_JOB_DONE: str = "done"
+INVOICE_JOB_FAILED: str = "failed"
+
+
+class InvoiceJob(SQLModel, table=True):
+    """
+    This class represents the PDF invoice job of one mobile data purchase transaction.
+
+    Attributes:
+        id (str): The id of the job.
+        transaction_id (str): The id of the MobileDataPurchaseTransaction the invoice is for.
+        billing_account_number (str): The billing account number of the transaction.
+        status (str): "pending", "rendering", "done" or "failed".
+        attempts (int): The number of times a worker has claimed the job.
+        output_path (Optional[str]): The path of the generated PDF invoice, once done.
+        error (Optional[str]): The error of the last failed attempt.
+        created_at (datetime.datetime): When the job was enqueued.
+        updated_at (datetime.datetime): When the status of the job last changed.
+    """
+
+    id: Optional[str] = Field(
+        default_factory=lambda: str(uuid.uuid4()), primary_key=True
+    )
+    transaction_id: str = Field(index=True)
+    billing_account_number: str = Field(index=True)
+    status: str = Field(default=INVOICE_JOB_PENDING, index=True)
+    attempts: int = Field(default=0)
+    output_path: Optional[str] = Field(default=None)
+    error: Optional[str] = Field(default=None)
+    created_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
+    updated_at: datetime.datetime = Field(default_factory=datetime.datetime.now)
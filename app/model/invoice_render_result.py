@@ -0,0 +1,18 @@
+"""
+This module contains the InvoiceRenderResult class, which reports whether the PDF invoice of one
+sell order was generated.
+"""
+
+from typing import Optional
+from pydantic import BaseModel
+
+
+class InvoiceRenderResult(BaseModel):
+    """
+    This class represents the outcome of rendering the PDF invoice of one sell order.
+    """
+
+    billing_account_number: str
+    success: bool
+    output_path: Optional[str] = None
+    error: Optional[str] = None
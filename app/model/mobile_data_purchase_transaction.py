@@ -1,10 +1,26 @@
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from typing import Optional
 import datetime
 import uuid
 
 
 class MobileDataPurchaseTransaction(SQLModel, table=True):
+    # Every secondary index ends with created_at, the keyset of the transaction queries, so that
+    # each filter is read in page order without a sort; SQLite appends the rowid tie-breaker
+    __table_args__ = (
+        Index(
+            "ix_mobiledatapurchasetransaction_billing_account_number_created_at",
+            "billing_account_number",
+            "created_at",
+        ),
+        Index(
+            "ix_mobiledatapurchasetransaction_status_created_at",
+            "status",
+            "created_at",
+        ),
+    )
+
     id: Optional[str] = Field(
         default_factory=lambda: str(uuid.uuid4()), primary_key=True
     )
@@ -17,3 +33,8 @@ class MobileDataPurchaseTransaction(SQLModel, table=True):
     requested_mobile_data: str = Field()
     status: str = Field()
     validation_errors: str = Field()
+    upload_id: Optional[str] = Field(default=None, index=True)
+    # Nullable so that existing databases get the column; older transactions have no timestamp
+    created_at: Optional[datetime.datetime] = Field(
+        default_factory=datetime.datetime.now, index=True
+    )
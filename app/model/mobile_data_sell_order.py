@@ -5,9 +5,176 @@ validating, constructing, and updating the request.
 """
 
 import datetime
-from typing import Union
+import functools
+from typing import Optional, Sequence, Union
 from pydantic import BaseModel, field_validator
 
+SELL_ORDER_FIELD_COUNT: int = 7
+DATE_OF_BIRTH_FORMAT: str = "%m/%d/%Y"
+CREDIT_CARD_EXPIRATION_FORMAT: str = "%m/%y"
+UNDECODABLE_ROW_ERROR: str = "row is not valid UTF-8"
+
+
+class SellOrderParseError(BaseModel):
+    """
+    This class represents a CSV row that could not be turned into a MobileDataSellOrder.
+    """
+
+    row_index: int
+    row: list[str]
+    errors: list[str]
+
+
+class InvalidSellOrderRowsError(ValueError):
+    """
+    This exception is raised when one or more CSV rows could not be parsed into sell orders. The
+    individual row errors are available on the parse_errors attribute.
+    """
+
+    def __init__(self, parse_errors: list[SellOrderParseError]):
+        self.parse_errors: list[SellOrderParseError] = parse_errors
+        super().__init__(
+            "; ".join(
+                f"row {parse_error.row_index}: {', '.join(parse_error.errors)}"
+                for parse_error in parse_errors
+            )
+        )
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date_cached(value: str, date_format: str) -> datetime.datetime:
+    """
+    This function parses a date string with datetime.strptime, caching the result. Batch files
+    repeat the same dates many times, so most lookups skip strptime entirely.
+
+    Args:
+        value (str): The date string to parse.
+        date_format (str): The strptime format of the date string.
+    """
+    return datetime.datetime.strptime(value, date_format)
+
+
+def parse_sell_order_date_columns(
+    rows: Sequence[Sequence[str]],
+) -> tuple[
+    list[Optional[datetime.datetime]],
+    list[Optional[datetime.datetime]],
+    dict[int, list[str]],
+]:
+    """
+    This function checks the encoding and field count of a batch of CSV rows and parses their date
+    of birth and credit card expiration columns, one column at a time, with the cached date parser.
+    It returns both parsed columns and the errors of every row that failed, keyed by position in
+    the batch.
+
+    Args:
+        rows (Sequence[Sequence[str]]): The CSV rows, as produced by csv.reader.
+    """
+    row_errors: dict[int, list[str]] = {}
+
+    for index, row in enumerate(rows):
+        if not is_decoded_row(row):
+            row_errors[index] = [UNDECODABLE_ROW_ERROR]
+        if len(row) < SELL_ORDER_FIELD_COUNT:
+            row_errors.setdefault(index, []).append(
+                f"expected {SELL_ORDER_FIELD_COUNT} fields, got {len(row)}"
+            )
+
+    dates_of_birth = _parse_date_column(
+        rows, 1, DATE_OF_BIRTH_FORMAT, "date_of_birth", row_errors
+    )
+    expiration_dates = _parse_date_column(
+        rows,
+        3,
+        CREDIT_CARD_EXPIRATION_FORMAT,
+        "credit_card_expiration_date",
+        row_errors,
+    )
+
+    return dates_of_birth, expiration_dates, row_errors
+
+
+def build_parse_errors(
+    rows: Sequence[Sequence[str]],
+    row_errors: dict[int, list[str]],
+    first_row_index: int,
+) -> list[SellOrderParseError]:
+    """
+    This function turns the row errors found by parse_sell_order_date_columns into
+    SellOrderParseError objects, numbered from first_row_index.
+
+    Args:
+        rows (Sequence[Sequence[str]]): The CSV rows the errors refer to.
+        row_errors (dict[int, list[str]]): The errors of each failed row, keyed by position.
+        first_row_index (int): The index of the first row within the whole upload.
+    """
+    return [
+        SellOrderParseError(
+            row_index=first_row_index + index,
+            row=[replace_undecodable_bytes(field) for field in rows[index]],
+            errors=errors,
+        )
+        for index, errors in sorted(row_errors.items())
+    ]
+
+
+def is_decoded_row(row: Sequence[str]) -> bool:
+    """
+    This function checks that a CSV row decoded cleanly. The parser decodes uploads with the
+    surrogateescape error handler, which turns every byte that is not valid UTF-8 into a lone
+    surrogate instead of failing the whole upload.
+
+    Args:
+        row (Sequence[str]): The CSV row, as produced by csv.reader.
+    """
+    text: str = "".join(row)
+    if text.isascii():
+        return True
+    try:
+        text.encode("utf-8")
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def replace_undecodable_bytes(field: str) -> str:
+    """
+    This function replaces the undecodable bytes of a field with U+FFFD, so the field can be
+    reported back as JSON.
+
+    Args:
+        field (str): The CSV field, decoded with the surrogateescape error handler.
+    """
+    if field.isascii():
+        return field
+    return field.encode("utf-8", "surrogateescape").decode("utf-8", "replace")
+
+
+def _parse_date_column(
+    rows: Sequence[Sequence[str]],
+    column: int,
+    date_format: str,
+    field_name: str,
+    row_errors: dict[int, list[str]],
+) -> list[Optional[datetime.datetime]]:
+    """
+    This function parses one date column of a batch of rows, recording a row error for every
+    value that does not match the date format.
+    """
+    parsed_dates: list[Optional[datetime.datetime]] = []
+
+    for index, row in enumerate(rows):
+        if len(row) <= column:
+            parsed_dates.append(None)
+            continue
+        try:
+            parsed_dates.append(parse_date_cached(row[column], date_format))
+        except ValueError as error:
+            row_errors.setdefault(index, []).append(f"{field_name}: {error}")
+            parsed_dates.append(None)
+
+    return parsed_dates
+
 
 class MobileDataSellOrder(BaseModel):
     """
@@ -35,7 +202,7 @@ class MobileDataSellOrder(BaseModel):
         This method converts the date of birth attribute to a datetime object.
         """
         if isinstance(value, str):
-            return datetime.datetime.strptime(value, "%m/%d/%Y")
+            return datetime.datetime.strptime(value, DATE_OF_BIRTH_FORMAT)
         return value
 
     @field_validator("credit_card_expiration_date", mode="before")
@@ -47,7 +214,7 @@ class MobileDataSellOrder(BaseModel):
         This method converts the credit card expiration date attribute to a datetime object.
         """
         if isinstance(value, str):
-            return datetime.datetime.strptime(value, "%m/%y")
+            return datetime.datetime.strptime(value, CREDIT_CARD_EXPIRATION_FORMAT)
         return value
 
     @classmethod
@@ -68,3 +235,42 @@ class MobileDataSellOrder(BaseModel):
             status="Approved",
             validation_errors=[],
         )
+
+    @classmethod
+    def build_mobile_data_sell_orders_from_rows(
+        cls, rows: Sequence[Sequence[str]], first_row_index: int = 0
+    ) -> tuple[list["MobileDataSellOrder"], list[SellOrderParseError]]:
+        """
+        This method constructs customer information objects from many CSV rows at once. Each date
+        column is parsed in one pass with a cached parser, and the rows that parse cleanly are
+        built without re-running pydantic validation. Rows that fail are returned as parse errors
+        instead of raising, so one bad row does not discard the rest of the batch.
+
+        Args:
+            rows (Sequence[Sequence[str]]): The CSV rows, as produced by csv.reader.
+            first_row_index (int): The index of the first row within the whole upload.
+        """
+        dates_of_birth, expiration_dates, row_errors = parse_sell_order_date_columns(
+            rows
+        )
+
+        sell_orders: list[MobileDataSellOrder] = []
+
+        for index, row in enumerate(rows):
+            if index in row_errors:
+                continue
+            sell_orders.append(
+                cls.model_construct(
+                    name=row[0],
+                    date_of_birth=dates_of_birth[index],
+                    credit_card_number=row[2],
+                    credit_card_expiration_date=expiration_dates[index],
+                    credit_card_cvv=row[4],
+                    billing_account_number=row[5],
+                    requested_mobile_data=row[6],
+                    status="Approved",
+                    validation_errors=[],
+                )
+            )
+
+        return sell_orders, build_parse_errors(rows, row_errors, first_row_index)
@@ -0,0 +1,338 @@
+"""
+This module contains the SellOrderBatch class, a columnar representation of many mobile data sell
+orders. Each attribute is stored in one contiguous NumPy array and validation errors are stored as a
+bitmask per row, which is only decoded into messages when a single order is needed.
+"""
+
+import datetime
+import enum
+from typing import Iterator, Optional, Sequence
+import numpy as np
+from app.model.mobile_data_sell_order import (
+    MobileDataSellOrder,
+    SellOrderParseError,
+    build_parse_errors,
+    parse_sell_order_date_columns,
+)
+
+DATETIME_DTYPE: str = "datetime64[us]"
+ERROR_MASK_DTYPE = np.uint8
+
+
+class SellOrderError(enum.IntFlag):
+    """
+    This class enumerates the validation errors a sell order can have. The flags are combined into
+    the per-row error bitmask of a SellOrderBatch.
+    """
+
+    NOT_OF_LEGAL_AGE = 1
+    CARD_NUMBER_LENGTH_INVALID = 2
+    CARD_NUMBER_INVALID = 4
+    CVV_LENGTH_INVALID = 8
+    CARD_EXPIRED = 16
+
+
+# Ordered as the validation steps run, so decoded messages keep their usual order
+SELL_ORDER_ERROR_MESSAGES: dict[SellOrderError, str] = {
+    SellOrderError.NOT_OF_LEGAL_AGE: "Customer is not of legal age",
+    SellOrderError.CARD_NUMBER_LENGTH_INVALID: "Credit card number length is invalid",
+    SellOrderError.CARD_NUMBER_INVALID: "Credit card number is invalid",
+    SellOrderError.CVV_LENGTH_INVALID: "CVV length is invalid",
+    SellOrderError.CARD_EXPIRED: "Credit card has expired",
+}
+
+_SELL_ORDER_ERRORS_BY_MESSAGE: dict[str, SellOrderError] = {
+    message: error for error, message in SELL_ORDER_ERROR_MESSAGES.items()
+}
+
+
+def decode_error_mask(error_mask: int) -> list[str]:
+    """
+    This function converts a validation error bitmask into the list of validation error messages.
+
+    Args:
+        error_mask (int): The bitmask of SellOrderError flags.
+    """
+    return [
+        message
+        for error, message in SELL_ORDER_ERROR_MESSAGES.items()
+        if error_mask & error
+    ]
+
+
+def decode_error_codes(error_mask: int) -> list[str]:
+    """
+    This function converts a validation error bitmask into the names of its SellOrderError flags,
+    e.g. "CARD_EXPIRED", in the order of the validation steps.
+
+    Args:
+        error_mask (int): The bitmask of SellOrderError flags.
+    """
+    return [
+        error.name  # type: ignore
+        for error in SELL_ORDER_ERROR_MESSAGES
+        if error_mask & error
+    ]
+
+
+def encode_error_messages(validation_errors: Sequence[str]) -> int:
+    """
+    This function converts a list of validation error messages into a bitmask. It raises a
+    ValueError for messages that have no SellOrderError flag.
+
+    Args:
+        validation_errors (Sequence[str]): The validation error messages.
+    """
+    error_mask: int = 0
+    for message in validation_errors:
+        if message not in _SELL_ORDER_ERRORS_BY_MESSAGE:
+            raise ValueError(f"Unknown validation error: {message}")
+        error_mask |= _SELL_ORDER_ERRORS_BY_MESSAGE[message]
+    return error_mask
+
+
+class SellOrderBatch:
+    """
+    This class stores a batch of mobile data sell orders column by column. String columns are
+    fixed-width NumPy unicode arrays, date columns are datetime64 arrays, and the validation result
+    of every row is a SellOrderError bitmask. A row is approved when its bitmask is zero.
+
+    Attributes:
+        name (np.ndarray): The customer names.
+        date_of_birth (np.ndarray): The customer dates of birth.
+        credit_card_number (np.ndarray): The credit card numbers.
+        credit_card_expiration_date (np.ndarray): The credit card expiration dates.
+        credit_card_cvv (np.ndarray): The credit card CVVs.
+        billing_account_number (np.ndarray): The billing account numbers.
+        requested_mobile_data (np.ndarray): The requested mobile data amounts.
+        error_mask (np.ndarray): The validation error bitmask of every row.
+    """
+
+    __slots__ = (
+        "name",
+        "date_of_birth",
+        "credit_card_number",
+        "credit_card_expiration_date",
+        "credit_card_cvv",
+        "billing_account_number",
+        "requested_mobile_data",
+        "error_mask",
+    )
+
+    def __init__(
+        self,
+        name: np.ndarray,
+        date_of_birth: np.ndarray,
+        credit_card_number: np.ndarray,
+        credit_card_expiration_date: np.ndarray,
+        credit_card_cvv: np.ndarray,
+        billing_account_number: np.ndarray,
+        requested_mobile_data: np.ndarray,
+        error_mask: Optional[np.ndarray] = None,
+    ) -> None:
+        self.name: np.ndarray = name
+        self.date_of_birth: np.ndarray = date_of_birth
+        self.credit_card_number: np.ndarray = credit_card_number
+        self.credit_card_expiration_date: np.ndarray = credit_card_expiration_date
+        self.credit_card_cvv: np.ndarray = credit_card_cvv
+        self.billing_account_number: np.ndarray = billing_account_number
+        self.requested_mobile_data: np.ndarray = requested_mobile_data
+        self.error_mask: np.ndarray = (
+            np.zeros(len(name), dtype=ERROR_MASK_DTYPE)
+            if error_mask is None
+            else error_mask
+        )
+
+    @classmethod
+    def from_columns(
+        cls,
+        name: Sequence[str],
+        date_of_birth: Sequence[datetime.datetime],
+        credit_card_number: Sequence[str],
+        credit_card_expiration_date: Sequence[datetime.datetime],
+        credit_card_cvv: Sequence[str],
+        billing_account_number: Sequence[str],
+        requested_mobile_data: Sequence[str],
+        error_mask: Optional[Sequence[int]] = None,
+    ) -> "SellOrderBatch":
+        """
+        This method constructs a batch from plain Python columns, converting each of them into a
+        contiguous NumPy array.
+        """
+        return cls(
+            name=np.array(name, dtype=str),
+            date_of_birth=np.array(date_of_birth, dtype=DATETIME_DTYPE),
+            credit_card_number=np.array(credit_card_number, dtype=str),
+            credit_card_expiration_date=np.array(
+                credit_card_expiration_date, dtype=DATETIME_DTYPE
+            ),
+            credit_card_cvv=np.array(credit_card_cvv, dtype=str),
+            billing_account_number=np.array(billing_account_number, dtype=str),
+            requested_mobile_data=np.array(requested_mobile_data, dtype=str),
+            error_mask=(
+                None
+                if error_mask is None
+                else np.array(error_mask, dtype=ERROR_MASK_DTYPE)
+            ),
+        )
+
+    @classmethod
+    def from_rows(
+        cls, rows: Sequence[Sequence[str]], first_row_index: int = 0
+    ) -> tuple["SellOrderBatch", list[SellOrderParseError]]:
+        """
+        This method constructs a batch directly from CSV rows, without building a
+        MobileDataSellOrder per row. Rows that cannot be parsed are left out of the batch and
+        returned as parse errors.
+
+        Args:
+            rows (Sequence[Sequence[str]]): The CSV rows, as produced by csv.reader.
+            first_row_index (int): The index of the first row within the whole upload.
+        """
+        dates_of_birth, expiration_dates, row_errors = parse_sell_order_date_columns(
+            rows
+        )
+        valid_indexes: list[int] = [
+            index for index in range(len(rows)) if index not in row_errors
+        ]
+
+        batch = cls.from_columns(
+            name=[rows[index][0] for index in valid_indexes],
+            date_of_birth=[dates_of_birth[index] for index in valid_indexes],  # type: ignore
+            credit_card_number=[rows[index][2] for index in valid_indexes],
+            credit_card_expiration_date=[
+                expiration_dates[index] for index in valid_indexes  # type: ignore
+            ],
+            credit_card_cvv=[rows[index][4] for index in valid_indexes],
+            billing_account_number=[rows[index][5] for index in valid_indexes],
+            requested_mobile_data=[rows[index][6] for index in valid_indexes],
+        )
+
+        return batch, build_parse_errors(rows, row_errors, first_row_index)
+
+    @classmethod
+    def from_sell_orders(
+        cls, sell_orders: Sequence[MobileDataSellOrder], encode_errors: bool = True
+    ) -> "SellOrderBatch":
+        """
+        This method constructs a batch from MobileDataSellOrder objects. Their validation errors
+        are encoded into the error bitmask unless encode_errors is False, in which case every row
+        starts with an empty bitmask.
+
+        Args:
+            sell_orders (Sequence[MobileDataSellOrder]): The sell orders to store.
+            encode_errors (bool): Whether to encode the existing validation errors.
+        """
+        return cls.from_columns(
+            name=[sell_order.name for sell_order in sell_orders],
+            date_of_birth=[sell_order.date_of_birth for sell_order in sell_orders],
+            credit_card_number=[
+                sell_order.credit_card_number for sell_order in sell_orders
+            ],
+            credit_card_expiration_date=[
+                sell_order.credit_card_expiration_date for sell_order in sell_orders
+            ],
+            credit_card_cvv=[sell_order.credit_card_cvv for sell_order in sell_orders],
+            billing_account_number=[
+                sell_order.billing_account_number for sell_order in sell_orders
+            ],
+            requested_mobile_data=[
+                sell_order.requested_mobile_data for sell_order in sell_orders
+            ],
+            error_mask=(
+                [
+                    encode_error_messages(sell_order.validation_errors)
+                    for sell_order in sell_orders
+                ]
+                if encode_errors
+                else None
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.name)
+
+    def __getitem__(self, rows: slice) -> "SellOrderBatch":
+        """
+        This method returns a batch of a slice of the rows. The columns of the returned batch are
+        views onto the columns of this batch.
+        """
+        return SellOrderBatch(
+            name=self.name[rows],
+            date_of_birth=self.date_of_birth[rows],
+            credit_card_number=self.credit_card_number[rows],
+            credit_card_expiration_date=self.credit_card_expiration_date[rows],
+            credit_card_cvv=self.credit_card_cvv[rows],
+            billing_account_number=self.billing_account_number[rows],
+            requested_mobile_data=self.requested_mobile_data[rows],
+            error_mask=self.error_mask[rows],
+        )
+
+    def with_error_mask(self, error_mask: np.ndarray) -> "SellOrderBatch":
+        """
+        This method returns a batch that shares the columns of this batch but has the given
+        validation error bitmask.
+
+        Args:
+            error_mask (np.ndarray): The validation error bitmask of every row.
+        """
+        if len(error_mask) != len(self):
+            raise ValueError("error_mask must have one entry per row")
+        return SellOrderBatch(
+            name=self.name,
+            date_of_birth=self.date_of_birth,
+            credit_card_number=self.credit_card_number,
+            credit_card_expiration_date=self.credit_card_expiration_date,
+            credit_card_cvv=self.credit_card_cvv,
+            billing_account_number=self.billing_account_number,
+            requested_mobile_data=self.requested_mobile_data,
+            error_mask=np.asarray(error_mask, dtype=ERROR_MASK_DTYPE),
+        )
+
+    def statuses(self) -> np.ndarray:
+        """
+        This method returns the status of every row, "Approved" or "Rejected".
+        """
+        return np.where(self.error_mask == 0, "Approved", "Rejected")
+
+    def status_at(self, index: int) -> str:
+        """
+        This method returns the status of a single row.
+        """
+        return "Approved" if self.error_mask[index] == 0 else "Rejected"
+
+    def validation_errors_at(self, index: int) -> list[str]:
+        """
+        This method returns the decoded validation error messages of a single row.
+        """
+        return decode_error_mask(int(self.error_mask[index]))
+
+    def sell_order_at(self, index: int) -> MobileDataSellOrder:
+        """
+        This method builds the MobileDataSellOrder of a single row. It is meant for the edges of
+        the pipeline, such as invoice rendering, that need a whole order at a time.
+        """
+        return MobileDataSellOrder.model_construct(
+            name=str(self.name[index]),
+            date_of_birth=self.date_of_birth[index].item(),
+            credit_card_number=str(self.credit_card_number[index]),
+            credit_card_expiration_date=self.credit_card_expiration_date[index].item(),
+            credit_card_cvv=str(self.credit_card_cvv[index]),
+            billing_account_number=str(self.billing_account_number[index]),
+            requested_mobile_data=str(self.requested_mobile_data[index]),
+            status=self.status_at(index),
+            validation_errors=self.validation_errors_at(index),
+        )
+
+    def iter_sell_orders(self) -> Iterator[MobileDataSellOrder]:
+        """
+        This method yields the MobileDataSellOrder of every row, one at a time.
+        """
+        for index in range(len(self)):
+            yield self.sell_order_at(index)
+
+    def to_sell_orders(self) -> list[MobileDataSellOrder]:
+        """
+        This method builds the MobileDataSellOrder of every row.
+        """
+        return list(self.iter_sell_orders())
@@ -0,0 +1,151 @@
+"""
+This module contains the AdmissionController class, which caps the number of purchase requests and
+the number of upload bytes being processed at the same time. Requests over the caps wait in a
+bounded queue for a slot to free up, and are rejected with a status code and a Retry-After delay
+once the queue is full or their wait times out, instead of being processed until the worker runs
+out of memory.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+class AdmissionRejected(Exception):
+    """
+    This exception is raised when a request is not admitted. It carries the HTTP status code of
+    the rejection and, for rejections worth retrying, the number of seconds to wait first.
+    """
+
+    def __init__(
+        self, status_code: int, detail: str, retry_after: Optional[int] = None
+    ):
+        self.status_code: int = status_code
+        self.detail: str = detail
+        self.retry_after: Optional[int] = retry_after
+        super().__init__(detail)
+
+
+class AdmissionController:
+    """
+    This class admits requests while the number of requests in flight and the sum of their sizes
+    stay under their caps. Requests that do not fit wait, oldest first, in a queue of at most
+    max_waiting requests.
+
+    Attributes:
+        max_in_flight_requests (int): The maximum number of requests processed at the same time.
+        max_in_flight_bytes (int): The maximum sum of the sizes of the requests in flight.
+        max_waiting (int): The maximum number of requests waiting for admission. Requests are
+            rejected at once when it is 0.
+        wait_timeout (float): The number of seconds a request waits before it is rejected.
+        retry_after (int): The number of seconds clients are told to wait before retrying.
+    """
+
+    def __init__(
+        self,
+        max_in_flight_requests: int,
+        max_in_flight_bytes: int,
+        max_waiting: int = 0,
+        wait_timeout: float = 5.0,
+        retry_after: int = 5,
+    ) -> None:
+        if max_in_flight_requests < 1:
+            raise ValueError("max_in_flight_requests must be at least 1")
+        if max_in_flight_bytes < 1:
+            raise ValueError("max_in_flight_bytes must be at least 1")
+        if max_waiting < 0:
+            raise ValueError("max_waiting must not be negative")
+
+        self.max_in_flight_requests: int = max_in_flight_requests
+        self.max_in_flight_bytes: int = max_in_flight_bytes
+        self.max_waiting: int = max_waiting
+        self.wait_timeout: float = wait_timeout
+        self.retry_after: int = retry_after
+
+        self.in_flight_requests: int = 0
+        self.in_flight_bytes: int = 0
+        self._waiters: list[tuple[int, asyncio.Future]] = []
+
+    async def acquire(self, request_bytes: int) -> None:
+        """
+        This method admits a request of request_bytes bytes, waiting for a slot if needed. It
+        raises an AdmissionRejected with status 413 if the request can never fit, 429 if the wait
+        queue is full and 503 if the wait timed out. Every admitted request must be released.
+
+        Args:
+            request_bytes (int): The size of the request.
+        """
+        if request_bytes > self.max_in_flight_bytes:
+            raise AdmissionRejected(
+                413,
+                f"The request is larger than the {self.max_in_flight_bytes} byte limit",
+            )
+
+        # Waiting requests go first, so a stream of small requests cannot starve a large one
+        if not self._waiters and self._fits(request_bytes):
+            self._admit(request_bytes)
+            return
+
+        if len(self._waiters) >= self.max_waiting:
+            logger.warning(
+                f"Rejecting a request: {self.in_flight_requests} requests in flight and "
+                f"{len(self._waiters)} waiting"
+            )
+            raise AdmissionRejected(
+                429, "Too many purchase requests in flight", self.retry_after
+            )
+
+        waiter: tuple[int, asyncio.Future] = (
+            request_bytes,
+            asyncio.get_running_loop().create_future(),
+        )
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), self.wait_timeout)
+        except asyncio.TimeoutError:
+            if waiter[1].done():
+                # Admitted just as the wait timed out
+                return
+            logger.warning("Rejecting a request that timed out waiting for admission")
+            raise AdmissionRejected(
+                503, "Timed out waiting for admission", self.retry_after
+            )
+        except asyncio.CancelledError:
+            if waiter[1].done():
+                self.release(request_bytes)
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._admit_waiters()
+
+    def release(self, request_bytes: int) -> None:
+        """
+        This method frees the slot of an admitted request and admits the waiting requests that
+        now fit.
+
+        Args:
+            request_bytes (int): The size the request was admitted with.
+        """
+        self.in_flight_requests -= 1
+        self.in_flight_bytes -= request_bytes
+        self._admit_waiters()
+
+    def _fits(self, request_bytes: int) -> bool:
+        return (
+            self.in_flight_requests < self.max_in_flight_requests
+            and self.in_flight_bytes + request_bytes <= self.max_in_flight_bytes
+        )
+
+    def _admit(self, request_bytes: int) -> None:
+        self.in_flight_requests += 1
+        self.in_flight_bytes += request_bytes
+
+    def _admit_waiters(self) -> None:
+        while self._waiters and self._fits(self._waiters[0][0]):
+            request_bytes, future = self._waiters.pop(0)
+            self._admit(request_bytes)
+            future.set_result(None)
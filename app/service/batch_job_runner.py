@@ -0,0 +1,638 @@
+"""
+This module contains the BatchJobRunner class, which processes purchase requests submitted as batch
+jobs. The upload of a job is stored on disk before the job is created, so the request returns at
+once, and background workers started in the FastAPI lifespan parse, validate, record and invoice it
+chunk by chunk. Each chunk is committed together with the checkpoint of its job, so a job that was
+interrupted by a restart resumes after its last recorded chunk. A running job is leased to its
+worker, which keeps the lease alive, so several worker processes can share the table.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import logging
+import os
+import uuid
+from typing import TYPE_CHECKING, AsyncIterable, AsyncIterator, Optional
+from sqlalchemy import and_, literal_column, or_, select, update
+from sqlalchemy.orm import Session
+from app.model.batch_job import (
+    BATCH_JOB_DONE,
+    BATCH_JOB_FAILED,
+    BATCH_JOB_PENDING,
+    BATCH_JOB_RUNNING,
+    BatchJob,
+    BatchJobParseError,
+)
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.model.mobile_data_sell_order import SellOrderParseError
+from app.model.sell_order_batch import SellOrderBatch
+from app.service.db_service import (
+    BatchJobLeaseLostError,
+    DataBaseService,
+    transaction_to_sell_order,
+)
+from app.service.invoice_cache import InvoiceCache
+from app.service.invoice_dispatch import dispatch_invoices
+from app.service.invoice_job_queue import InvoiceJobQueue
+from app.service.parallel_invoice_renderer import ParallelInvoiceRenderer
+from app.service.parser import stream_row_chunks
+from app.service.stage_executor import (
+    INVOICE_STAGE,
+    PARSE_STAGE,
+    RECORD_STAGE,
+    VALIDATE_STAGE,
+    StageExecutor,
+    run_stage,
+)
+from app.service.staged_pipeline import PipelineStage, StagedPipeline
+from app.validation.validation_interface import validate_sell_order_batch
+from app.validation.validator import CreditRequestValidator
+
+if TYPE_CHECKING:
+    from app.service.invoice_generator import InvoiceGenerator
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+# Number of bytes of a stored upload read at a time
+UPLOAD_READ_SIZE: int = 64 * 1024
+
+
+class BatchJobRunner:
+    """
+    This class stores batch job uploads and drains the BatchJob table with a pool of asyncio
+    worker tasks. Each worker claims the oldest pending job with a single UPDATE ... RETURNING
+    statement and runs its remaining rows through a staged pipeline with one worker per stage. The
+    pipeline hands chunks on in upload order, so they are recorded, and checkpointed, in order.
+
+    A running job is leased to its worker, which touches it every heartbeat_interval. A job whose
+    lease has not been touched for lease_timeout belongs to a worker that stopped, and is claimed
+    again from its checkpoint, so the live jobs of other worker processes are never taken over.
+    The attempt count of a job fences off a worker whose lease was taken over: its chunks,
+    checkpoints and outcome are not recorded.
+
+    Attributes:
+        db_service (DataBaseService): The database service whose synchronous engine holds the jobs.
+        validator (CreditRequestValidator): The validator for validating the credit requests.
+        invoice_generator (InvoiceGenerator): The invoice generator for generating PDF invoices.
+        upload_path (str): The directory the uploads are stored in.
+        executor (Optional[StageExecutor]): The executor the stages are dispatched to.
+        invoice_renderer (Optional[ParallelInvoiceRenderer]): The process pool that renders the
+            PDF invoices, if any.
+        invoice_job_queue (Optional[InvoiceJobQueue]): The queue the invoices are enqueued on, if
+            any.
+        invoice_cache (Optional[InvoiceCache]): The cache of invoices rendered on demand, if any.
+        chunk_size (int): The maximum number of orders recorded together.
+        worker_count (int): The number of worker tasks.
+        poll_interval (float): The number of seconds an idle worker waits before polling again,
+            unless it is notified of a new job first.
+        max_attempts (int): The number of failed attempts after which a job is marked as failed.
+        lease_timeout (float): The number of seconds after which a running job whose lease was
+            not touched is claimed again.
+        heartbeat_interval (float): The number of seconds between two touches of the lease of a
+            running job. It must be shorter than lease_timeout.
+    """
+
+    def __init__(
+        self,
+        db_service: DataBaseService,
+        validator: CreditRequestValidator,
+        invoice_generator: "InvoiceGenerator",
+        upload_path: str,
+        executor: Optional[StageExecutor] = None,
+        invoice_renderer: Optional[ParallelInvoiceRenderer] = None,
+        invoice_job_queue: Optional[InvoiceJobQueue] = None,
+        invoice_cache: Optional[InvoiceCache] = None,
+        chunk_size: int = 1000,
+        worker_count: int = 1,
+        poll_interval: float = 1.0,
+        max_attempts: int = 3,
+        lease_timeout: float = 5 * 60,
+        heartbeat_interval: float = 30.0,
+    ) -> None:
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        if worker_count < 1:
+            raise ValueError("worker_count must be at least 1")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        if heartbeat_interval >= lease_timeout:
+            raise ValueError("heartbeat_interval must be shorter than lease_timeout")
+
+        self.db_service: DataBaseService = db_service
+        self.validator: CreditRequestValidator = validator
+        self.invoice_generator: "InvoiceGenerator" = invoice_generator
+        self.upload_path: str = upload_path
+        self.executor: Optional[StageExecutor] = executor
+        self.invoice_renderer: Optional[ParallelInvoiceRenderer] = invoice_renderer
+        self.invoice_job_queue: Optional[InvoiceJobQueue] = invoice_job_queue
+        self.invoice_cache: Optional[InvoiceCache] = invoice_cache
+        self.chunk_size: int = chunk_size
+        self.worker_count: int = worker_count
+        self.poll_interval: float = poll_interval
+        self.max_attempts: int = max_attempts
+        self.lease_timeout: float = lease_timeout
+        self.heartbeat_interval: float = heartbeat_interval
+        self._workers: list[asyncio.Task] = []
+        # The attempt of every job run by this process, keyed by job id
+        self._leased_jobs: dict[str, int] = {}
+        self._new_jobs: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        """
+        This method starts the worker tasks. Jobs that were running when another process stopped
+        are claimed again once their lease expires. It is called when the FastAPI application is
+        started.
+        """
+        logger.info(f"Starting {self.worker_count} batch job workers")
+        self._new_jobs = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._run_worker(), name=f"batch-job-worker-{index}")
+            for index in range(self.worker_count)
+        ]
+
+    async def shutdown(self) -> None:
+        """
+        This method cancels the worker tasks and puts the jobs they were running back to
+        pending, to resume from their checkpoint without waiting for their leases to expire. It is
+        called when the FastAPI application is stopped.
+        """
+        logger.info("Shutting down the batch job workers")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for job_id, attempts in list(self._leased_jobs.items()):
+            if await asyncio.to_thread(
+                self._update_leased_job,
+                job_id,
+                attempts,
+                status=BATCH_JOB_PENDING,
+            ):
+                logger.info(f"Released interrupted batch job {job_id}")
+        self._leased_jobs.clear()
+
+    def notify(self) -> None:
+        """
+        This method wakes the idle workers up after a new job has been created.
+        """
+        if self._new_jobs is not None:
+            self._new_jobs.set()
+
+    async def create_job(self, byte_stream: AsyncIterable[bytes]) -> BatchJob:
+        """
+        This method stores an upload on disk, flushed to stable storage, then creates its pending
+        job and wakes the workers up. The upload is removed if it could not be stored in full.
+
+        Args:
+            byte_stream (AsyncIterable[bytes]): The raw CSV content, e.g. from Request.stream().
+        """
+        job_id: str = str(uuid.uuid4())
+        upload_path: str = os.path.join(self.upload_path, f"{job_id}.csv")
+        await asyncio.to_thread(os.makedirs, self.upload_path, exist_ok=True)
+
+        try:
+            with open(upload_path, "wb") as upload_file:
+                async for data in byte_stream:
+                    await asyncio.to_thread(upload_file.write, data)
+                await asyncio.to_thread(upload_file.flush)
+                await asyncio.to_thread(os.fsync, upload_file.fileno())
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(upload_path)
+            raise
+
+        job: BatchJob = BatchJob(id=job_id, upload_path=upload_path)
+        await asyncio.to_thread(self._insert_job, job)
+        logger.info(f"Created batch job {job_id}")
+        self.notify()
+        return job
+
+    async def process_next_job(self) -> bool:
+        """
+        This method claims the oldest pending job and runs it to completion, or records why it
+        failed. It returns whether a job was claimed.
+        """
+        job: Optional[BatchJob] = await asyncio.to_thread(self.claim_job)
+        if job is None:
+            return False
+
+        logger.info(
+            f"Running batch job {job.id} from row {job.next_row_index}, "
+            f"attempt {job.attempts}"
+        )
+        self._leased_jobs[job.id] = job.attempts  # type: ignore
+        heartbeat: asyncio.Task = asyncio.create_task(self._keep_leased(job))
+        try:
+            await self.run_job(job)
+        except BatchJobLeaseLostError:
+            logger.warning(f"Batch job {job.id} was taken over by another worker")
+        except Exception as error:
+            logger.exception(f"Batch job {job.id} failed")
+            await asyncio.to_thread(
+                self.fail_job, job, f"{type(error).__name__}: {error}"
+            )
+        else:
+            await asyncio.to_thread(self.complete_job, job)
+        finally:
+            heartbeat.cancel()
+            # Unlike awaiting the heartbeat, waiting for it never swallows a cancellation of this
+            # task
+            await asyncio.wait([heartbeat])
+        # A cancelled job keeps its lease, which shutdown releases
+        self._leased_jobs.pop(job.id, None)  # type: ignore
+        return True
+
+    async def run_job(self, job: BatchJob) -> None:
+        """
+        This method parses, validates, records and invoices the rows of a job from its
+        checkpoint onwards. The stages overlap, with one worker each, and chunks reach the record
+        stage, and have their checkpoints committed, in upload order. The invoices of chunks that
+        an earlier attempt recorded but did not invoice are dispatched first.
+
+        Args:
+            job (BatchJob): The claimed job.
+        """
+
+        async def parse(
+            row_chunk: tuple[int, list[list[str]]],
+        ) -> tuple[SellOrderBatch, list[SellOrderParseError], int]:
+            first_row_index, rows = row_chunk
+            batch, parse_errors = await run_stage(
+                self.executor,
+                PARSE_STAGE,
+                SellOrderBatch.from_rows,
+                rows,
+                first_row_index,
+            )
+            return batch, parse_errors, first_row_index + len(rows)
+
+        async def validate(
+            chunk: tuple[SellOrderBatch, list[SellOrderParseError], int],
+        ) -> tuple[SellOrderBatch, list[SellOrderParseError], int]:
+            batch, parse_errors, next_row_index = chunk
+            if len(batch):
+                batch = await run_stage(
+                    self.executor,
+                    VALIDATE_STAGE,
+                    validate_sell_order_batch,
+                    batch,
+                    self.validator,
+                )
+            return batch, parse_errors, next_row_index
+
+        async def record(
+            chunk: tuple[SellOrderBatch, list[SellOrderParseError], int],
+        ) -> SellOrderBatch:
+            batch, parse_errors, next_row_index = chunk
+            await run_stage(
+                self.executor,
+                RECORD_STAGE,
+                self.record_chunk,
+                job.id,
+                batch,
+                parse_errors,
+                next_row_index,
+                job.attempts,
+            )
+            return batch
+
+        async def generate_invoices(batch: SellOrderBatch) -> None:
+            await self._dispatch_chunk_invoices(job, batch)
+
+        await self._dispatch_uninvoiced_chunks(job)
+        pipeline: StagedPipeline = StagedPipeline(
+            [
+                PipelineStage(PARSE_STAGE, parse),
+                PipelineStage(VALIDATE_STAGE, validate),
+                PipelineStage(RECORD_STAGE, record),
+                PipelineStage(INVOICE_STAGE, generate_invoices),
+            ]
+        )
+        async for _ in pipeline.run(
+            self._remaining_row_chunks(job.upload_path, job.next_row_index)
+        ):
+            pass
+
+    def record_chunk(
+        self,
+        job_id: str,
+        batch: SellOrderBatch,
+        parse_errors: list[SellOrderParseError],
+        next_row_index: int,
+        attempts: Optional[int] = None,
+    ) -> int:
+        """
+        This method records a chunk of a job together with its checkpoint. It returns the number
+        of transactions written, or raises a BatchJobLeaseLostError if the job is no longer
+        running the given attempt.
+
+        Args:
+            job_id (str): The id of the job.
+            batch (SellOrderBatch): The validated batch of sell orders of the chunk.
+            parse_errors (list[SellOrderParseError]): The rows of the chunk that could not be
+                parsed.
+            next_row_index (int): The index of the first row after the chunk.
+            attempts (int, optional): The attempt of the job recording the chunk.
+        """
+        with Session(self.db_service.engine) as session:
+            return DataBaseService.record_batch_job_chunk(
+                batch,
+                parse_errors,
+                session,
+                job_id,
+                next_row_index,
+                enqueue_invoice_jobs=self.invoice_job_queue is not None,
+                attempts=attempts,
+            )
+
+    def claim_job(self) -> Optional[BatchJob]:
+        """
+        This method marks the oldest pending job, or job whose lease has expired, as running,
+        counts the attempt, and returns it, or returns None if there is no such job. Jobs whose
+        lease expired on their last attempt are marked as failed instead.
+        """
+        now: datetime.datetime = datetime.datetime.now()
+        lease_expired = and_(
+            BatchJob.status == BATCH_JOB_RUNNING,  # type: ignore
+            BatchJob.updated_at  # type: ignore
+            < now - datetime.timedelta(seconds=self.lease_timeout),
+        )
+        abandoned_jobs_statement = (
+            update(BatchJob)
+            .where(lease_expired)
+            .where(BatchJob.attempts >= self.max_attempts)  # type: ignore
+            .values(
+                status=BATCH_JOB_FAILED,
+                error="The batch job was abandoned by its worker",
+                updated_at=now,
+            )
+        )
+        claimable_job_id = (
+            select(BatchJob.id)
+            .where(or_(BatchJob.status == BATCH_JOB_PENDING, lease_expired))
+            .order_by(BatchJob.created_at)
+            .limit(1)
+        )
+        statement = (
+            update(BatchJob)
+            .where(BatchJob.id.in_(claimable_job_id))  # type: ignore
+            .values(
+                status=BATCH_JOB_RUNNING,
+                attempts=BatchJob.attempts + 1,
+                updated_at=now,
+            )
+            .returning(BatchJob)
+        )
+        with Session(self.db_service.engine, expire_on_commit=False) as session:
+            abandoned_jobs: int = session.execute(abandoned_jobs_statement).rowcount  # type: ignore
+            if abandoned_jobs:
+                logger.error(f"Gave up on {abandoned_jobs} abandoned batch jobs")
+            job: Optional[BatchJob] = session.scalars(statement).first()
+            session.commit()
+        return job
+
+    def renew_lease(self, job: BatchJob) -> bool:
+        """
+        This method touches a running job, so its lease does not expire. It returns whether the
+        lease is still held.
+
+        Args:
+            job (BatchJob): The running job.
+        """
+        return self._update_leased_job(job.id, job.attempts)  # type: ignore
+
+    def complete_job(self, job: BatchJob) -> None:
+        """
+        This method marks a job as done and removes its stored upload, unless the job was taken
+        over by another worker.
+
+        Args:
+            job (BatchJob): The completed job.
+        """
+        if not self._update_leased_job(
+            job.id, job.attempts, status=BATCH_JOB_DONE, error=None  # type: ignore
+        ):
+            logger.warning(f"Batch job {job.id} was taken over by another worker")
+            return
+        logger.info(f"Completed batch job {job.id}")
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(job.upload_path)
+
+    def fail_job(self, job: BatchJob, error: str) -> None:
+        """
+        This method records the error of a failed attempt. The job goes back to pending, to resume
+        from its checkpoint, until it has been attempted max_attempts times. Its upload is kept.
+        Nothing is recorded if the job was taken over by another worker.
+
+        Args:
+            job (BatchJob): The failed job.
+            error (str): The error of the attempt.
+        """
+        if job.attempts >= self.max_attempts:
+            logger.error(
+                f"Giving up on batch job {job.id} after {job.attempts} attempts: {error}"
+            )
+            status: str = BATCH_JOB_FAILED
+        else:
+            status = BATCH_JOB_PENDING
+        self._update_leased_job(
+            job.id, job.attempts, status=status, error=error  # type: ignore
+        )
+
+    def get_job(self, job_id: str) -> Optional[BatchJob]:
+        """
+        This method returns a job, or None if it does not exist.
+
+        Args:
+            job_id (str): The id of the job.
+        """
+        with Session(self.db_service.engine) as session:
+            return session.get(BatchJob, job_id)
+
+    def load_transaction_page(
+        self, job_id: str, after_rowid: int, limit: int
+    ) -> list[tuple[int, MobileDataPurchaseTransaction]]:
+        """
+        This method returns up to limit transactions recorded by a job after a given rowid, in
+        the order they were recorded, with their rowids.
+
+        Args:
+            job_id (str): The id of the job.
+            after_rowid (int): The rowid of the last transaction already read, or 0.
+            limit (int): The maximum number of transactions to return.
+        """
+        rowid = literal_column("rowid")
+        statement = (
+            select(rowid, MobileDataPurchaseTransaction)
+            .where(MobileDataPurchaseTransaction.upload_id == job_id)
+            .where(rowid > after_rowid)
+            .order_by(rowid)
+            .limit(limit)
+        )
+        with Session(self.db_service.engine) as session:
+            return [
+                (row_id, transaction)
+                for row_id, transaction in session.execute(statement)
+            ]
+
+    def load_uninvoiced_transactions(
+        self, job: BatchJob, limit: int
+    ) -> list[MobileDataPurchaseTransaction]:
+        """
+        This method returns up to limit of the transactions recorded by a job whose invoices were
+        not dispatched, in the order they were recorded.
+
+        Args:
+            job (BatchJob): The job.
+            limit (int): The maximum number of transactions to return.
+        """
+        statement = (
+            select(MobileDataPurchaseTransaction)
+            .where(MobileDataPurchaseTransaction.upload_id == job.id)
+            .order_by(literal_column("rowid"))
+            .offset(job.rows_invoiced)
+            .limit(limit)
+        )
+        with Session(self.db_service.engine) as session:
+            return list(session.scalars(statement).all())
+
+    def load_parse_error_page(
+        self, job_id: str, after_id: int, limit: int
+    ) -> list[BatchJobParseError]:
+        """
+        This method returns up to limit parse errors of a job after a given id, in row order.
+
+        Args:
+            job_id (str): The id of the job.
+            after_id (int): The id of the last parse error already read, or 0.
+            limit (int): The maximum number of parse errors to return.
+        """
+        statement = (
+            select(BatchJobParseError)
+            .where(BatchJobParseError.job_id == job_id)
+            .where(BatchJobParseError.id > after_id)  # type: ignore
+            .order_by(BatchJobParseError.id)
+            .limit(limit)
+        )
+        with Session(self.db_service.engine) as session:
+            return list(session.scalars(statement).all())
+
+    async def _remaining_row_chunks(
+        self, upload_path: str, next_row_index: int
+    ) -> AsyncIterator[tuple[int, list[list[str]]]]:
+        # Rows before the checkpoint were recorded by an earlier attempt
+        async for first_row_index, rows in stream_row_chunks(
+            self._read_upload(upload_path), self.chunk_size
+        ):
+            recorded_rows: int = next_row_index - first_row_index
+            if recorded_rows >= len(rows):
+                continue
+            if recorded_rows > 0:
+                yield next_row_index, rows[recorded_rows:]
+            else:
+                yield first_row_index, rows
+
+    async def _read_upload(self, upload_path: str) -> AsyncIterator[bytes]:
+        with open(upload_path, "rb") as upload_file:
+            while data := await asyncio.to_thread(upload_file.read, UPLOAD_READ_SIZE):
+                yield data
+
+    async def _dispatch_uninvoiced_chunks(self, job: BatchJob) -> None:
+        # The invoice jobs of the queue were committed with the transactions
+        if self.invoice_job_queue is not None or job.rows_invoiced is None:
+            return
+        while job.rows_invoiced < job.rows_recorded:
+            transactions: list[MobileDataPurchaseTransaction] = await asyncio.to_thread(
+                self.load_uninvoiced_transactions,
+                job,
+                min(self.chunk_size, job.rows_recorded - job.rows_invoiced),
+            )
+            if not transactions:
+                return
+            logger.info(
+                f"Dispatching the invoices of {len(transactions)} transactions that batch job "
+                f"{job.id} recorded before it was interrupted"
+            )
+            await self._dispatch_chunk_invoices(
+                job,
+                SellOrderBatch.from_sell_orders(
+                    [
+                        transaction_to_sell_order(transaction)
+                        for transaction in transactions
+                    ]
+                ),
+            )
+
+    async def _dispatch_chunk_invoices(
+        self, job: BatchJob, batch: SellOrderBatch
+    ) -> None:
+        if not len(batch):
+            return
+        # The chunk is already recorded, so a retry of the job would not render its invoices again
+        try:
+            await dispatch_invoices(
+                batch,
+                self.invoice_generator,
+                executor=self.executor,
+                invoice_renderer=self.invoice_renderer,
+                invoice_job_queue=self.invoice_job_queue,
+                invoice_cache=self.invoice_cache,
+            )
+        except Exception:
+            logger.exception(
+                f"Failed to generate the PDF invoices of a chunk of batch job {job.id}"
+            )
+        if self.invoice_job_queue is None and job.rows_invoiced is not None:
+            job.rows_invoiced += len(batch)
+            await asyncio.to_thread(
+                self._update_leased_job,
+                job.id,  # type: ignore
+                job.attempts,
+                rows_invoiced=job.rows_invoiced,
+            )
+
+    async def _keep_leased(self, job: BatchJob) -> None:
+        # A long job would otherwise be taken over by another worker after lease_timeout
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await asyncio.to_thread(self.renew_lease, job)
+            except Exception as error:
+                logger.warning(
+                    f"Failed to renew the lease of batch job {job.id}: {error}"
+                )
+
+    def _insert_job(self, job: BatchJob) -> None:
+        with Session(self.db_service.engine, expire_on_commit=False) as session:
+            session.add(job)
+            session.commit()
+
+    def _update_leased_job(self, job_id: str, attempts: int, **values) -> bool:
+        statement = (
+            update(BatchJob)
+            .where(BatchJob.id == job_id)  # type: ignore
+            .where(BatchJob.attempts == attempts)  # type: ignore
+            .where(BatchJob.status == BATCH_JOB_RUNNING)  # type: ignore
+            .values(**values, updated_at=datetime.datetime.now())
+        )
+        with Session(self.db_service.engine) as session:
+            updated_jobs: int = session.execute(statement).rowcount  # type: ignore
+            session.commit()
+        return updated_jobs == 1
+
+    async def _run_worker(self) -> None:
+        while True:
+            try:
+                claimed_job: bool = await self.process_next_job()
+            except Exception:
+                logger.exception("The batch job worker failed to process a job")
+                claimed_job = False
+
+            if not claimed_job:
+                self._new_jobs.clear()  # type: ignore
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        self._new_jobs.wait(), self.poll_interval  # type: ignore
+                    )
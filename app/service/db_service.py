@@ -1,26 +1,227 @@
 """
 This module contains the database service class. The class is responsible for creating the database
-and tables, closing the database connection, and providing a database session for interacting with
-the database.
+and tables, applying the SQLite performance PRAGMAs to each connection, closing the database
+connection, and providing a database session for interacting with the database. An optional async
+engine (aiosqlite) provides AsyncSession objects so that request handlers can await their writes
+instead of blocking the event loop.
 """
 
-from app.model.mobile_data_sell_order import MobileDataSellOrder
+from app.model.mobile_data_sell_order import MobileDataSellOrder, SellOrderParseError
 from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.model.invoice_job import InvoiceJob
+from app.model.batch_job import BATCH_JOB_RUNNING, BatchJob, BatchJobParseError
+
+# Imported so that create_db_and_tables creates its table
+from app.model.idempotency_record import IdempotencyRecord
+from app.model.sell_order_batch import SellOrderBatch, decode_error_mask
 from sqlmodel import SQLModel, create_engine
+from sqlalchemy import delete, event, insert, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm.session import Session
+from typing import AsyncIterator, Iterable, Iterator, Mapping, Optional, Union
+import contextlib
+import datetime
+import json
 import logging
+import uuid
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
 
+SUPPORTED_SQLITE_PRAGMAS: tuple[str, ...] = (
+    "busy_timeout",
+    "journal_mode",
+    "synchronous",
+    "cache_size",
+    "mmap_size",
+    "temp_store",
+)
+
+
+def _checked_sqlite_pragmas(
+    sqlite_pragmas: Mapping[str, Union[str, int]],
+) -> dict[str, Union[str, int]]:
+    """
+    This function checks that every PRAGMA is supported and every value is an integer or a plain
+    keyword, since PRAGMA statements cannot use bound parameters.
+    """
+    for pragma, value in sqlite_pragmas.items():
+        if pragma not in SUPPORTED_SQLITE_PRAGMAS:
+            raise ValueError(f"Unsupported SQLite PRAGMA: {pragma}")
+        if not isinstance(value, int) and not str(value).isalpha():
+            raise ValueError(f"Invalid value for SQLite PRAGMA {pragma}: {value}")
+    return dict(sqlite_pragmas)
+
+
+def _apply_sqlite_pragmas_on_connect(
+    engine: Engine, sqlite_pragmas: Mapping[str, Union[str, int]]
+) -> None:
+    """
+    This function registers a listener that runs the PRAGMAs on every new DBAPI connection.
+    """
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in sqlite_pragmas.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+        cursor.close()
+
+
+def _add_missing_columns(connection: Connection) -> None:
+    """
+    This function adds the nullable columns, and their indexes, that were added to the models after
+    their tables were created. SQLModel.metadata.create_all only creates missing tables, so
+    without this step existing databases would lack the new columns.
+    """
+    inspector = inspect(connection)
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing_columns: set[str] = {
+            column["name"] for column in inspector.get_columns(table.name)
+        }
+        for column in table.columns:
+            if column.name in existing_columns or not column.nullable:
+                continue
+            logger.info(f"Adding the column {column.name} to the table {table.name}")
+            column_type: str = column.type.compile(dialect=connection.dialect)
+            connection.execute(
+                text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}")
+            )
+            for index in table.indexes:
+                if column.name in index.columns:
+                    index.create(connection, checkfirst=True)
+
+
+def _is_in_memory_sqlite(path_to_db_file: str) -> bool:
+    """
+    This function checks if a database URL points to an in-memory SQLite database, which is pooled
+    as a single connection.
+    """
+    return path_to_db_file.startswith("sqlite") and (
+        path_to_db_file.rstrip("/").endswith(":") or ":memory:" in path_to_db_file
+    )
+
+
+class TransactionChunkError(Exception):
+    """
+    This exception is raised when a chunk of a bulk transaction write fails. The failed chunk has
+    been rolled back; the first_row rows before it were committed.
+
+    Attributes:
+        chunk_index (int): The index of the failed chunk.
+        first_row (int): The index of the first row of the failed chunk.
+        row_count (int): The number of rows in the failed chunk.
+    """
+
+    def __init__(self, chunk_index: int, first_row: int, row_count: int):
+        self.chunk_index: int = chunk_index
+        self.first_row: int = first_row
+        self.row_count: int = row_count
+        super().__init__(
+            f"Failed to write transaction chunk {chunk_index} "
+            f"(rows {first_row} to {first_row + row_count - 1}); "
+            f"the {first_row} rows before it were committed"
+        )
+
+
+class BatchJobLeaseLostError(Exception):
+    """
+    This exception is raised when a worker records a chunk of a batch job whose lease it no longer
+    holds, because the job was claimed again after the lease expired. Nothing was recorded.
+
+    Attributes:
+        job_id (str): The id of the batch job.
+        attempts (int): The attempt of the worker that lost the lease.
+    """
+
+    def __init__(self, job_id: str, attempts: int):
+        self.job_id: str = job_id
+        self.attempts: int = attempts
+        super().__init__(
+            f"Attempt {attempts} of batch job {job_id} no longer holds its lease"
+        )
+
 
 class DataBaseService:
+    """
+    This class owns the database engine. File databases use a QueuePool of pool_size connections;
+    in-memory SQLite databases use a QueuePool of a single connection, so every thread sees the
+    same database but only one of them uses the connection at a time.
 
-    def __init__(self, path_to_db_file: str):
+    Attributes:
+        path_to_db_file (str): The database URL.
+        sqlite_pragmas (Mapping[str, Union[str, int]], optional): The PRAGMAs applied, in order, to
+            every new SQLite connection. See SUPPORTED_SQLITE_PRAGMAS.
+        pool_size (int, optional): The number of pooled connections of a file database.
+        max_overflow (int, optional): The number of connections allowed beyond pool_size.
+        enable_async (bool): Whether to also create an async engine for AsyncSession objects.
+            SQLite URLs are switched to the aiosqlite driver.
+    """
+
+    def __init__(
+        self,
+        path_to_db_file: str,
+        sqlite_pragmas: Optional[Mapping[str, Union[str, int]]] = None,
+        pool_size: Optional[int] = None,
+        max_overflow: Optional[int] = None,
+        enable_async: bool = False,
+    ):
         logger.info("Connecting to the database")
+        self.path_to_db_file: str = path_to_db_file
+        self.sqlite_pragmas: dict[str, Union[str, int]] = _checked_sqlite_pragmas(
+            sqlite_pragmas or {}
+        )
+
+        engine_options: dict = {}
+        if _is_in_memory_sqlite(path_to_db_file):
+            # Each connection to an in-memory database has its own database, and a SQLite
+            # connection must not be used by two threads at once
+            engine_options["poolclass"] = QueuePool
+            engine_options["pool_size"] = 1
+            engine_options["max_overflow"] = 0
+        elif pool_size is not None:
+            engine_options["poolclass"] = QueuePool
+            engine_options["pool_size"] = pool_size
+            if max_overflow is not None:
+                engine_options["max_overflow"] = max_overflow
+
         self.engine = create_engine(
-            path_to_db_file, connect_args={"check_same_thread": False}
+            path_to_db_file,
+            connect_args={"check_same_thread": False},
+            **engine_options,
         )
+        if self.sqlite_pragmas and self.engine.dialect.name == "sqlite":
+            _apply_sqlite_pragmas_on_connect(self.engine, self.sqlite_pragmas)
+
+        self.async_engine: Optional[AsyncEngine] = None
+        self.async_session_factory: Optional[async_sessionmaker[AsyncSession]] = None
+        if enable_async:
+            logger.info("Connecting the async database engine")
+            # The async engine keeps the pool sizes in its async-adapted queue pool
+            if engine_options.get("poolclass") is QueuePool:
+                engine_options["poolclass"] = AsyncAdaptedQueuePool
+            self.async_engine = create_async_engine(
+                async_database_url(path_to_db_file),
+                connect_args={"check_same_thread": False},
+                **engine_options,
+            )
+            if self.sqlite_pragmas and self.async_engine.dialect.name == "sqlite":
+                _apply_sqlite_pragmas_on_connect(
+                    self.async_engine.sync_engine, self.sqlite_pragmas
+                )
+            self.async_session_factory = async_sessionmaker(
+                self.async_engine, expire_on_commit=False
+            )
 
     def create_db_and_tables(self):
         """
@@ -29,6 +230,38 @@ class DataBaseService:
         """
         logger.info("Creating the database and tables")
         SQLModel.metadata.create_all(self.engine)
+        with self.engine.begin() as connection:
+            _add_missing_columns(connection)
+        self.log_effective_pragmas()
+
+    def log_effective_pragmas(self) -> dict[str, Union[str, int]]:
+        """
+        This method reads back the configured PRAGMAs from a pooled connection, logs them and
+        returns them. SQLite silently ignores some settings, e.g. WAL on an in-memory database,
+        so the effective values can differ from the configured ones.
+        """
+        if not self.sqlite_pragmas or self.engine.dialect.name != "sqlite":
+            return {}
+
+        with self.engine.connect() as connection:
+            effective_pragmas: dict[str, Union[str, int]] = {
+                pragma: connection.execute(text(f"PRAGMA {pragma}")).scalar()
+                for pragma in self.sqlite_pragmas
+            }
+
+        logger.info(f"Effective SQLite PRAGMAs: {effective_pragmas}")
+        return effective_pragmas
+
+    async def create_async_db_and_tables(self):
+        """
+        This method creates the database and tables through the async engine. It is only needed
+        when the async engine has its own database, e.g. an in-memory SQLite database.
+        """
+        async_engine: AsyncEngine = self._require_async_engine()
+        logger.info("Creating the database and tables through the async engine")
+        async with async_engine.begin() as connection:
+            await connection.run_sync(SQLModel.metadata.create_all)
+            await connection.run_sync(_add_missing_columns)
 
     def close_db_connection(self):
         """
@@ -38,6 +271,15 @@ class DataBaseService:
         logger.info("Closing the database connection")
         self.engine.dispose()
 
+    async def close_async_db_connection(self):
+        """
+        This method closes the async database connections, if the async engine is enabled. It is
+        called when the FastAPI application is stopped.
+        """
+        if self.async_engine is not None:
+            logger.info("Closing the async database connection")
+            await self.async_engine.dispose()
+
     def get_db_session(self):
         """
         This method returns a database session. The session is used to interact with the database.
@@ -45,6 +287,35 @@ class DataBaseService:
         with Session(self.engine) as session:
             yield session
 
+    async def get_async_db_session(self) -> AsyncIterator[AsyncSession]:
+        """
+        This method returns an async database session. Its queries and commits are awaited, so
+        they do not block the event loop.
+        """
+        self._require_async_engine()
+        async with self.async_session_factory() as session:  # type: ignore
+            yield session
+
+    @contextlib.asynccontextmanager
+    async def request_session(self) -> AsyncIterator[Union[Session, AsyncSession]]:
+        """
+        This method opens a database session for a request whose work outlives its route, such as
+        a streaming response body. The session is async if the async engine is enabled.
+        """
+        if self.async_engine is not None:
+            async with self.async_session_factory() as async_session:  # type: ignore
+                yield async_session
+        else:
+            with Session(self.engine) as session:
+                yield session
+
+    def _require_async_engine(self) -> AsyncEngine:
+        if self.async_engine is None:
+            raise RuntimeError(
+                "The async database engine is not enabled; pass enable_async=True"
+            )
+        return self.async_engine
+
     @staticmethod
     def record_transactions(
         sell_orders: list[MobileDataSellOrder],
@@ -79,3 +350,496 @@ class DataBaseService:
             session.add(transaction)
             session.commit()
             session.refresh(transaction)
+
+    @staticmethod
+    def record_transactions_bulk(
+        sell_orders: list[MobileDataSellOrder],
+        session: Session,
+        chunk_size: Optional[int] = None,
+    ) -> int:
+        """
+        This method records multiple transactions to the database with executemany-style INSERT
+        statements, committing once per chunk instead of once per order and without reading the
+        rows back. It returns the number of rows written.
+
+        Args:
+            sell_orders (list[MobileDataSellOrder]): A list of MobileDataSellOrder objects to be
+                recorded in the database.
+            session (Session): The database session to be used for the transaction.
+            chunk_size (int, optional): The number of rows per transaction. All rows are written
+                in a single transaction if not provided.
+        """
+        return DataBaseService.insert_transaction_rows(
+            DataBaseService.build_transaction_rows(sell_orders), session, chunk_size
+        )
+
+    @staticmethod
+    def record_transaction_batch(
+        batch: SellOrderBatch,
+        session: Session,
+        chunk_size: Optional[int] = None,
+        enqueue_invoice_jobs: bool = False,
+        upload_id: Optional[str] = None,
+    ) -> int:
+        """
+        This method records a columnar batch of validated sell orders to the database with
+        executemany-style INSERT statements, one transaction per chunk. Validation errors are
+        decoded from the batch error bitmask. It returns the number of rows written.
+
+        Args:
+            batch (SellOrderBatch): The validated batch of sell orders to be recorded.
+            session (Session): The database session to be used for the transaction.
+            chunk_size (int, optional): The number of rows per transaction. All rows are written
+                in a single transaction if not provided.
+            enqueue_invoice_jobs (bool): Whether to enqueue an InvoiceJob per transaction, in the
+                same database transaction as its chunk.
+            upload_id (str, optional): The id of the upload the batch belongs to.
+        """
+        return DataBaseService.insert_transaction_rows(
+            DataBaseService.build_transaction_rows_from_batch(batch, upload_id),
+            session,
+            chunk_size,
+            enqueue_invoice_jobs,
+        )
+
+    @staticmethod
+    def record_batch_job_chunk(
+        batch: SellOrderBatch,
+        parse_errors: list[SellOrderParseError],
+        session: Session,
+        job_id: str,
+        next_row_index: int,
+        enqueue_invoice_jobs: bool = False,
+        attempts: Optional[int] = None,
+    ) -> int:
+        """
+        This method records a chunk of a batch job in a single database transaction: the
+        transactions of its validated sell orders, their invoice jobs, its parse errors and the
+        checkpoint of the job. Either the whole chunk and its checkpoint are committed or nothing
+        is, so a resumed job never records a row twice. It returns the number of rows written.
+        A BatchJobLeaseLostError is raised, and nothing recorded, if attempts is given and the job
+        is no longer running that attempt.
+
+        Args:
+            batch (SellOrderBatch): The validated batch of sell orders of the chunk.
+            parse_errors (list[SellOrderParseError]): The rows of the chunk that could not be
+                parsed.
+            session (Session): The database session to be used for the transaction.
+            job_id (str): The id of the BatchJob, recorded as the upload id of the transactions.
+            next_row_index (int): The index of the first row after the chunk.
+            enqueue_invoice_jobs (bool): Whether to enqueue an InvoiceJob per transaction.
+            attempts (int, optional): The attempt of the job recording the chunk.
+        """
+        rows: list[dict] = DataBaseService.build_transaction_rows_from_batch(
+            batch, job_id
+        )
+        checkpoint_statement = update(BatchJob).where(
+            BatchJob.id == job_id  # type: ignore
+        )
+        if attempts is not None:
+            checkpoint_statement = checkpoint_statement.where(
+                BatchJob.attempts == attempts,  # type: ignore
+                BatchJob.status == BATCH_JOB_RUNNING,  # type: ignore
+            )
+        logger.info(
+            f"Committing {len(rows)} transactions of batch job {job_id} up to row "
+            f"{next_row_index} to the database"
+        )
+        try:
+            if rows:
+                session.execute(insert(MobileDataPurchaseTransaction), rows)
+            if rows and enqueue_invoice_jobs:
+                session.execute(
+                    insert(InvoiceJob), DataBaseService.build_invoice_job_rows(rows)
+                )
+            if parse_errors:
+                session.execute(
+                    insert(BatchJobParseError),
+                    [
+                        {
+                            "job_id": job_id,
+                            "row_index": parse_error.row_index,
+                            "errors": json.dumps(parse_error.errors),
+                        }
+                        for parse_error in parse_errors
+                    ],
+                )
+            checkpoint_result = session.execute(
+                checkpoint_statement.values(
+                    next_row_index=next_row_index,
+                    rows_recorded=BatchJob.rows_recorded + len(rows),
+                    rows_unparseable=BatchJob.rows_unparseable + len(parse_errors),
+                    updated_at=datetime.datetime.now(),
+                )
+            )
+            if attempts is not None and checkpoint_result.rowcount == 0:  # type: ignore
+                session.rollback()
+                raise BatchJobLeaseLostError(job_id, attempts)
+            session.commit()
+        except SQLAlchemyError:
+            session.rollback()
+            raise
+
+        return len(rows)
+
+    @staticmethod
+    async def record_transactions_async(
+        sell_orders: list[MobileDataSellOrder],
+        session: AsyncSession,
+        chunk_size: Optional[int] = None,
+    ) -> int:
+        """
+        This method is the async variant of record_transactions_bulk. It returns the number of rows
+        written.
+
+        Args:
+            sell_orders (list[MobileDataSellOrder]): A list of MobileDataSellOrder objects to be
+                recorded in the database.
+            session (AsyncSession): The async database session to be used for the transaction.
+            chunk_size (int, optional): The number of rows per transaction. All rows are written
+                in a single transaction if not provided.
+        """
+        return await DataBaseService.insert_transaction_rows_async(
+            DataBaseService.build_transaction_rows(sell_orders), session, chunk_size
+        )
+
+    @staticmethod
+    async def record_transaction_batch_async(
+        batch: SellOrderBatch,
+        session: AsyncSession,
+        chunk_size: Optional[int] = None,
+        enqueue_invoice_jobs: bool = False,
+        upload_id: Optional[str] = None,
+    ) -> int:
+        """
+        This method is the async variant of record_transaction_batch. It returns the number of
+        rows written.
+
+        Args:
+            batch (SellOrderBatch): The validated batch of sell orders to be recorded.
+            session (AsyncSession): The async database session to be used for the transaction.
+            chunk_size (int, optional): The number of rows per transaction. All rows are written
+                in a single transaction if not provided.
+            enqueue_invoice_jobs (bool): Whether to enqueue an InvoiceJob per transaction, in the
+                same database transaction as its chunk.
+            upload_id (str, optional): The id of the upload the batch belongs to.
+        """
+        return await DataBaseService.insert_transaction_rows_async(
+            DataBaseService.build_transaction_rows_from_batch(batch, upload_id),
+            session,
+            chunk_size,
+            enqueue_invoice_jobs,
+        )
+
+    @staticmethod
+    def discard_upload(upload_id: str, session: Session) -> list[str]:
+        """
+        This method deletes the transactions recorded for an upload, and their invoice jobs, in one
+        database transaction. It is used to undo the chunks of an upload that already committed
+        when a later part of the upload fails, so that retrying the upload does not record them
+        twice. It returns the billing account numbers of the deleted transactions.
+
+        Args:
+            upload_id (str): The id of the upload whose transactions are deleted.
+            session (Session): The database session to be used for the transaction.
+        """
+        # The session may still hold the transaction of the write that failed
+        session.rollback()
+        billing_account_numbers: list[str] = list(
+            session.execute(_upload_billing_account_numbers(upload_id)).scalars()
+        )
+        session.execute(_delete_upload_invoice_jobs(upload_id))
+        session.execute(_delete_upload_transactions(upload_id))
+        session.commit()
+        logger.info(
+            f"Discarded {len(billing_account_numbers)} transactions of upload {upload_id}"
+        )
+        return billing_account_numbers
+
+    @staticmethod
+    async def discard_upload_async(upload_id: str, session: AsyncSession) -> list[str]:
+        """
+        This method is the async variant of discard_upload.
+
+        Args:
+            upload_id (str): The id of the upload whose transactions are deleted.
+            session (AsyncSession): The async database session to be used for the transaction.
+        """
+        await session.rollback()
+        billing_account_numbers: list[str] = list(
+            (
+                await session.execute(_upload_billing_account_numbers(upload_id))
+            ).scalars()
+        )
+        await session.execute(_delete_upload_invoice_jobs(upload_id))
+        await session.execute(_delete_upload_transactions(upload_id))
+        await session.commit()
+        logger.info(
+            f"Discarded {len(billing_account_numbers)} transactions of upload {upload_id}"
+        )
+        return billing_account_numbers
+
+    @staticmethod
+    def build_transaction_rows(
+        sell_orders: Iterable[MobileDataSellOrder],
+    ) -> list[dict]:
+        """
+        This method converts sell orders into MobileDataPurchaseTransaction column dictionaries
+        ready for a bulk INSERT.
+
+        Args:
+            sell_orders (Iterable[MobileDataSellOrder]): The sell orders to be converted.
+        """
+        now: datetime.datetime = datetime.datetime.now()
+        return [
+            {
+                "id": str(uuid.uuid4()),
+                "name": sell_order.name,
+                "date_of_birth": sell_order.date_of_birth,
+                "credit_card_number": sell_order.credit_card_number,
+                "credit_card_expiration_date": sell_order.credit_card_expiration_date,
+                "credit_card_cvv": sell_order.credit_card_cvv,
+                "billing_account_number": sell_order.billing_account_number,
+                "requested_mobile_data": sell_order.requested_mobile_data,
+                "status": sell_order.status,
+                "validation_errors": ", ".join(sell_order.validation_errors),
+                "created_at": now,
+            }
+            for sell_order in sell_orders
+        ]
+
+    @staticmethod
+    def build_transaction_rows_from_batch(
+        batch: SellOrderBatch, upload_id: Optional[str] = None
+    ) -> list[dict]:
+        """
+        This method converts a columnar batch of validated sell orders into
+        MobileDataPurchaseTransaction column dictionaries ready for a bulk INSERT.
+
+        Args:
+            batch (SellOrderBatch): The validated batch of sell orders to be converted.
+            upload_id (str, optional): The id of the upload the batch belongs to.
+        """
+        now: datetime.datetime = datetime.datetime.now()
+        return [
+            {
+                "id": str(uuid.uuid4()),
+                "name": name,
+                "date_of_birth": date_of_birth,
+                "credit_card_number": credit_card_number,
+                "credit_card_expiration_date": credit_card_expiration_date,
+                "credit_card_cvv": credit_card_cvv,
+                "billing_account_number": billing_account_number,
+                "requested_mobile_data": requested_mobile_data,
+                "status": status,
+                "validation_errors": ", ".join(decode_error_mask(error_mask)),
+                "upload_id": upload_id,
+                "created_at": now,
+            }
+            for (
+                name,
+                date_of_birth,
+                credit_card_number,
+                credit_card_expiration_date,
+                credit_card_cvv,
+                billing_account_number,
+                requested_mobile_data,
+                status,
+                error_mask,
+            ) in zip(
+                batch.name.tolist(),
+                batch.date_of_birth.tolist(),
+                batch.credit_card_number.tolist(),
+                batch.credit_card_expiration_date.tolist(),
+                batch.credit_card_cvv.tolist(),
+                batch.billing_account_number.tolist(),
+                batch.requested_mobile_data.tolist(),
+                batch.statuses().tolist(),
+                batch.error_mask.tolist(),
+            )
+        ]
+
+    @staticmethod
+    def build_invoice_job_rows(transaction_rows: Iterable[dict]) -> list[dict]:
+        """
+        This method builds the pending InvoiceJob column dictionaries of transaction column
+        dictionaries, ready for a bulk INSERT.
+
+        Args:
+            transaction_rows (Iterable[dict]): The transaction column dictionaries.
+        """
+        now: datetime.datetime = datetime.datetime.now()
+        return [
+            {
+                "id": str(uuid.uuid4()),
+                "transaction_id": transaction_row["id"],
+                "billing_account_number": transaction_row["billing_account_number"],
+                "created_at": now,
+                "updated_at": now,
+            }
+            for transaction_row in transaction_rows
+        ]
+
+    @staticmethod
+    def insert_transaction_rows(
+        rows: list[dict],
+        session: Session,
+        chunk_size: Optional[int] = None,
+        enqueue_invoice_jobs: bool = False,
+    ) -> int:
+        """
+        This method writes MobileDataPurchaseTransaction column dictionaries with one
+        executemany-style INSERT and one commit per chunk. Each chunk is atomic: if a chunk fails
+        it is rolled back, the chunks before it stay committed, and a TransactionChunkError
+        describing the failed chunk is raised. It returns the number of rows written.
+
+        Args:
+            rows (list[dict]): The transaction column dictionaries to be written.
+            session (Session): The database session to be used for the transactions.
+            chunk_size (int, optional): The number of rows per transaction. All rows are written
+                in a single transaction if not provided.
+            enqueue_invoice_jobs (bool): Whether to insert a pending InvoiceJob per row in the
+                transaction of its chunk.
+        """
+        statement = insert(MobileDataPurchaseTransaction)
+
+        for chunk_index, first_row, chunk in _transaction_row_chunks(rows, chunk_size):
+            logger.info(
+                f"Committing {len(chunk)} transactions (chunk {chunk_index}) to the database"
+            )
+            try:
+                session.execute(statement, chunk)
+                if enqueue_invoice_jobs:
+                    session.execute(
+                        insert(InvoiceJob),
+                        DataBaseService.build_invoice_job_rows(chunk),
+                    )
+                session.commit()
+            except SQLAlchemyError as error:
+                session.rollback()
+                raise TransactionChunkError(
+                    chunk_index=chunk_index,
+                    first_row=first_row,
+                    row_count=len(chunk),
+                ) from error
+
+        return len(rows)
+
+    @staticmethod
+    async def insert_transaction_rows_async(
+        rows: list[dict],
+        session: AsyncSession,
+        chunk_size: Optional[int] = None,
+        enqueue_invoice_jobs: bool = False,
+    ) -> int:
+        """
+        This method is the async variant of insert_transaction_rows, with the same per-chunk
+        atomicity and TransactionChunkError reporting. It returns the number of rows written.
+
+        Args:
+            rows (list[dict]): The transaction column dictionaries to be written.
+            session (AsyncSession): The async database session to be used for the transactions.
+            chunk_size (int, optional): The number of rows per transaction. All rows are written
+                in a single transaction if not provided.
+            enqueue_invoice_jobs (bool): Whether to insert a pending InvoiceJob per row in the
+                transaction of its chunk.
+        """
+        statement = insert(MobileDataPurchaseTransaction)
+
+        for chunk_index, first_row, chunk in _transaction_row_chunks(rows, chunk_size):
+            logger.info(
+                f"Committing {len(chunk)} transactions (chunk {chunk_index}) to the database"
+            )
+            try:
+                await session.execute(statement, chunk)
+                if enqueue_invoice_jobs:
+                    await session.execute(
+                        insert(InvoiceJob),
+                        DataBaseService.build_invoice_job_rows(chunk),
+                    )
+                await session.commit()
+            except SQLAlchemyError as error:
+                await session.rollback()
+                raise TransactionChunkError(
+                    chunk_index=chunk_index,
+                    first_row=first_row,
+                    row_count=len(chunk),
+                ) from error
+
+        return len(rows)
+
+
+def _transaction_row_chunks(
+    rows: list[dict], chunk_size: Optional[int]
+) -> Iterator[tuple[int, int, list[dict]]]:
+    """
+    This function splits transaction rows into chunks of chunk_size rows, or one chunk if
+    chunk_size is None. It yields the index and first row of each chunk with the chunk.
+    """
+    if chunk_size is not None and chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    step: int = chunk_size or max(len(rows), 1)
+    for chunk_index, first_row in enumerate(range(0, len(rows), step)):
+        yield chunk_index, first_row, rows[first_row : first_row + step]
+
+
+def _upload_billing_account_numbers(upload_id: str):
+    return select(MobileDataPurchaseTransaction.billing_account_number).where(
+        MobileDataPurchaseTransaction.upload_id == upload_id
+    )
+
+
+def _delete_upload_invoice_jobs(upload_id: str):
+    return delete(InvoiceJob).where(
+        InvoiceJob.transaction_id.in_(  # type: ignore
+            select(MobileDataPurchaseTransaction.id).where(
+                MobileDataPurchaseTransaction.upload_id == upload_id
+            )
+        )
+    )
+
+
+def _delete_upload_transactions(upload_id: str):
+    return delete(MobileDataPurchaseTransaction).where(
+        MobileDataPurchaseTransaction.upload_id == upload_id  # type: ignore
+    )
+
+
+def async_database_url(path_to_db_file: str) -> str:
+    """
+    This function converts a synchronous SQLite database URL into its aiosqlite equivalent. Other
+    URLs are returned unchanged.
+
+    Args:
+        path_to_db_file (str): The database URL.
+    """
+    if path_to_db_file.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + path_to_db_file[len("sqlite:") :]
+    return path_to_db_file
+
+
+def transaction_to_sell_order(
+    transaction: MobileDataPurchaseTransaction,
+) -> MobileDataSellOrder:
+    """
+    This function rebuilds the validated sell order of a recorded transaction.
+
+    Args:
+        transaction (MobileDataPurchaseTransaction): The recorded transaction.
+    """
+    return MobileDataSellOrder.model_construct(
+        name=transaction.name,
+        date_of_birth=transaction.date_of_birth,
+        credit_card_number=transaction.credit_card_number,
+        credit_card_expiration_date=transaction.credit_card_expiration_date,
+        credit_card_cvv=transaction.credit_card_cvv,
+        billing_account_number=transaction.billing_account_number,
+        requested_mobile_data=transaction.requested_mobile_data,
+        status=transaction.status,
+        validation_errors=(
+            transaction.validation_errors.split(", ")
+            if transaction.validation_errors
+            else []
+        ),
+    )
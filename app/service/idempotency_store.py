@@ -0,0 +1,237 @@
+"""
+This module contains the IdempotencyStore class, which keeps the IdempotencyRecord table. A request
+claims its key before it is processed, so only one request per key runs at a time, even across
+worker processes, and stores its response once it is done so retries can be answered from the
+table. Expired records are purged periodically so the table does not grow without bound.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+from typing import Optional
+from sqlalchemy import and_, delete, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.model.idempotency_record import (
+    IDEMPOTENCY_COMPLETED,
+    IDEMPOTENCY_IN_PROGRESS,
+    IdempotencyRecord,
+)
+from app.service.db_service import DataBaseService
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+class IdempotencyStore:
+    """
+    This class claims, completes and releases idempotency keys. A completed record is replayed
+    until it is older than ttl. The owner of a record in progress touches it while it runs, so a
+    record in progress that has not been touched for stale_after is presumed to belong to a
+    request that was lost in a crash, and may be claimed again. Once started, the store deletes
+    the expired records every purge_interval.
+
+    Attributes:
+        db_service (DataBaseService): The database service whose synchronous engine holds the
+            records.
+        ttl (float): The number of seconds a completed record is replayed for.
+        stale_after (float): The number of seconds after which a record in progress may be
+            claimed again.
+        purge_interval (float): The number of seconds between two purges of the expired records.
+    """
+
+    def __init__(
+        self,
+        db_service: DataBaseService,
+        ttl: float,
+        stale_after: float,
+        purge_interval: float = 60 * 60,
+    ) -> None:
+        self.db_service: DataBaseService = db_service
+        self.ttl: float = ttl
+        self.stale_after: float = stale_after
+        self.purge_interval: float = purge_interval
+        self._purger: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        This method purges the expired records and starts the task that purges them every
+        purge_interval. It is called when the FastAPI application is started.
+        """
+        self.purge_expired()
+        self._purger = asyncio.create_task(
+            self._purge_periodically(), name="idempotency-purger"
+        )
+
+    async def shutdown(self) -> None:
+        """
+        This method cancels the purge task. It is called when the FastAPI application is stopped.
+        """
+        if self._purger is None:
+            return
+        self._purger.cancel()
+        await asyncio.gather(self._purger, return_exceptions=True)
+        self._purger = None
+
+    def purge_expired(self) -> int:
+        """
+        This method deletes the completed records older than ttl and the records in progress that
+        have not been touched for stale_after, which would be claimed again anyway. It returns the
+        number of records deleted.
+        """
+        now: datetime.datetime = datetime.datetime.now()
+        statement = delete(IdempotencyRecord).where(
+            or_(
+                and_(
+                    IdempotencyRecord.status == IDEMPOTENCY_COMPLETED,  # type: ignore
+                    IdempotencyRecord.updated_at  # type: ignore
+                    < now - datetime.timedelta(seconds=self.ttl),
+                ),
+                and_(
+                    IdempotencyRecord.status == IDEMPOTENCY_IN_PROGRESS,  # type: ignore
+                    IdempotencyRecord.updated_at  # type: ignore
+                    < now - datetime.timedelta(seconds=self.stale_after),
+                ),
+            )
+        )
+        with Session(self.db_service.engine) as session:
+            purged_records: int = session.execute(statement).rowcount  # type: ignore
+            session.commit()
+        if purged_records:
+            logger.info(f"Purged {purged_records} expired idempotency records")
+        return purged_records
+
+    async def _purge_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.purge_interval)
+            try:
+                await asyncio.to_thread(self.purge_expired)
+            except Exception as error:
+                logger.warning(f"Failed to purge the idempotency records: {error}")
+
+    def claim(
+        self, key: str, request_hash: Optional[str] = None
+    ) -> Optional[IdempotencyRecord]:
+        """
+        This method claims a key for the calling request. It returns None if the request now owns
+        the key and must process the request, or the record of the key otherwise: a completed
+        record to replay, or a record in progress to wait for. The caller checks that the
+        request_hash of a returned record matches its own.
+
+        Args:
+            key (str): The idempotency key of the request.
+            request_hash (str, optional): The hash of the request, stored with a new claim.
+        """
+        now: datetime.datetime = datetime.datetime.now()
+        with Session(self.db_service.engine, expire_on_commit=False) as session:
+            try:
+                session.add(
+                    IdempotencyRecord(
+                        key=key,
+                        request_hash=request_hash,
+                        created_at=now,
+                        updated_at=now,
+                    )
+                )
+                session.commit()
+                return None
+            except IntegrityError:
+                session.rollback()
+
+            record: Optional[IdempotencyRecord] = session.get(IdempotencyRecord, key)
+            if record is None:
+                # The owner released the key in the meantime
+                return self.claim(key, request_hash)
+
+            expires_after: float = (
+                self.ttl if record.status == IDEMPOTENCY_COMPLETED else self.stale_after
+            )
+            if now - record.updated_at < datetime.timedelta(seconds=expires_after):
+                return record
+
+            # Only one of the requests racing for an expired record wins the update
+            statement = (
+                update(IdempotencyRecord)
+                .where(IdempotencyRecord.key == key)  # type: ignore
+                .where(IdempotencyRecord.updated_at == record.updated_at)  # type: ignore
+                .values(
+                    status=IDEMPOTENCY_IN_PROGRESS,
+                    request_hash=request_hash,
+                    status_code=None,
+                    response_headers=None,
+                    response_body=None,
+                    created_at=now,
+                    updated_at=now,
+                )
+            )
+            claimed: bool = session.execute(statement).rowcount == 1  # type: ignore
+            session.commit()
+            if claimed:
+                logger.info(f"Claimed the expired idempotency key {key}")
+                return None
+            return session.get(IdempotencyRecord, key, populate_existing=True)
+
+    def touch(self, key: str) -> None:
+        """
+        This method refreshes a record in progress, so it is not presumed lost while its owner is
+        still processing the request.
+
+        Args:
+            key (str): The idempotency key of the request.
+        """
+        statement = (
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key)  # type: ignore
+            .where(IdempotencyRecord.status == IDEMPOTENCY_IN_PROGRESS)  # type: ignore
+            .values(updated_at=datetime.datetime.now())
+        )
+        with Session(self.db_service.engine) as session:
+            session.execute(statement)
+            session.commit()
+
+    def complete(
+        self,
+        key: str,
+        status_code: int,
+        headers: list[tuple[str, str]],
+        body: bytes,
+    ) -> None:
+        """
+        This method stores the response of a request whose key it owns.
+
+        Args:
+            key (str): The idempotency key of the request.
+            status_code (int): The status code of the response.
+            headers (list[tuple[str, str]]): The headers of the response.
+            body (bytes): The body of the response.
+        """
+        statement = (
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key)  # type: ignore
+            .values(
+                status=IDEMPOTENCY_COMPLETED,
+                status_code=status_code,
+                response_headers=json.dumps(headers),
+                response_body=body,
+                updated_at=datetime.datetime.now(),
+            )
+        )
+        with Session(self.db_service.engine) as session:
+            session.execute(statement)
+            session.commit()
+
+    def release(self, key: str) -> None:
+        """
+        This method gives up a key whose request failed or whose response is not stored, so the
+        next request with the key is processed.
+
+        Args:
+            key (str): The idempotency key of the request.
+        """
+        statement = delete(IdempotencyRecord).where(
+            IdempotencyRecord.key == key  # type: ignore
+        )
+        with Session(self.db_service.engine) as session:
+            session.execute(statement)
+            session.commit()
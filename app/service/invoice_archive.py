@@ -0,0 +1,124 @@
+"""
+This module contains the InvoiceArchive class, which streams the PDF invoices of an upload or of a
+set of billing account numbers as a ZIP archive. The archive is written incrementally to a
+non-seekable buffer that is drained after every chunk, so only one chunk of one invoice is held in
+memory at a time, and the PDFs are stored as they are since they are already compressed.
+"""
+
+import asyncio
+import io
+import logging
+import os
+import zipfile
+from typing import AsyncIterator, Iterable, Optional
+from sqlalchemy import literal_column, select
+from sqlalchemy.orm import Session
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.service.db_service import DataBaseService
+from app.service.invoice_cache import InvoiceCache
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+class _ArchiveBuffer(io.RawIOBase):
+    """
+    This class is the non-seekable file the ZIP archive is written to. It keeps the bytes written
+    since it was last drained.
+    """
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:  # type: ignore
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data: bytes = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class InvoiceArchive:
+    """
+    This class streams ZIP archives of PDF invoices. Invoices that do not exist yet are rendered
+    through the invoice cache, and billing account numbers without a recorded transaction are
+    left out of the archive.
+
+    Attributes:
+        db_service (DataBaseService): The database service holding the recorded transactions.
+        invoice_cache (InvoiceCache): The cache the PDF invoices are read from.
+        chunk_size (int): The number of bytes of a PDF read and streamed at a time.
+    """
+
+    def __init__(
+        self,
+        db_service: DataBaseService,
+        invoice_cache: InvoiceCache,
+        chunk_size: int = 64 * 1024,
+    ) -> None:
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+
+        self.db_service: DataBaseService = db_service
+        self.invoice_cache: InvoiceCache = invoice_cache
+        self.chunk_size: int = chunk_size
+
+    def load_upload_billing_account_numbers(self, upload_id: str) -> list[str]:
+        """
+        This method returns the distinct billing account numbers recorded by an upload, in the
+        order they were recorded.
+
+        Args:
+            upload_id (str): The id of the upload.
+        """
+        statement = (
+            select(MobileDataPurchaseTransaction.billing_account_number)
+            .where(MobileDataPurchaseTransaction.upload_id == upload_id)
+            .order_by(literal_column("rowid"))
+        )
+        with Session(self.db_service.engine) as session:
+            return list(dict.fromkeys(session.scalars(statement)))
+
+    async def stream(
+        self, billing_account_numbers: Iterable[str]
+    ) -> AsyncIterator[bytes]:
+        """
+        This method yields the bytes of a ZIP archive of the PDF invoices of billing account
+        numbers, as they are written.
+
+        Args:
+            billing_account_numbers (Iterable[str]): The billing account numbers.
+        """
+        buffer: _ArchiveBuffer = _ArchiveBuffer()
+        with zipfile.ZipFile(
+            buffer, mode="w", compression=zipfile.ZIP_STORED
+        ) as archive:
+            for billing_account_number in dict.fromkeys(billing_account_numbers):
+                invoice_path: Optional[str] = await self.invoice_cache.get_invoice(
+                    billing_account_number
+                )
+                if invoice_path is None:
+                    logger.info(
+                        f"Leaving BAN {billing_account_number} out of the invoice archive"
+                    )
+                    continue
+
+                with open(invoice_path, "rb") as pdf_file, archive.open(
+                    os.path.basename(invoice_path), mode="w"
+                ) as archive_entry:
+                    while chunk := await asyncio.to_thread(
+                        pdf_file.read, self.chunk_size
+                    ):
+                        archive_entry.write(chunk)
+                        if data := buffer.drain():
+                            yield data
+                if data := buffer.drain():
+                    yield data
+
+        # Closing the archive writes its central directory
+        yield buffer.drain()
@@ -0,0 +1,235 @@
+"""
+This module contains the InvoiceCache class, which renders the PDF invoice of a billing account
+number on demand, from its recorded transaction, and keeps the file on disk so that later downloads
+are served without rendering again. Files are identified by an ETag derived from their size and
+modification time.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from typing import TYPE_CHECKING, Iterable, Optional
+from sqlalchemy import literal_column, select
+from sqlalchemy.orm import Session
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.model.mobile_data_sell_order import MobileDataSellOrder
+from app.service.db_service import DataBaseService, transaction_to_sell_order
+from app.service.stage_executor import INVOICE_STAGE, StageExecutor, run_stage
+
+if TYPE_CHECKING:
+    from app.service.invoice_generator import InvoiceGenerator
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+class InvoiceCache:
+    """
+    This class serves the PDF invoices of billing account numbers from pdf_output_path, rendering
+    an invoice with the invoice generator the first time it is requested. Concurrent requests for
+    an invoice that is not cached yet wait for a single render. An invoice whose billing account
+    number got a new transaction while it was rendering is rendered again, so a render that
+    finishes after the invalidation of its purchase never leaves a stale invoice in the cache.
+
+    Attributes:
+        db_service (DataBaseService): The database service holding the recorded transactions.
+        invoice_generator (InvoiceGenerator): The generator that renders missing invoices.
+        pdf_output_path (str): The directory of the cached PDF invoices.
+        executor (Optional[StageExecutor]): The executor the invoice stage is dispatched to.
+    """
+
+    def __init__(
+        self,
+        db_service: DataBaseService,
+        invoice_generator: "InvoiceGenerator",
+        pdf_output_path: str,
+        executor: Optional[StageExecutor] = None,
+    ) -> None:
+        self.db_service: DataBaseService = db_service
+        self.invoice_generator: "InvoiceGenerator" = invoice_generator
+        self.pdf_output_path: str = pdf_output_path
+        self.executor: Optional[StageExecutor] = executor
+        self._render_locks: dict[str, _RenderLock] = {}
+
+    def invoice_path(self, billing_account_number: str) -> str:
+        """
+        This method returns the path of the cached PDF invoice of a billing account number, the
+        same path the invoice generator writes it to.
+
+        Args:
+            billing_account_number (str): The billing account number.
+        """
+        return os.path.join(
+            self.pdf_output_path, f"invoice_{billing_account_number}.pdf"
+        )
+
+    async def get_invoice(self, billing_account_number: str) -> Optional[str]:
+        """
+        This method returns the path of the PDF invoice of a billing account number, rendering
+        and caching it first if needed. It returns None if the billing account number has no
+        recorded transaction.
+
+        Args:
+            billing_account_number (str): The billing account number.
+        """
+        invoice_path: str = self.invoice_path(billing_account_number)
+        if os.path.exists(invoice_path):
+            return invoice_path
+
+        render_lock: _RenderLock = self._render_locks.setdefault(
+            billing_account_number, _RenderLock()
+        )
+        render_lock.users += 1
+        try:
+            async with render_lock.lock:
+                # Another request may have rendered the invoice while this one waited
+                if os.path.exists(invoice_path):
+                    return invoice_path
+                return await self._render_latest_invoice(billing_account_number)
+        finally:
+            # The lock is only dropped once no request holds it or waits for it
+            render_lock.users -= 1
+            if render_lock.users == 0:
+                self._render_locks.pop(billing_account_number, None)
+
+    async def _render_latest_invoice(
+        self, billing_account_number: str
+    ) -> Optional[str]:
+        while True:
+            latest_transaction: Optional[tuple[int, MobileDataSellOrder]] = (
+                await asyncio.to_thread(
+                    self.load_latest_transaction, billing_account_number
+                )
+            )
+            if latest_transaction is None:
+                return None
+            rowid, sell_order = latest_transaction
+
+            logger.info(
+                f"Rendering the PDF invoice of BAN {billing_account_number} on demand"
+            )
+            invoice_path: str = await run_stage(
+                self.executor,
+                INVOICE_STAGE,
+                self.invoice_generator.generate_pdf_invoice,
+                sell_order,
+            )
+
+            # A purchase recorded during the render invalidated the cache before this invoice
+            # was written, so the invoice is only kept if its transaction is still the latest
+            latest_rowid: Optional[int] = await asyncio.to_thread(
+                self.latest_transaction_rowid, billing_account_number
+            )
+            if latest_rowid == rowid:
+                return invoice_path
+            logger.info(
+                f"The transactions of BAN {billing_account_number} changed during its render"
+            )
+            self.invalidate([billing_account_number])
+
+    def load_latest_transaction(
+        self, billing_account_number: str
+    ) -> Optional[tuple[int, MobileDataSellOrder]]:
+        """
+        This method loads the rowid of the most recently recorded transaction of a billing
+        account number and the transaction as a sell order, or returns None if there is none.
+
+        Args:
+            billing_account_number (str): The billing account number.
+        """
+        statement = _latest_transaction_statement(
+            billing_account_number,
+            literal_column("rowid"),
+            MobileDataPurchaseTransaction,
+        )
+        with Session(self.db_service.engine) as session:
+            row = session.execute(statement).first()
+            if row is None:
+                return None
+            rowid, transaction = row
+            return rowid, transaction_to_sell_order(transaction)
+
+    def latest_transaction_rowid(self, billing_account_number: str) -> Optional[int]:
+        """
+        This method returns the rowid of the most recently recorded transaction of a billing
+        account number, or None if there is none.
+
+        Args:
+            billing_account_number (str): The billing account number.
+        """
+        statement = _latest_transaction_statement(
+            billing_account_number, literal_column("rowid")
+        )
+        with Session(self.db_service.engine) as session:
+            return session.execute(statement).scalar()
+
+    def invalidate(self, billing_account_numbers: Iterable[str]) -> None:
+        """
+        This method removes the cached PDF invoices of billing account numbers whose transactions
+        have changed, so that the next download renders them again.
+
+        Args:
+            billing_account_numbers (Iterable[str]): The billing account numbers.
+        """
+        for billing_account_number in billing_account_numbers:
+            try:
+                os.remove(self.invoice_path(billing_account_number))
+            except FileNotFoundError:
+                pass
+
+
+class _RenderLock:
+    """
+    This class is the lock of the renders of one billing account number, with the number of
+    requests holding it or waiting for it.
+    """
+
+    def __init__(self) -> None:
+        self.lock: asyncio.Lock = asyncio.Lock()
+        self.users: int = 0
+
+
+def _latest_transaction_statement(billing_account_number: str, *columns):
+    # The SQLite rowid follows insertion order, so the highest one is the latest transaction
+    return (
+        select(*columns)
+        .where(
+            MobileDataPurchaseTransaction.billing_account_number
+            == billing_account_number
+        )
+        .order_by(literal_column("rowid").desc())
+        .limit(1)
+    )
+
+
+def invoice_etag(invoice_path: str) -> str:
+    """
+    This function returns the quoted ETag of a PDF invoice, derived from its size and modification
+    time so it changes whenever the invoice is rendered again.
+
+    Args:
+        invoice_path (str): The path of the PDF invoice.
+    """
+    stat_result: os.stat_result = os.stat(invoice_path)
+    etag_base: str = f"{stat_result.st_mtime_ns}-{stat_result.st_size}"
+    return f'"{hashlib.md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    This function checks an If-None-Match request header against an ETag, using the weak
+    comparison HTTP requires for If-None-Match.
+
+    Args:
+        if_none_match (Optional[str]): The If-None-Match header, if any.
+        etag (str): The quoted ETag of the current representation.
+    """
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
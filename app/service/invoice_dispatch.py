@@ -0,0 +1,76 @@
+"""
+This module contains the dispatch_invoices function, which hands the PDF invoices of a recorded
+batch of sell orders to whichever invoice backend is configured: the invoice job queue, the
+on-demand invoice cache, the parallel invoice renderer or the invoice generator itself.
+"""
+
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Optional
+from app.model.invoice_render_result import InvoiceRenderResult
+from app.model.sell_order_batch import SellOrderBatch
+from app.service.invoice_cache import InvoiceCache
+from app.service.invoice_job_queue import InvoiceJobQueue
+from app.service.parallel_invoice_renderer import ParallelInvoiceRenderer
+from app.service.stage_executor import INVOICE_STAGE, StageExecutor, run_stage
+
+if TYPE_CHECKING:
+    from app.service.invoice_generator import InvoiceGenerator
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+async def dispatch_invoices(
+    batch: SellOrderBatch,
+    invoice_generator: "InvoiceGenerator",
+    executor: Optional[StageExecutor] = None,
+    invoice_renderer: Optional[ParallelInvoiceRenderer] = None,
+    invoice_job_queue: Optional[InvoiceJobQueue] = None,
+    invoice_cache: Optional[InvoiceCache] = None,
+) -> Optional[list[InvoiceRenderResult]]:
+    """
+    This function generates the PDF invoices of a recorded batch, lets the queue workers know
+    about its invoice jobs, or leaves its invoices to be rendered on demand. The invoice job queue
+    is used if provided, then the invoice cache, then the invoice renderer, and the invoice
+    generator otherwise. It returns the outcome of every invoice generated, in batch order, or
+    None if the invoices are left to the queue workers or to the invoice cache.
+
+    Args:
+        batch (SellOrderBatch): The validated and recorded batch of sell orders.
+        invoice_generator (InvoiceGenerator): The invoice generator for generating PDF invoices.
+        executor (StageExecutor, optional): The executor the invoice stage is dispatched to.
+        invoice_renderer (ParallelInvoiceRenderer, optional): The process pool that renders the
+            PDF invoices.
+        invoice_job_queue (InvoiceJobQueue, optional): The queue the invoice jobs of the batch
+            were committed to.
+        invoice_cache (InvoiceCache, optional): The cache of invoices rendered on demand; the
+            cached invoices of the recorded BANs are removed.
+    """
+    if invoice_job_queue is not None:
+        invoice_job_queue.notify()
+        return None
+    if invoice_cache is not None:
+        await asyncio.to_thread(
+            invoice_cache.invalidate, batch.billing_account_number.tolist()
+        )
+        return None
+
+    invoice_results: list[InvoiceRenderResult]
+    if invoice_renderer is not None:
+        invoice_results = await invoice_renderer.render_batch_async(batch)
+    else:
+        invoice_results = await run_stage(
+            executor,
+            INVOICE_STAGE,
+            invoice_generator.generate_pdf_invoice_batch,
+            batch,
+        )
+    for invoice_result in invoice_results:
+        if not invoice_result.success:
+            logger.error(
+                "Failed to generate the PDF invoice for BAN %s: %s",
+                invoice_result.billing_account_number,
+                invoice_result.error,
+            )
+    return invoice_results
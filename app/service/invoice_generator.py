@@ -3,16 +3,23 @@ This module contains the functions for generating invoices. It includes a functi
 QR code, a function for rendering an HTML invoice, and a function for generating a PDF invoice.
 """
 
+import contextlib
 import os
 import datetime
-import base64
-import io
 import logging
-from jinja2 import Environment, Template
-from weasyprint import HTML  # type: ignore
+import threading
+import time
+import uuid
+from jinja2 import Environment, FileSystemLoader, Template
+from weasyprint import CSS, HTML  # type: ignore
+from weasyprint.document import Document  # type: ignore
+from weasyprint.text.fonts import FontConfiguration  # type: ignore
 from app.model.mobile_data_sell_order import MobileDataSellOrder
+from app.model.sell_order_batch import SellOrderBatch
+from app.model.invoice_render_result import InvoiceRenderResult
+from app.service.qr_code_encoder import PNG_FORMAT, QRCodeEncoder
 import qrcode  # type: ignore
-from typing import Callable
+from typing import Callable, Iterable, NamedTuple, Optional, Sequence
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -26,6 +33,35 @@ logging.getLogger("PIL").setLevel(logging.ERROR)
 
 # Change: Add params to docstring for both class instantiation and functions
 
+# Each invoice is laid out in its own WeasyPrint document and written to its own PDF
+SEPARATE_DOCUMENTS: str = "separate"
+# The invoices of a batch are laid out in one document whose pages are split into per-BAN PDFs
+SPLIT_DOCUMENT: str = "split"
+# The invoices of a batch are laid out in one document, split into per-BAN PDFs and also written as
+# one combined statement PDF
+STATEMENT_DOCUMENT: str = "statement"
+INVOICE_DOCUMENT_MODES: tuple[str, ...] = (
+    SEPARATE_DOCUMENTS,
+    SPLIT_DOCUMENT,
+    STATEMENT_DOCUMENT,
+)
+# Stylesheet shipped next to the invoice template in the template directory
+DEFAULT_INVOICE_STYLESHEET: str = "invoice_template.css"
+# Statement names start with their creation time, so sorting them sorts them by age
+STATEMENT_FILE_PREFIX: str = "statement_"
+
+
+class InvoiceRenderingContext(NamedTuple):
+    """
+    This class holds the WeasyPrint state that is reused across the invoices rendered by one thread:
+    the pre-parsed stylesheets, the font configuration that keeps their @font-face fonts loaded,
+    and the cache of decoded images.
+    """
+
+    stylesheets: list[CSS]
+    font_config: FontConfiguration
+    image_cache: dict
+
 
 class InvoiceGenerator:
     """
@@ -37,9 +73,19 @@ class InvoiceGenerator:
         pdf_output_path (str): The path to the output directory for the generated PDF invoices.
         qr_code_base_url (str): The base URL for generating QR codes.
         qr_code_template (qrcode.QRCode): The QR code template for generating QR codes.
+        qr_code_version (Optional[int]): The smallest version of the generated QR codes, or None
+            to start from version 1.
         html_template (str): The HTML template for rendering the invoice.
         html_template_environment (Environment): The Jinja2 environment for rendering the HTML template.
         html_factory (Callable[[str], HTML]): A callable factory for creating HTML objects from strings.
+        stylesheet (str): The file name of the invoice stylesheet in the template directory.
+        qr_code_encoder (QRCodeEncoder): The encoder of the QR codes, built from the QR code template,
+            image format and cache size.
+        invoice_template (Template): The HTML template, compiled once when the generator is built.
+        document_mode (str): How the invoices of a batch are laid out and written, one of
+            "separate", "split" or "statement".
+        statement_retention (int): The number of combined statement PDFs kept in the output
+            directory in the "statement" document mode; older statements are deleted.
     """
 
     def __init__(
@@ -51,7 +97,18 @@ class InvoiceGenerator:
         html_template: str,
         html_template_environment: Environment,
         html_factory: Callable[[str], HTML] = HTML,
+        qr_code_format: str = PNG_FORMAT,
+        qr_code_cache_size: Optional[int] = 1024,
+        qr_code_version: Optional[int] = None,
+        stylesheet: str = DEFAULT_INVOICE_STYLESHEET,
+        document_mode: str = SEPARATE_DOCUMENTS,
+        statement_retention: int = 100,
     ) -> None:
+        if document_mode not in INVOICE_DOCUMENT_MODES:
+            raise ValueError(f"Unknown invoice document mode {document_mode!r}")
+        if statement_retention < 1:
+            raise ValueError("statement_retention must be at least 1")
+
         self.invoice_template_path: str = invoice_template_path
         self.pdf_output_path: str = pdf_output_path
         self.qr_code_base_url: str = qr_code_base_url
@@ -59,6 +116,45 @@ class InvoiceGenerator:
         self.html_template = html_template
         self.html_template_environment: Environment = html_template_environment
         self.html_factory: Callable[[str], HTML] = html_factory
+        self.qr_code_encoder: QRCodeEncoder = QRCodeEncoder(
+            qr_code_base_url=qr_code_base_url,
+            qr_code_template=qr_code_template,
+            image_format=qr_code_format,
+            cache_size=qr_code_cache_size,
+            qr_code_version=qr_code_version,
+        )
+        self.stylesheet: str = stylesheet
+        self.invoice_template: Template = html_template_environment.get_template(
+            html_template
+        )
+        # WeasyPrint objects are not shared between threads, so each rendering thread builds its
+        # own context on first use and keeps it for the following invoices
+        self._thread_local: threading.local = threading.local()
+        self.document_mode: str = document_mode
+        self.statement_retention: int = statement_retention
+
+    def rendering_context(self) -> InvoiceRenderingContext:
+        """
+        This function returns the rendering context of the calling thread, parsing the stylesheet
+        and loading its fonts the first time the thread renders an invoice.
+        """
+        context: Optional[InvoiceRenderingContext] = getattr(
+            self._thread_local, "context", None
+        )
+        if context is None:
+            logger.info("Building the invoice rendering context")
+            font_config: FontConfiguration = FontConfiguration()
+            stylesheets: list[CSS] = [
+                CSS(
+                    filename=os.path.join(self.invoice_template_path, self.stylesheet),
+                    font_config=font_config,
+                )
+            ]
+            context = InvoiceRenderingContext(
+                stylesheets=stylesheets, font_config=font_config, image_cache={}
+            )
+            self._thread_local.context = context
+        return context
 
     def generate_pdf_invoices(
         self,
@@ -78,13 +174,174 @@ class InvoiceGenerator:
             )
             self._generate_pdf_invoice(sell_order)
 
+    def generate_pdf_invoice(self, sell_order: "MobileDataSellOrder") -> str:
+        """
+        This function generates the PDF invoice of a single sell order in its own document,
+        whatever the document mode, and returns the path of the PDF file.
+
+        Args:
+            sell_order (MobileDataSellOrder): The mobile data sell order to generate the invoice for.
+        """
+        logger.info(
+            f"Generating a PDF invoice for BAN {sell_order.billing_account_number}"
+        )
+        return self._generate_pdf_invoice(sell_order)
+
+    def generate_pdf_invoice_batch(
+        self, batch: SellOrderBatch
+    ) -> list[InvoiceRenderResult]:
+        """
+        This function generates PDF invoices for a columnar batch of sell orders and reports the
+        outcome of each one, in batch order. In the "separate" document mode each row is only
+        turned into a MobileDataSellOrder while its own invoice is being rendered.
+
+        Args:
+            batch (SellOrderBatch): The validated batch of sell orders.
+        """
+        return self.generate_pdf_invoice_results(batch.iter_sell_orders())
+
+    def generate_pdf_invoice_results(
+        self, sell_orders: Iterable["MobileDataSellOrder"]
+    ) -> list[InvoiceRenderResult]:
+        """
+        This function generates PDF invoices for sell orders and reports the outcome of each one.
+        A failed invoice does not stop the remaining invoices from being generated. Outside of
+        the "separate" document mode the invoices are laid out in a single pass, and if that pass
+        fails they are generated one by one so that only the faulty invoices fail.
+
+        Args:
+            sell_orders (Iterable[MobileDataSellOrder]): The mobile data sell orders.
+        """
+        if self.document_mode != SEPARATE_DOCUMENTS:
+            sell_orders = list(sell_orders)
+            try:
+                output_paths: list[str] = self.generate_pdf_invoices_single_pass(
+                    sell_orders
+                )
+            except Exception:
+                logger.exception(
+                    f"Failed to generate {len(sell_orders)} PDF invoices in a single pass, "
+                    "generating them one by one"
+                )
+            else:
+                return [
+                    InvoiceRenderResult(
+                        billing_account_number=sell_order.billing_account_number,
+                        success=True,
+                        output_path=output_path,
+                    )
+                    for sell_order, output_path in zip(sell_orders, output_paths)
+                ]
+
+        results: list[InvoiceRenderResult] = []
+        for sell_order in sell_orders:
+            try:
+                output_path: str = self._generate_pdf_invoice(sell_order)
+            except Exception as error:
+                logger.exception(
+                    f"Failed to generate the PDF invoice for BAN {sell_order.billing_account_number}"
+                )
+                results.append(
+                    InvoiceRenderResult(
+                        billing_account_number=sell_order.billing_account_number,
+                        success=False,
+                        error=f"{type(error).__name__}: {error}",
+                    )
+                )
+            else:
+                results.append(
+                    InvoiceRenderResult(
+                        billing_account_number=sell_order.billing_account_number,
+                        success=True,
+                        output_path=output_path,
+                    )
+                )
+        return results
+
+    def generate_pdf_invoices_single_pass(
+        self, sell_orders: Sequence["MobileDataSellOrder"]
+    ) -> list[str]:
+        """
+        This function lays out the invoices of many sell orders in one WeasyPrint pass, one page
+        per order, and splits the pages into one PDF per billing account number. In the
+        "statement" document mode the whole document is also written as one combined statement
+        PDF. It returns the path of the per-BAN PDF of every order, so the invoices can be
+        downloaded and cached the same way in every document mode.
+
+        Args:
+            sell_orders (Sequence[MobileDataSellOrder]): The mobile data sell orders.
+        """
+        if not sell_orders:
+            return []
+        logger.info(f"Generating {len(sell_orders)} PDF invoices in a single pass")
+        document: Document = self.render_invoice_document(sell_orders)
+
+        if self.document_mode == STATEMENT_DOCUMENT:
+            self._write_statement(document)
+
+        output_paths: list[str] = []
+        for sell_order, pages in zip(
+            sell_orders, _invoice_page_ranges(document, len(sell_orders))
+        ):
+            output_path: str = os.path.join(
+                self.pdf_output_path,
+                f"invoice_{sell_order.billing_account_number}.pdf",
+            )
+            _write_pdf_atomically(document.copy(pages), output_path)
+            output_paths.append(output_path)
+        return output_paths
+
+    def _write_statement(self, document: Document) -> str:
+        """
+        This function writes a laid out document as a combined statement PDF and deletes the
+        oldest statements beyond statement_retention. It returns the path of the statement.
+
+        Args:
+            document (Document): The laid out document.
+        """
+        statement_path: str = os.path.join(
+            self.pdf_output_path,
+            f"{STATEMENT_FILE_PREFIX}{time.time_ns()}_{uuid.uuid4().hex}.pdf",
+        )
+        _write_pdf_atomically(document, statement_path)
+
+        statement_names: list[str] = sorted(
+            name
+            for name in os.listdir(self.pdf_output_path)
+            if name.startswith(STATEMENT_FILE_PREFIX) and name.endswith(".pdf")
+        )
+        for name in statement_names[: -self.statement_retention]:
+            # Another process may be pruning the same statements
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.pdf_output_path, name))
+        return statement_path
+
+    def render_invoice_document(
+        self, sell_orders: Sequence["MobileDataSellOrder"]
+    ) -> Document:
+        """
+        This function lays out the invoices of many sell orders as one WeasyPrint document, with
+        the stylesheets and fonts of the calling thread's rendering context.
+
+        Args:
+            sell_orders (Sequence[MobileDataSellOrder]): The mobile data sell orders.
+        """
+        html = self.html_factory(self._render_html_invoices(sell_orders))
+        context: InvoiceRenderingContext = self.rendering_context()
+        return html.render(
+            stylesheets=context.stylesheets,
+            font_config=context.font_config,
+            cache=context.image_cache,
+        )
+
     def _generate_pdf_invoice(
         self,
         sell_order: "MobileDataSellOrder",
-    ) -> None:
+    ) -> str:
         """
         This function generates a PDF invoice for a given mobile data sell order. It renders the
         invoice as an HTML string, writes the HTML to a PDF file, and saves the file to the ourput path.
+        It returns the path of the PDF file.
 
         Args:
             sell_order (MobileDataSellOrder): The mobile data sell order to generate the invoice for.
@@ -93,7 +350,15 @@ class InvoiceGenerator:
         filename: str = f"invoice_{sell_order.billing_account_number}.pdf"
         output_path: str = os.path.join(self.pdf_output_path, filename)
         html = self.html_factory(html_content)
-        html.write_pdf(target=output_path)
+        context: InvoiceRenderingContext = self.rendering_context()
+        _write_pdf_atomically(
+            html,
+            output_path,
+            stylesheets=context.stylesheets,
+            font_config=context.font_config,
+            cache=context.image_cache,
+        )
+        return output_path
 
     def _render_html_invoice(
         self,
@@ -107,13 +372,27 @@ class InvoiceGenerator:
             sell_order (MobileDataSellOrder): The mobile data sell order to generate the invoice for.
         """
         logger.info("Rendering the HTML invoice")
+        return self._render_html_invoices([sell_order])
 
-        invoice_template: Template = self.html_template_environment.get_template(
-            self.html_template
+    def _render_html_invoices(
+        self,
+        sell_orders: Sequence["MobileDataSellOrder"],
+    ) -> str:
+        """
+        This function renders one HTML document with a page for each of the sell orders. It returns
+        the rendered HTML as a string.
+
+        Args:
+            sell_orders (Sequence[MobileDataSellOrder]): The mobile data sell orders.
+        """
+        return self.invoice_template.render(
+            invoices=[self._invoice_data(sell_order) for sell_order in sell_orders]
         )
+
+    def _invoice_data(self, sell_order: "MobileDataSellOrder") -> dict:
         qr_code: str = self._generate_qr_code(sell_order.billing_account_number)
 
-        data: dict = {
+        return {
             "name": sell_order.name,
             "credit_card_number": sell_order.credit_card_number[:-8],
             "billing_account_number": sell_order.billing_account_number,
@@ -122,32 +401,118 @@ class InvoiceGenerator:
             "validation_errors": sell_order.validation_errors,
             "date": datetime.datetime.now().strftime("%Y-%m-%d"),
             "qr_code": qr_code,
+            "qr_code_mime_type": self.qr_code_encoder.mime_type,
         }
 
-        html_invoice: str = invoice_template.render(data)
-
-        return html_invoice
-
     def _generate_qr_code(self, billing_account_number: str) -> str:
         """
-        This function generates a QR code for a given billing account number. It generates the code,
-        adds the URL with the billing account number, and returns the base64 encoded string of the
-        qr code.
+        This function generates a QR code for a given billing account number. Each code is encoded
+        from a fresh QR code, so earlier invoices never add data to it, and codes are cached per
+        billing account number. It returns the base64 encoded string of the qr code.
 
         Args:
             billing_account_number (str): The billing account number to generate the QR code for.
         """
         logger.info("Generating a QR code for the billing account number")
-        url: str = f"{self.qr_code_base_url}/{billing_account_number}"
-        self.qr_code_template.add_data(url)
-        self.qr_code_template.make(fit=True)
+        return self.qr_code_encoder(billing_account_number)
+
 
-        img: qrcode.image.pil.PilImage = self.qr_code_template.make_image(
-            fill="black", back_color="white"
+def _write_pdf_atomically(source, output_path: str, **options) -> None:
+    """
+    This function writes the PDF of a WeasyPrint HTML or Document object to a temporary file and
+    then moves it to the output path, so a PDF that is being downloaded is never half written.
+
+    Args:
+        source (Union[HTML, Document]): The object whose write_pdf method produces the PDF.
+        output_path (str): The path of the PDF file.
+        **options: The options passed on to write_pdf.
+    """
+    temporary_path: str = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        source.write_pdf(target=temporary_path, **options)
+        os.replace(temporary_path, output_path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def _invoice_page_ranges(document: Document, invoice_count: int) -> list[list]:
+    """
+    This function finds the pages of every invoice in a document laid out from several invoices.
+    Each invoice starts on the page holding its "invoice-<index>" anchor and runs until the page
+    where the next invoice starts.
+
+    Args:
+        document (Document): The laid out document.
+        invoice_count (int): The number of invoices in the document.
+    """
+    first_pages: dict[int, int] = {}
+    for page_index, page in enumerate(document.pages):
+        for anchor in page.anchors:
+            if anchor.startswith("invoice-"):
+                first_pages.setdefault(int(anchor.removeprefix("invoice-")), page_index)
+
+    if len(first_pages) != invoice_count:
+        raise RuntimeError(
+            f"Found the pages of {len(first_pages)} of {invoice_count} invoices"
         )
 
-        buffer: io.BytesIO = io.BytesIO()
-        img.save(buffer, format="PNG")
-        qr_code_base64: str = base64.b64encode(buffer.getvalue()).decode("utf-8")
+    boundaries: list[int] = [first_pages[index] for index in range(invoice_count)]
+    boundaries.append(len(document.pages))
+    return [
+        document.pages[boundaries[index] : boundaries[index + 1]]
+        for index in range(invoice_count)
+    ]
+
+
+def build_invoice_generator(
+    invoice_template_path: str,
+    pdf_output_path: str,
+    qr_code_base_url: str,
+    html_template: str,
+    stylesheet: str = DEFAULT_INVOICE_STYLESHEET,
+    qr_code_format: str = PNG_FORMAT,
+    qr_code_cache_size: Optional[int] = 1024,
+    document_mode: str = SEPARATE_DOCUMENTS,
+    statement_retention: int = 100,
+) -> InvoiceGenerator:
+    """
+    This function builds an InvoiceGenerator with the application's QR code settings, Jinja2
+    environment and WeasyPrint HTML factory. It only takes plain settings, so a
+    functools.partial of it can be sent to worker processes that build their own generator.
 
-        return qr_code_base64
+    Args:
+        invoice_template_path (str): The path to the invoice template directory.
+        pdf_output_path (str): The path to the output directory for the generated PDF invoices.
+        qr_code_base_url (str): The base URL for generating QR codes.
+        html_template (str): The HTML template for rendering the invoice.
+        stylesheet (str): The file name of the invoice stylesheet in the template directory.
+        qr_code_format (str): The image format of the QR codes, "png" or "svg".
+        qr_code_cache_size (Optional[int]): The maximum number of cached QR codes, or None to
+            disable the cache.
+        document_mode (str): How the invoices of a batch are laid out and written, one of
+            "separate", "split" or "statement".
+        statement_retention (int): The number of combined statement PDFs kept in the
+            "statement" document mode.
+    """
+    return InvoiceGenerator(
+        invoice_template_path=invoice_template_path,
+        pdf_output_path=pdf_output_path,
+        qr_code_base_url=qr_code_base_url,
+        qr_code_template=qrcode.QRCode(
+            error_correction=qrcode.constants.ERROR_CORRECT_L,
+            box_size=5,
+            border=2,
+        ),
+        html_template=html_template,
+        html_template_environment=Environment(
+            loader=FileSystemLoader(invoice_template_path),
+        ),
+        html_factory=lambda s: HTML(string=s),
+        qr_code_format=qr_code_format,
+        qr_code_cache_size=qr_code_cache_size,
+        qr_code_version=1,
+        stylesheet=stylesheet,
+        document_mode=document_mode,
+        statement_retention=statement_retention,
+    )
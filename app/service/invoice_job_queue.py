@@ -0,0 +1,432 @@
+"""
+This module contains the InvoiceJobQueue class, which decouples PDF invoice generation from purchase
+requests. Requests only commit their transactions together with one InvoiceJob row per order, and a
+pool of background workers, started in the FastAPI lifespan, claims pending jobs from the database,
+renders their invoices and records the outcome of every job. A claimed job is leased to its worker,
+which keeps the lease alive while it renders, so several worker processes can share the table.
+"""
+
+import asyncio
+import contextlib
+import datetime
+import logging
+from typing import TYPE_CHECKING, Optional
+from sqlalchemy import and_, bindparam, or_, select, update
+from sqlalchemy.orm import Session
+from app.model.invoice_job import (
+    INVOICE_JOB_DONE,
+    INVOICE_JOB_FAILED,
+    INVOICE_JOB_PENDING,
+    INVOICE_JOB_RENDERING,
+    InvoiceJob,
+)
+from app.model.invoice_render_result import InvoiceRenderResult
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.model.mobile_data_sell_order import MobileDataSellOrder
+from app.model.sell_order_batch import SellOrderBatch
+from app.service.db_service import DataBaseService, transaction_to_sell_order
+from app.service.parallel_invoice_renderer import ParallelInvoiceRenderer
+from app.service.stage_executor import INVOICE_STAGE, StageExecutor, run_stage
+
+if TYPE_CHECKING:
+    from app.service.invoice_generator import InvoiceGenerator
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+class InvoiceJobQueue:
+    """
+    This class drains the InvoiceJob table with a pool of asyncio worker tasks. Each worker claims a
+    batch of pending jobs with a single UPDATE ... RETURNING statement, so no job is claimed twice,
+    renders the invoices on the invoice renderer or the stage executor, and marks every job as done,
+    or as pending again until it has failed max_attempts times.
+
+    A job being rendered is leased to its worker, which touches it every heartbeat_interval. A job
+    whose lease has not been touched for lease_timeout belongs to a worker that crashed or lost
+    its database updates, and is claimed again, so live jobs of other worker processes are never
+    taken over. The attempt count of a job fences off a worker whose lease was taken over: only
+    the worker of the latest attempt records the outcome.
+
+    Attributes:
+        db_service (DataBaseService): The database service whose synchronous engine holds the jobs.
+        invoice_generator (InvoiceGenerator): The generator that renders the invoices when there
+            is no invoice renderer.
+        invoice_renderer (Optional[ParallelInvoiceRenderer]): The process pool that renders the
+            invoices, if any.
+        executor (Optional[StageExecutor]): The executor the invoice stage is dispatched to when
+            there is no invoice renderer.
+        worker_count (int): The number of worker tasks.
+        batch_size (int): The maximum number of jobs a worker claims at a time.
+        poll_interval (float): The number of seconds an idle worker waits before polling again,
+            unless it is notified of new jobs first.
+        max_attempts (int): The number of failed attempts after which a job is marked as failed.
+        lease_timeout (float): The number of seconds after which a job being rendered whose lease
+            was not touched is claimed again.
+        heartbeat_interval (float): The number of seconds between two touches of the leases of the
+            jobs being rendered. It must be shorter than lease_timeout.
+    """
+
+    def __init__(
+        self,
+        db_service: DataBaseService,
+        invoice_generator: "InvoiceGenerator",
+        invoice_renderer: Optional[ParallelInvoiceRenderer] = None,
+        executor: Optional[StageExecutor] = None,
+        worker_count: int = 2,
+        batch_size: int = 16,
+        poll_interval: float = 1.0,
+        max_attempts: int = 3,
+        lease_timeout: float = 5 * 60,
+        heartbeat_interval: float = 30.0,
+    ) -> None:
+        if worker_count < 1:
+            raise ValueError("worker_count must be at least 1")
+        if batch_size < 1:
+            raise ValueError("batch_size must be at least 1")
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        if heartbeat_interval >= lease_timeout:
+            raise ValueError("heartbeat_interval must be shorter than lease_timeout")
+
+        self.db_service: DataBaseService = db_service
+        self.invoice_generator: "InvoiceGenerator" = invoice_generator
+        self.invoice_renderer: Optional[ParallelInvoiceRenderer] = invoice_renderer
+        self.executor: Optional[StageExecutor] = executor
+        self.worker_count: int = worker_count
+        self.batch_size: int = batch_size
+        self.poll_interval: float = poll_interval
+        self.max_attempts: int = max_attempts
+        self.lease_timeout: float = lease_timeout
+        self.heartbeat_interval: float = heartbeat_interval
+        self._workers: list[asyncio.Task] = []
+        # The attempt of every job being rendered by this process, keyed by job id
+        self._leased_jobs: dict[str, int] = {}
+        self._new_jobs: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        """
+        This method starts the worker tasks. Jobs that were being rendered when another process
+        stopped are claimed again once their lease expires. It is called when the FastAPI
+        application is started.
+        """
+        logger.info(f"Starting {self.worker_count} invoice queue workers")
+        self._new_jobs = asyncio.Event()
+        self._workers = [
+            asyncio.create_task(self._run_worker(), name=f"invoice-worker-{index}")
+            for index in range(self.worker_count)
+        ]
+
+    async def shutdown(self) -> None:
+        """
+        This method cancels the worker tasks and puts the jobs they were rendering back to
+        pending, so other processes do not wait for their leases to expire. It is called when the
+        FastAPI application is stopped.
+        """
+        logger.info("Shutting down the invoice queue workers")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._leased_jobs:
+            released_jobs: int = await asyncio.to_thread(
+                self.release_jobs, dict(self._leased_jobs)
+            )
+            logger.info(f"Released {released_jobs} interrupted invoice jobs")
+            self._leased_jobs.clear()
+
+    def notify(self) -> None:
+        """
+        This method wakes the idle workers up after new jobs have been committed.
+        """
+        if self._new_jobs is not None:
+            self._new_jobs.set()
+
+    async def process_next_batch(self) -> int:
+        """
+        This method claims a batch of pending jobs, renders their invoices and records the
+        outcome of every job. It returns the number of jobs claimed. Database calls run on a
+        thread so they never block the event loop.
+        """
+        jobs: list[InvoiceJob] = await asyncio.to_thread(
+            self.claim_jobs, self.batch_size
+        )
+        if not jobs:
+            return 0
+
+        leases: dict[str, int] = {job.id: job.attempts for job in jobs}  # type: ignore
+        self._leased_jobs.update(leases)
+        heartbeat: asyncio.Task = asyncio.create_task(self._keep_leased(leases))
+        try:
+            await self._process_jobs(jobs)
+        except Exception:
+            # The jobs are claimed again once their lease expires
+            self._forget_leases(leases)
+            raise
+        finally:
+            heartbeat.cancel()
+            # Unlike awaiting the heartbeat, waiting for it never swallows a cancellation of this
+            # task
+            await asyncio.wait([heartbeat])
+        # A cancelled batch keeps its leases, which shutdown releases
+        self._forget_leases(leases)
+        return len(jobs)
+
+    def _forget_leases(self, leases: dict[str, int]) -> None:
+        for job_id in leases:
+            self._leased_jobs.pop(job_id, None)
+
+    async def _process_jobs(self, jobs: list[InvoiceJob]) -> None:
+        sell_orders: dict[str, MobileDataSellOrder] = await asyncio.to_thread(
+            self.load_sell_orders, jobs
+        )
+        orphaned_jobs: list[InvoiceJob] = [
+            job for job in jobs if job.transaction_id not in sell_orders
+        ]
+        renderable_jobs: list[InvoiceJob] = [
+            job for job in jobs if job.transaction_id in sell_orders
+        ]
+
+        results: list[InvoiceRenderResult] = [
+            InvoiceRenderResult(
+                billing_account_number=job.billing_account_number,
+                success=False,
+                error="The transaction of the invoice job does not exist",
+            )
+            for job in orphaned_jobs
+        ]
+        try:
+            results += await self._render(
+                [sell_orders[job.transaction_id] for job in renderable_jobs]
+            )
+        except Exception as error:
+            logger.exception(f"Failed to render {len(renderable_jobs)} invoice jobs")
+            results += [
+                InvoiceRenderResult(
+                    billing_account_number=job.billing_account_number,
+                    success=False,
+                    error=f"{type(error).__name__}: {error}",
+                )
+                for job in renderable_jobs
+            ]
+
+        await asyncio.to_thread(
+            self.complete_jobs, orphaned_jobs + renderable_jobs, results
+        )
+
+    def claim_jobs(self, limit: int) -> list[InvoiceJob]:
+        """
+        This method marks up to limit of the oldest pending jobs, and of the jobs whose lease has
+        expired, as being rendered, counts the attempt, and returns them. Jobs whose lease expired
+        on their last attempt are marked as failed instead.
+
+        Args:
+            limit (int): The maximum number of jobs to claim.
+        """
+        now: datetime.datetime = datetime.datetime.now()
+        lease_expired = and_(
+            InvoiceJob.status == INVOICE_JOB_RENDERING,  # type: ignore
+            InvoiceJob.updated_at  # type: ignore
+            < now - datetime.timedelta(seconds=self.lease_timeout),
+        )
+        abandoned_jobs_statement = (
+            update(InvoiceJob)
+            .where(lease_expired)
+            .where(InvoiceJob.attempts >= self.max_attempts)  # type: ignore
+            .values(
+                status=INVOICE_JOB_FAILED,
+                error="The invoice job was abandoned by its worker",
+                updated_at=now,
+            )
+        )
+        claimable_job_ids = (
+            select(InvoiceJob.id)
+            .where(or_(InvoiceJob.status == INVOICE_JOB_PENDING, lease_expired))
+            .order_by(InvoiceJob.created_at)
+            .limit(limit)
+        )
+        statement = (
+            update(InvoiceJob)
+            .where(InvoiceJob.id.in_(claimable_job_ids))  # type: ignore
+            .values(
+                status=INVOICE_JOB_RENDERING,
+                attempts=InvoiceJob.attempts + 1,
+                updated_at=now,
+            )
+            .returning(InvoiceJob)
+        )
+        with Session(self.db_service.engine, expire_on_commit=False) as session:
+            abandoned_jobs: int = session.execute(abandoned_jobs_statement).rowcount  # type: ignore
+            if abandoned_jobs:
+                logger.error(f"Gave up on {abandoned_jobs} abandoned invoice jobs")
+            jobs: list[InvoiceJob] = list(session.scalars(statement).all())
+            session.commit()
+        return jobs
+
+    def renew_leases(self, leases: dict[str, int]) -> int:
+        """
+        This method touches the jobs this worker is rendering, so their leases do not expire. It
+        returns the number of jobs whose lease is still held.
+
+        Args:
+            leases (dict[str, int]): The attempt of every leased job, keyed by job id.
+        """
+        return self._update_leased_jobs(leases, {"updated_at": datetime.datetime.now()})
+
+    def release_jobs(self, leases: dict[str, int]) -> int:
+        """
+        This method puts jobs this worker will not finish back to pending. It returns the number
+        of jobs released.
+
+        Args:
+            leases (dict[str, int]): The attempt of every leased job, keyed by job id.
+        """
+        return self._update_leased_jobs(
+            leases,
+            {"status": INVOICE_JOB_PENDING, "updated_at": datetime.datetime.now()},
+        )
+
+    def _update_leased_jobs(self, leases: dict[str, int], values: dict) -> int:
+        statement = (
+            update(InvoiceJob)
+            .where(InvoiceJob.id == bindparam("leased_job_id"))  # type: ignore
+            .where(InvoiceJob.attempts == bindparam("leased_attempts"))  # type: ignore
+            .where(InvoiceJob.status == INVOICE_JOB_RENDERING)  # type: ignore
+            .values(**values)
+        )
+        with Session(self.db_service.engine) as session:
+            updated_jobs: int = (
+                session.connection()
+                .execute(
+                    statement,
+                    [
+                        {"leased_job_id": job_id, "leased_attempts": attempts}
+                        for job_id, attempts in leases.items()
+                    ],
+                )
+                .rowcount
+            )
+            session.commit()
+        return updated_jobs
+
+    def load_sell_orders(
+        self, jobs: list[InvoiceJob]
+    ) -> dict[str, MobileDataSellOrder]:
+        """
+        This method loads the recorded transactions of jobs and returns them as sell orders, keyed
+        by transaction id.
+
+        Args:
+            jobs (list[InvoiceJob]): The claimed jobs.
+        """
+        statement = select(MobileDataPurchaseTransaction).where(
+            MobileDataPurchaseTransaction.id.in_(  # type: ignore
+                [job.transaction_id for job in jobs]
+            )
+        )
+        with Session(self.db_service.engine) as session:
+            return {
+                transaction.id: transaction_to_sell_order(transaction)  # type: ignore
+                for transaction in session.scalars(statement)
+            }
+
+    def complete_jobs(
+        self, jobs: list[InvoiceJob], results: list[InvoiceRenderResult]
+    ) -> None:
+        """
+        This method records the outcome of rendered jobs whose lease is still held. A failed job
+        goes back to pending until it has been attempted max_attempts times.
+
+        Args:
+            jobs (list[InvoiceJob]): The rendered jobs.
+            results (list[InvoiceRenderResult]): The outcome of every job, in the same order.
+        """
+        now: datetime.datetime = datetime.datetime.now()
+        updates: list[dict] = []
+        for job, result in zip(jobs, results):
+            if result.success:
+                status: str = INVOICE_JOB_DONE
+            elif job.attempts >= self.max_attempts:
+                status = INVOICE_JOB_FAILED
+                logger.error(
+                    f"Giving up on the invoice of BAN {job.billing_account_number} after "
+                    f"{job.attempts} attempts: {result.error}"
+                )
+            else:
+                status = INVOICE_JOB_PENDING
+            updates.append(
+                {
+                    "leased_job_id": job.id,
+                    "leased_attempts": job.attempts,
+                    "status": status,
+                    "output_path": result.output_path,
+                    "error": result.error,
+                    "updated_at": now,
+                }
+            )
+
+        # A job whose lease was taken over by another worker is left to that worker
+        statement = (
+            update(InvoiceJob)
+            .where(InvoiceJob.id == bindparam("leased_job_id"))  # type: ignore
+            .where(InvoiceJob.attempts == bindparam("leased_attempts"))  # type: ignore
+            .where(InvoiceJob.status == INVOICE_JOB_RENDERING)  # type: ignore
+        )
+        with Session(self.db_service.engine) as session:
+            session.connection().execute(statement, updates)
+            session.commit()
+
+    def get_jobs(self, billing_account_number: str) -> list[InvoiceJob]:
+        """
+        This method returns the invoice jobs of a billing account number, oldest first.
+
+        Args:
+            billing_account_number (str): The billing account number.
+        """
+        statement = (
+            select(InvoiceJob)
+            .where(InvoiceJob.billing_account_number == billing_account_number)
+            .order_by(InvoiceJob.created_at)
+        )
+        with Session(self.db_service.engine) as session:
+            return list(session.scalars(statement).all())
+
+    async def _run_worker(self) -> None:
+        while True:
+            try:
+                claimed_jobs: int = await self.process_next_batch()
+            except Exception:
+                logger.exception("The invoice queue worker failed to process a batch")
+                claimed_jobs = 0
+
+            if claimed_jobs == 0:
+                self._new_jobs.clear()  # type: ignore
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(
+                        self._new_jobs.wait(), self.poll_interval  # type: ignore
+                    )
+
+    async def _keep_leased(self, leases: dict[str, int]) -> None:
+        # A long render would otherwise lose its jobs to another worker after lease_timeout
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await asyncio.to_thread(self.renew_leases, leases)
+            except Exception as error:
+                logger.warning(f"Failed to renew the leases of invoice jobs: {error}")
+
+    async def _render(
+        self, sell_orders: list[MobileDataSellOrder]
+    ) -> list[InvoiceRenderResult]:
+        if not sell_orders:
+            return []
+        if self.invoice_renderer is not None:
+            return await self.invoice_renderer.render_batch_async(
+                SellOrderBatch.from_sell_orders(sell_orders)
+            )
+        return await run_stage(
+            self.executor,
+            INVOICE_STAGE,
+            self.invoice_generator.generate_pdf_invoice_results,
+            sell_orders,
+        )
@@ -0,0 +1,137 @@
+"""
+This module contains the ParallelInvoiceRenderer class, which spreads PDF invoice rendering over a
+pool of worker processes. Each worker builds its own InvoiceGenerator once, when it starts, and then
+renders chunks of orders sent to it as columnar SellOrderBatch slices to keep IPC overhead low.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable, Optional
+from app.model.invoice_render_result import InvoiceRenderResult
+from app.model.sell_order_batch import SellOrderBatch
+
+if TYPE_CHECKING:
+    from app.service.invoice_generator import InvoiceGenerator
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+# The invoice generator of the current worker process, built by _initialize_worker
+_worker_invoice_generator: Optional["InvoiceGenerator"] = None
+
+
+def _initialize_worker(generator_factory: Callable[[], "InvoiceGenerator"]) -> None:
+    """
+    This function builds the invoice generator of a worker process when the process starts.
+    """
+    global _worker_invoice_generator
+    _worker_invoice_generator = generator_factory()
+
+
+def _render_chunk(batch: SellOrderBatch) -> list[InvoiceRenderResult]:
+    """
+    This function renders the invoices of one chunk of orders in a worker process.
+    """
+    if _worker_invoice_generator is None:
+        raise RuntimeError("The invoice worker process has not been initialized")
+    return _worker_invoice_generator.generate_pdf_invoice_results(
+        batch.iter_sell_orders()
+    )
+
+
+class ParallelInvoiceRenderer:
+    """
+    This class renders PDF invoices on a pool of worker processes and returns the outcome of every
+    order, in order.
+
+    Attributes:
+        generator_factory (Callable[[], InvoiceGenerator]): A picklable callable that builds the
+            invoice generator of each worker, e.g. a functools.partial of build_invoice_generator.
+        max_workers (int): The number of worker processes.
+        chunk_size (int): The number of orders sent to a worker at a time.
+        start_method (str): The multiprocessing start method of the workers. "spawn" avoids
+            forking a server process that already runs threads.
+    """
+
+    def __init__(
+        self,
+        generator_factory: Callable[[], "InvoiceGenerator"],
+        max_workers: int,
+        chunk_size: int = 16,
+        start_method: str = "spawn",
+    ) -> None:
+        if max_workers < 1:
+            raise ValueError("max_workers must be at least 1")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+
+        self.generator_factory: Callable[[], "InvoiceGenerator"] = generator_factory
+        self.max_workers: int = max_workers
+        self.chunk_size: int = chunk_size
+        self.start_method: str = start_method
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self) -> None:
+        """
+        This method starts the worker pool. It is called when the FastAPI application is started.
+        """
+        logger.info(f"Starting {self.max_workers} invoice rendering processes")
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_initialize_worker,
+            initargs=(self.generator_factory,),
+        )
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        This method stops the worker pool. It is called when the FastAPI application is stopped.
+        """
+        if self._pool is not None:
+            logger.info("Shutting down the invoice rendering processes")
+            self._pool.shutdown(wait=wait)
+            self._pool = None
+
+    def render_batch(self, batch: SellOrderBatch) -> list[InvoiceRenderResult]:
+        """
+        This method renders the invoices of a batch on the worker pool and blocks until all of
+        them are done.
+
+        Args:
+            batch (SellOrderBatch): The validated batch of sell orders.
+        """
+        results: list[InvoiceRenderResult] = []
+        for chunk_results in self._submit_chunks(batch):
+            results.extend(chunk_results.result())
+        return results
+
+    async def render_batch_async(
+        self, batch: SellOrderBatch
+    ) -> list[InvoiceRenderResult]:
+        """
+        This method renders the invoices of a batch on the worker pool without blocking the event
+        loop.
+
+        Args:
+            batch (SellOrderBatch): The validated batch of sell orders.
+        """
+        chunk_results = await asyncio.gather(
+            *(asyncio.wrap_future(future) for future in self._submit_chunks(batch))
+        )
+        return [result for results in chunk_results for result in results]
+
+    def _submit_chunks(
+        self, batch: SellOrderBatch
+    ) -> list["Future[list[InvoiceRenderResult]]"]:
+        if self._pool is None:
+            raise RuntimeError("The invoice renderer has not been started")
+        logger.info(
+            f"Rendering {len(batch)} invoices in chunks of {self.chunk_size} "
+            f"on {self.max_workers} processes"
+        )
+        return [
+            self._pool.submit(_render_chunk, batch[start : start + self.chunk_size])
+            for start in range(0, len(batch), self.chunk_size)
+        ]
@@ -1,15 +1,26 @@
 """
 This module contains the functions that parse a CSV file into a list of MobileDataSellOrder objects.
+It also contains a streaming variant that decodes an upload incrementally and yields the orders in
+fixed-size chunks, so a large upload never has to be held in memory all at once.
 """
 
-from app.model.mobile_data_sell_order import MobileDataSellOrder
+from app.model.mobile_data_sell_order import (
+    InvalidSellOrderRowsError,
+    MobileDataSellOrder,
+    SellOrderParseError,
+)
+from app.model.sell_order_batch import SellOrderBatch
+from typing import AsyncIterable, AsyncIterator, Callable, Optional
+import codecs
+import collections
 import io
 import csv
 
 
 def parse_csv_content(content: bytes) -> list[MobileDataSellOrder]:
     """
-    This function parses the content of a CSV file into a list of MobileDataSellOrder objects
+    This function parses the content of a CSV file into a list of MobileDataSellOrder objects. It
+    raises an InvalidSellOrderRowsError listing every row that could not be parsed.
 
     Args:
         content (bytes): The content of the CSV file as bytes.
@@ -17,26 +28,209 @@ def parse_csv_content(content: bytes) -> list[MobileDataSellOrder]:
 
     parsed_rows: list[list[str]] = parse_text_from_binary(content)
 
-    mobile_data_sell_orders: list[MobileDataSellOrder] = []
+    mobile_data_sell_orders, parse_errors = (
+        MobileDataSellOrder.build_mobile_data_sell_orders_from_rows(parsed_rows)
+    )
 
-    for row in parsed_rows:
-        mobile_data_sell_order = (
-            MobileDataSellOrder.build_mobile_data_sell_order_from_list(row)
-        )
-        mobile_data_sell_orders.append(mobile_data_sell_order)
+    if parse_errors:
+        raise InvalidSellOrderRowsError(parse_errors)
 
     return mobile_data_sell_orders
 
 
 def parse_text_from_binary(content: bytes) -> list[list[str]]:
     """
-    This function parses the content of a CSV file into a list of lists of strings
+    This function parses the content of a CSV file into a list of lists of strings. Bytes that are
+    not valid UTF-8 are kept as lone surrogates, so only the rows containing them fail to parse.
 
     Args:
         content (bytes): The content of the CSV file as bytes.
     """
-    csv_text: io.StringIO = io.StringIO(content.decode("utf-8"))
+    csv_text: io.StringIO = io.StringIO(content.decode("utf-8", "surrogateescape"))
     reader: csv.reader = csv.reader(csv_text)  # type: ignore
     parsed_rows: list[list[str]] = list(reader)
 
     return parsed_rows
+
+
+async def stream_sell_orders(
+    byte_stream: AsyncIterable[bytes],
+    chunk_size: int,
+    on_parse_error: Optional[Callable[[SellOrderParseError], None]] = None,
+) -> AsyncIterator[list[MobileDataSellOrder]]:
+    """
+    This function parses a CSV upload as it arrives and yields lists of at most chunk_size
+    MobileDataSellOrder objects. Only the current chunk of rows and the undecoded tail of the
+    upload are kept in memory. Rows that cannot be parsed are passed to on_parse_error, or raise
+    an InvalidSellOrderRowsError if no callback is given.
+
+    Args:
+        byte_stream (AsyncIterable[bytes]): The raw CSV content, e.g. from Request.stream().
+        chunk_size (int): The maximum number of rows per yielded chunk.
+        on_parse_error (Callable[[SellOrderParseError], None], optional): Called for each row
+            that could not be parsed.
+    """
+    async for first_row_index, rows in stream_row_chunks(byte_stream, chunk_size):
+        sell_orders, parse_errors = (
+            MobileDataSellOrder.build_mobile_data_sell_orders_from_rows(
+                rows, first_row_index
+            )
+        )
+        _report_parse_errors(parse_errors, on_parse_error)
+        if sell_orders:
+            yield sell_orders
+
+
+async def stream_sell_order_batches(
+    byte_stream: AsyncIterable[bytes],
+    chunk_size: int,
+    on_parse_error: Optional[Callable[[SellOrderParseError], None]] = None,
+) -> AsyncIterator[SellOrderBatch]:
+    """
+    This function parses a CSV upload as it arrives and yields columnar SellOrderBatch objects of at
+    most chunk_size rows. Rows that cannot be parsed are reported as in stream_sell_orders.
+
+    Args:
+        byte_stream (AsyncIterable[bytes]): The raw CSV content, e.g. from Request.stream().
+        chunk_size (int): The maximum number of rows per yielded batch.
+        on_parse_error (Callable[[SellOrderParseError], None], optional): Called for each row
+            that could not be parsed.
+    """
+    async for first_row_index, rows in stream_row_chunks(byte_stream, chunk_size):
+        batch, parse_errors = SellOrderBatch.from_rows(rows, first_row_index)
+        _report_parse_errors(parse_errors, on_parse_error)
+        if len(batch):
+            yield batch
+
+
+async def stream_row_chunks(
+    byte_stream: AsyncIterable[bytes], chunk_size: int
+) -> AsyncIterator[tuple[int, list[list[str]]]]:
+    """
+    This function groups the rows of a CSV byte stream into chunks of chunk_size rows. It yields
+    the index of the first row of each chunk within the upload together with the chunk.
+
+    Args:
+        byte_stream (AsyncIterable[bytes]): The raw CSV content.
+        chunk_size (int): The number of rows per chunk; the last chunk may be smaller.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+
+    pending_rows: list[list[str]] = []
+    next_row_index: int = 0
+
+    async for rows in stream_rows_from_binary(byte_stream):
+        pending_rows.extend(rows)
+        while len(pending_rows) >= chunk_size:
+            chunk_rows = pending_rows[:chunk_size]
+            del pending_rows[:chunk_size]
+            yield next_row_index, chunk_rows
+            next_row_index += chunk_size
+
+    if pending_rows:
+        yield next_row_index, pending_rows
+
+
+def _report_parse_errors(
+    parse_errors: list[SellOrderParseError],
+    on_parse_error: Optional[Callable[[SellOrderParseError], None]],
+) -> None:
+    """
+    This function passes parse errors to the callback, or raises them if there is no callback.
+    """
+    if not parse_errors:
+        return
+    if on_parse_error is None:
+        raise InvalidSellOrderRowsError(parse_errors)
+    for parse_error in parse_errors:
+        on_parse_error(parse_error)
+
+
+class _IncompleteRecord(Exception):
+    """
+    This exception is raised by a _LineFeed that runs out of lines in the middle of a record.
+    """
+
+
+class _LineFeed:
+    """
+    This class is the line iterator of a persistent csv.reader fed with the lines of a byte stream
+    as they are decoded. It raises _IncompleteRecord instead of ending the input when it runs out
+    of lines before the upload is over, and remembers the lines of the current record so they can
+    be fed again once the rest of the record has arrived.
+    """
+
+    def __init__(self) -> None:
+        self.lines: collections.deque[str] = collections.deque()
+        self.record_lines: list[str] = []
+        self.closed: bool = False
+
+    def __iter__(self) -> "_LineFeed":
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            if self.closed:
+                raise StopIteration
+            raise _IncompleteRecord
+        line: str = self.lines.popleft()
+        self.record_lines.append(line)
+        return line
+
+    def read_records(self, reader) -> list[list[str]]:
+        """
+        This method reads every complete record of the fed lines. The lines of a record that is
+        still incomplete, e.g. a quoted field whose newline crosses a block boundary, stay queued.
+
+        Args:
+            reader: The csv.reader reading from this line feed.
+        """
+        rows: list[list[str]] = []
+        while self.lines:
+            self.record_lines = []
+            try:
+                rows.append(next(reader))
+            except _IncompleteRecord:
+                self.lines.extendleft(reversed(self.record_lines))
+                break
+            except StopIteration:
+                break
+        self.record_lines = []
+        return rows
+
+
+async def stream_rows_from_binary(
+    byte_stream: AsyncIterable[bytes],
+) -> AsyncIterator[list[list[str]]]:
+    """
+    This function incrementally decodes a CSV byte stream and yields the rows completed by each
+    received block. Multi-byte characters, lines and quoted fields split across blocks are carried
+    over to the next block, since all the lines go through one csv.reader. Bytes that are not valid
+    UTF-8 are kept as lone surrogates, so the rows containing them are reported as parse errors
+    instead of failing the rest of the upload.
+
+    Args:
+        byte_stream (AsyncIterable[bytes]): The raw CSV content.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")("surrogateescape")
+    line_feed: _LineFeed = _LineFeed()
+    reader = csv.reader(line_feed)
+    pending_line: str = ""
+
+    async for block in byte_stream:
+        lines: list[str] = (pending_line + decoder.decode(block)).split("\n")
+        pending_line = lines.pop()
+        if lines:
+            line_feed.lines.extend(line + "\n" for line in lines)
+            rows: list[list[str]] = line_feed.read_records(reader)
+            if rows:
+                yield rows
+
+    pending_line += decoder.decode(b"", final=True)
+    if pending_line:
+        line_feed.lines.append(pending_line)
+    line_feed.closed = True
+    rows = line_feed.read_records(reader)
+    if rows:
+        yield rows
@@ -0,0 +1,121 @@
+"""
+This module contains the QRCodeEncoder class, which turns billing account URLs into base64 encoded QR
+code images for the invoices. Every code is encoded with a fresh qrcode.QRCode built from the
+settings of a template, so no data is carried over from one code to the next, and the encoded
+images are kept in an optional bounded LRU cache keyed by billing account number.
+"""
+
+import base64
+import functools
+import io
+from typing import Callable, Optional
+import qrcode  # type: ignore
+import qrcode.image.svg  # type: ignore
+
+PNG_FORMAT: str = "png"
+SVG_FORMAT: str = "svg"
+
+QR_CODE_MIME_TYPES: dict[str, str] = {
+    PNG_FORMAT: "image/png",
+    SVG_FORMAT: "image/svg+xml",
+}
+
+
+class QRCodeEncoder:
+    """
+    This class encodes the QR code of a billing account number as a base64 string. The PNG format
+    renders the code with PIL, while the SVG format writes the code as a vector path and skips the
+    raster encode step entirely.
+
+    Attributes:
+        qr_code_base_url (str): The base URL the billing account number is appended to.
+        qr_code_template (qrcode.QRCode): The QR code whose error correction, box size, border
+            and mask pattern are used for every code. Data is never added to the template itself.
+        qr_code_version (Optional[int]): The smallest QR code version of every code, or None to
+            start from version 1. Each code grows past it as far as its URL needs.
+        image_format (str): The image format of the codes, "png" or "svg".
+        cache_size (Optional[int]): The maximum number of cached codes, or None to disable the
+            cache.
+    """
+
+    def __init__(
+        self,
+        qr_code_base_url: str,
+        qr_code_template: qrcode.QRCode,
+        image_format: str = PNG_FORMAT,
+        cache_size: Optional[int] = 1024,
+        qr_code_version: Optional[int] = None,
+    ) -> None:
+        if image_format not in QR_CODE_MIME_TYPES:
+            raise ValueError(f"Unknown QR code image format {image_format!r}")
+
+        self.qr_code_base_url: str = qr_code_base_url
+        self.qr_code_template: qrcode.QRCode = qr_code_template
+        self.qr_code_version: Optional[int] = qr_code_version
+        self.image_format: str = image_format
+        self.cache_size: Optional[int] = cache_size
+        self._encode: Callable[[str], str] = self._build_encode(cache_size)
+
+    @property
+    def mime_type(self) -> str:
+        """
+        This property returns the MIME type of the encoded images, for use in a data URI.
+        """
+        return QR_CODE_MIME_TYPES[self.image_format]
+
+    def _build_encode(self, cache_size: Optional[int]) -> Callable[[str], str]:
+        # functools.lru_cache is thread safe, so invoices can be rendered concurrently
+        if not cache_size:
+            return self._encode_qr_code
+        return functools.lru_cache(maxsize=cache_size)(self._encode_qr_code)
+
+    def __call__(self, billing_account_number: str) -> str:
+        """
+        This function returns the base64 encoded QR code image of a billing account number.
+
+        Args:
+            billing_account_number (str): The billing account number to generate the QR code for.
+        """
+        return self._encode(billing_account_number)
+
+    def cache_info(self) -> Optional[functools._CacheInfo]:
+        """
+        This function returns the hit and miss statistics of the cache, or None if the cache is
+        disabled.
+        """
+        cache_info = getattr(self._encode, "cache_info", None)
+        return cache_info() if cache_info is not None else None
+
+    def new_qr_code(self) -> qrcode.QRCode:
+        """
+        This function builds an empty QR code with the version of the encoder and the other
+        settings of the template.
+        """
+        return qrcode.QRCode(
+            version=self.qr_code_version,
+            error_correction=self.qr_code_template.error_correction,
+            box_size=self.qr_code_template.box_size,
+            border=self.qr_code_template.border,
+            image_factory=(
+                qrcode.image.svg.SvgPathImage
+                if self.image_format == SVG_FORMAT
+                else self.qr_code_template.image_factory
+            ),
+            mask_pattern=self.qr_code_template.mask_pattern,
+        )
+
+    def _encode_qr_code(self, billing_account_number: str) -> str:
+        qr_code: qrcode.QRCode = self.new_qr_code()
+        qr_code.add_data(f"{self.qr_code_base_url}/{billing_account_number}")
+        qr_code.make(fit=True)
+
+        if self.image_format == SVG_FORMAT:
+            image_bytes: bytes = qr_code.make_image().to_string()
+        else:
+            buffer: io.BytesIO = io.BytesIO()
+            qr_code.make_image(fill="black", back_color="white").save(
+                buffer, format="PNG"
+            )
+            image_bytes = buffer.getvalue()
+
+        return base64.b64encode(image_bytes).decode("utf-8")
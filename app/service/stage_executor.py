@@ -0,0 +1,152 @@
+"""
+This module contains the StageExecutor class, which runs the CPU-heavy stages of a purchase request
+(parsing, validation, recording and invoice generation) on a thread pool or a process pool so that
+the event loop stays free to serve other requests. Each stage has its own concurrency limit.
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Mapping, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+PARSE_STAGE: str = "parse"
+VALIDATE_STAGE: str = "validate"
+RECORD_STAGE: str = "record"
+INVOICE_STAGE: str = "invoice"
+
+THREAD_POOL: str = "thread"
+PROCESS_POOL: str = "process"
+
+T = TypeVar("T")
+
+
+class StageExecutor:
+    """
+    This class dispatches blocking stage functions to a thread pool or a process pool and lets the
+    caller await their results. Functions sent to the process pool, and their arguments, must be
+    picklable.
+
+    Attributes:
+        thread_workers (int): The number of threads in the thread pool.
+        process_workers (int): The number of processes in the process pool. No process pool is
+            created if this is 0.
+        stage_pools (Mapping[str, str]): The pool, "thread" or "process", of each stage. Stages
+            that are not listed run on the thread pool.
+        stage_concurrency (Mapping[str, int]): The maximum number of concurrent calls of each
+            stage. Stages that are not listed are only limited by the pool size.
+    """
+
+    def __init__(
+        self,
+        thread_workers: int,
+        process_workers: int = 0,
+        stage_pools: Optional[Mapping[str, str]] = None,
+        stage_concurrency: Optional[Mapping[str, int]] = None,
+    ) -> None:
+        self.thread_workers: int = thread_workers
+        self.process_workers: int = process_workers
+        self.stage_pools: dict[str, str] = dict(stage_pools or {})
+        self.stage_concurrency: dict[str, int] = dict(stage_concurrency or {})
+
+        for stage, pool in self.stage_pools.items():
+            if pool not in (THREAD_POOL, PROCESS_POOL):
+                raise ValueError(f"Unknown pool {pool!r} for stage {stage!r}")
+            if pool == PROCESS_POOL and process_workers < 1:
+                raise ValueError(
+                    f"Stage {stage!r} uses the process pool but process_workers is 0"
+                )
+
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._stage_semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def start(self) -> None:
+        """
+        This method creates the pools. It is called when the FastAPI application is started.
+        """
+        logger.info(
+            f"Starting the stage executor with {self.thread_workers} threads and "
+            f"{self.process_workers} processes"
+        )
+        self._thread_pool = ThreadPoolExecutor(
+            max_workers=self.thread_workers, thread_name_prefix="stage"
+        )
+        if self.process_workers > 0:
+            self._process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        This method shuts the pools down. It is called when the FastAPI application is stopped.
+        """
+        logger.info("Shutting down the stage executor")
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=wait)
+        self._thread_pool = None
+        self._process_pool = None
+        self._stage_semaphores = {}
+
+    async def run(self, stage: str, function: Callable[..., T], *args: Any) -> T:
+        """
+        This method runs a function on the pool of its stage, waiting first if the stage is at its
+        concurrency limit, and returns the function's result.
+
+        Args:
+            stage (str): The name of the stage, e.g. VALIDATE_STAGE.
+            function (Callable[..., T]): The blocking function to run.
+            *args (Any): The positional arguments of the function.
+        """
+        pool: Executor = self._pool_for(stage)
+        call: Callable[[], T] = functools.partial(function, *args)
+        loop = asyncio.get_running_loop()
+
+        semaphore: Optional[asyncio.Semaphore] = self._semaphore_for(stage)
+        if semaphore is None:
+            return await loop.run_in_executor(pool, call)
+        async with semaphore:
+            return await loop.run_in_executor(pool, call)
+
+    def _pool_for(self, stage: str) -> Executor:
+        pool: Optional[Executor] = (
+            self._process_pool
+            if self.stage_pools.get(stage) == PROCESS_POOL
+            else self._thread_pool
+        )
+        if pool is None:
+            raise RuntimeError("The stage executor has not been started")
+        return pool
+
+    def _semaphore_for(self, stage: str) -> Optional[asyncio.Semaphore]:
+        # Created on first use so the semaphore belongs to the running event loop
+        if stage not in self.stage_concurrency:
+            return None
+        if stage not in self._stage_semaphores:
+            self._stage_semaphores[stage] = asyncio.Semaphore(
+                self.stage_concurrency[stage]
+            )
+        return self._stage_semaphores[stage]
+
+
+async def run_stage(
+    executor: Optional[StageExecutor],
+    stage: str,
+    function: Callable[..., T],
+    *args: Any,
+) -> T:
+    """
+    This function runs a stage function on the executor, or directly on the event loop if there is
+    no executor.
+
+    Args:
+        executor (Optional[StageExecutor]): The executor, or None to run inline.
+        stage (str): The name of the stage, e.g. VALIDATE_STAGE.
+        function (Callable[..., T]): The blocking function to run.
+        *args (Any): The positional arguments of the function.
+    """
+    if executor is None:
+        return function(*args)
+    return await executor.run(stage, function, *args)
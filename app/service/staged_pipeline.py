@@ -0,0 +1,198 @@
+"""
+This module contains the StagedPipeline class, which runs the stages of a purchase request
+(parsing, validation, recording and invoice generation) concurrently over a stream of chunks.
+Chunks flow from one stage to the next through bounded asyncio queues, so a stage that falls behind
+holds back the stages before it instead of letting chunks pile up in memory, and the latency of a
+large upload approaches that of its slowest stage rather than the sum of all stages.
+"""
+
+import asyncio
+import contextlib
+import logging
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, NamedTuple
+from typing import Optional, Sequence
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+# Put on a queue once per worker of the next stage when no more chunks will follow
+_END_OF_STREAM: object = object()
+
+
+class PipelineStage(NamedTuple):
+    """
+    This class describes a stage of a StagedPipeline.
+
+    Attributes:
+        name (str): The name of the stage, e.g. VALIDATE_STAGE.
+        handler (Callable[[Any], Awaitable[Any]]): The coroutine function that turns a chunk into
+            the chunk handed to the next stage.
+        workers (int): The number of chunks the stage processes concurrently.
+    """
+
+    name: str
+    handler: Callable[[Any], Awaitable[Any]]
+    workers: int = 1
+
+
+class StagedPipeline:
+    """
+    This class runs a sequence of stages over a stream of chunks, each stage with its own workers
+    and a bounded input queue. The workers of a stage may finish their chunks out of order, but
+    every stage hands its chunks on in the order they were read, so each stage sees the chunks in
+    source order. The chunks coming out of the output stage are yielded, while the stages after it
+    keep processing them in the background.
+
+    Attributes:
+        stages (Sequence[PipelineStage]): The stages, in the order chunks flow through them.
+        queue_size (int): The maximum number of chunks waiting in front of each stage.
+        output_stage (str): The name of the stage whose chunks are yielded. Defaults to the last
+            stage.
+    """
+
+    def __init__(
+        self,
+        stages: Sequence[PipelineStage],
+        queue_size: int = 2,
+        output_stage: Optional[str] = None,
+    ) -> None:
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage")
+        if queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+        for stage in stages:
+            if stage.workers < 1:
+                raise ValueError(f"Stage {stage.name!r} needs at least one worker")
+
+        stage_names: list[str] = [stage.name for stage in stages]
+        if output_stage is not None and output_stage not in stage_names:
+            raise ValueError(f"Unknown output stage {output_stage!r}")
+
+        self.stages: list[PipelineStage] = list(stages)
+        self.queue_size: int = queue_size
+        self.output_stage: str = output_stage or stage_names[-1]
+
+    async def run(self, source: AsyncIterable[Any]) -> AsyncIterator[Any]:
+        """
+        This method feeds the chunks of source through the stages and yields the chunks coming
+        out of the output stage, in source order. It returns once every stage has processed every
+        chunk, and raises the first exception of any stage. Closing the iterator early cancels the
+        remaining work.
+
+        Args:
+            source (AsyncIterable[Any]): The chunks handed to the first stage.
+        """
+        queues: list[asyncio.Queue] = [
+            asyncio.Queue(maxsize=self.queue_size) for _ in self.stages
+        ]
+        output_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        remaining_workers: list[int] = [stage.workers for stage in self.stages]
+        handoffs: list[_Handoff] = [_Handoff() for _ in self.stages]
+
+        tasks: list[asyncio.Task] = [asyncio.create_task(self._feed(source, queues))]
+        for stage_index, stage in enumerate(self.stages):
+            tasks += [
+                asyncio.create_task(
+                    self._run_worker(
+                        stage_index, queues, output_queue, remaining_workers, handoffs
+                    ),
+                    name=f"pipeline-{stage.name}-{worker_index}",
+                )
+                for worker_index in range(stage.workers)
+            ]
+        all_done: asyncio.Future = asyncio.gather(*tasks)
+
+        try:
+            while True:
+                next_output: asyncio.Future = asyncio.ensure_future(output_queue.get())
+                await asyncio.wait(
+                    {next_output, all_done}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if all_done.done() and all_done.exception() is not None:
+                    next_output.cancel()
+                    raise all_done.exception()  # type: ignore
+
+                entry = await next_output
+                if entry is _END_OF_STREAM:
+                    break
+                _, chunk = entry
+                yield chunk
+
+            # The stages after the output stage may still be working on the last chunks
+            await all_done
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if not all_done.cancelled():
+                all_done.exception()
+
+    async def _feed(
+        self, source: AsyncIterable[Any], queues: list[asyncio.Queue]
+    ) -> None:
+        sequence: int = 0
+        async for chunk in source:
+            await queues[0].put((sequence, chunk))
+            sequence += 1
+        for _ in range(self.stages[0].workers):
+            await queues[0].put(_END_OF_STREAM)
+
+    async def _run_worker(
+        self,
+        stage_index: int,
+        queues: list[asyncio.Queue],
+        output_queue: asyncio.Queue,
+        remaining_workers: list[int],
+        handoffs: list["_Handoff"],
+    ) -> None:
+        stage: PipelineStage = self.stages[stage_index]
+        is_output_stage: bool = stage.name == self.output_stage
+        next_queue: Optional[asyncio.Queue] = (
+            queues[stage_index + 1] if stage_index + 1 < len(queues) else None
+        )
+
+        while (entry := await queues[stage_index].get()) is not _END_OF_STREAM:
+            sequence, chunk = entry
+            result: Any = await stage.handler(chunk)
+            async with handoffs[stage_index].turn(sequence):
+                if is_output_stage:
+                    await output_queue.put((sequence, result))
+                if next_queue is not None:
+                    await next_queue.put((sequence, result))
+
+        # The last worker of a stage to finish ends the stream for the stages after it
+        remaining_workers[stage_index] -= 1
+        if remaining_workers[stage_index] > 0:
+            return
+        if is_output_stage:
+            await output_queue.put(_END_OF_STREAM)
+        if next_queue is not None:
+            for _ in range(self.stages[stage_index + 1].workers):
+                await next_queue.put(_END_OF_STREAM)
+
+
+class _Handoff:
+    """
+    This class makes the workers of a stage hand their chunks on in sequence order. A worker that
+    finishes a chunk before the chunks ahead of it waits for its turn, so a stage never holds more
+    than one finished chunk per worker.
+    """
+
+    def __init__(self) -> None:
+        self.next_sequence: int = 0
+        self.condition: asyncio.Condition = asyncio.Condition()
+
+    @contextlib.asynccontextmanager
+    async def turn(self, sequence: int) -> AsyncIterator[None]:
+        """
+        This method waits until every chunk before sequence has been handed on, and hands the
+        turn to the next chunk when the block exits.
+
+        Args:
+            sequence (int): The position of the chunk in the source.
+        """
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.next_sequence == sequence)
+            yield
+            self.next_sequence += 1
+            self.condition.notify_all()
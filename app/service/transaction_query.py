@@ -0,0 +1,150 @@
+"""
+This module contains the TransactionQuery class, which reads the recorded
+MobileDataPurchaseTransaction rows by billing account number, status and creation date. Pages are
+read with keyset pagination on (created_at, rowid) through the secondary indexes of the table, so
+every page costs the same however deep into the results it is.
+"""
+
+import base64
+import datetime
+import json
+import logging
+from typing import NamedTuple, Optional
+from sqlalchemy import and_, literal_column, or_, select, tuple_
+from sqlalchemy.orm import Session
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.service.db_service import DataBaseService
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+class TransactionPage(NamedTuple):
+    """
+    This class represents a page of transactions.
+
+    Attributes:
+        transactions (list[MobileDataPurchaseTransaction]): The transactions of the page, oldest
+            first.
+        next_cursor (Optional[str]): The cursor of the next page, or None on the last page.
+    """
+
+    transactions: list[MobileDataPurchaseTransaction]
+    next_cursor: Optional[str]
+
+
+class TransactionQuery:
+    """
+    This class finds recorded transactions. Transactions recorded before the created_at column
+    existed have no creation date: they come first and never match a date range.
+
+    Attributes:
+        db_service (DataBaseService): The database service whose synchronous engine holds the
+            transactions.
+    """
+
+    def __init__(self, db_service: DataBaseService) -> None:
+        self.db_service: DataBaseService = db_service
+
+    def find_transactions(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        billing_account_number: Optional[str] = None,
+        status: Optional[str] = None,
+        created_from: Optional[datetime.datetime] = None,
+        created_to: Optional[datetime.datetime] = None,
+    ) -> TransactionPage:
+        """
+        This method returns a page of at most limit transactions matching every given filter,
+        ordered by creation date. It raises a ValueError if the cursor is invalid.
+
+        Args:
+            limit (int): The maximum number of transactions to return.
+            cursor (str, optional): The next_cursor of the previous page, or None for the first
+                page.
+            billing_account_number (str, optional): Only return the transactions of this billing
+                account number.
+            status (str, optional): Only return the transactions with this status, e.g. "Approved".
+            created_from (datetime.datetime, optional): Only return the transactions created at or
+                after this time.
+            created_to (datetime.datetime, optional): Only return the transactions created before
+                this time.
+        """
+        rowid = literal_column("rowid")
+        created_at = MobileDataPurchaseTransaction.created_at
+        statement = (
+            select(rowid, MobileDataPurchaseTransaction)
+            .order_by(created_at, rowid)
+            .limit(limit)
+        )
+        if billing_account_number is not None:
+            statement = statement.where(
+                MobileDataPurchaseTransaction.billing_account_number
+                == billing_account_number
+            )
+        if status is not None:
+            statement = statement.where(MobileDataPurchaseTransaction.status == status)
+        if created_from is not None:
+            statement = statement.where(created_at >= created_from)  # type: ignore
+        if created_to is not None:
+            statement = statement.where(created_at < created_to)  # type: ignore
+        if cursor is not None:
+            after_created_at, after_rowid = decode_cursor(cursor)
+            if after_created_at is None:
+                # NULL sorts first in SQLite and compares to nothing, so the undated
+                # transactions are paged by rowid alone
+                statement = statement.where(
+                    or_(
+                        and_(created_at.is_(None), rowid > after_rowid),  # type: ignore
+                        created_at.is_not(None),  # type: ignore
+                    )
+                )
+            else:
+                statement = statement.where(
+                    tuple_(created_at, rowid) > tuple_(after_created_at, after_rowid)
+                )
+
+        with Session(self.db_service.engine) as session:
+            rows: list = list(session.execute(statement))
+
+        transactions: list[MobileDataPurchaseTransaction] = [
+            transaction for _, transaction in rows
+        ]
+        next_cursor: Optional[str] = None
+        if len(rows) == limit:
+            last_rowid, last_transaction = rows[-1]
+            next_cursor = encode_cursor(last_transaction.created_at, last_rowid)
+        return TransactionPage(transactions, next_cursor)
+
+
+def encode_cursor(created_at: Optional[datetime.datetime], rowid: int) -> str:
+    """
+    This function encodes the keyset of the last transaction of a page into an opaque cursor.
+
+    Args:
+        created_at (Optional[datetime.datetime]): The creation date of the transaction.
+        rowid (int): The rowid of the transaction.
+    """
+    keyset: list = [created_at.isoformat() if created_at else None, rowid]
+    return base64.urlsafe_b64encode(json.dumps(keyset).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[Optional[datetime.datetime], int]:
+    """
+    This function decodes a cursor made by encode_cursor. It raises a ValueError if the cursor is
+    invalid.
+
+    Args:
+        cursor (str): The cursor.
+    """
+    try:
+        created_at, rowid = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(rowid, int):
+            raise TypeError("The rowid of a cursor must be an integer")
+        return (
+            datetime.datetime.fromisoformat(created_at) if created_at else None,
+            rowid,
+        )
+    except (TypeError, ValueError) as error:
+        raise ValueError(f"Invalid cursor: {cursor}") from error
@@ -0,0 +1,235 @@
+"""
+This module contains the WriteBehindWriter class, which group-commits the transactions of concurrent
+purchase requests. Requests hand their transaction rows to a single background task, started in
+the FastAPI lifespan, which collects the rows of every request and commits them together. Many
+small concurrent uploads then share one database transaction, and one fsync, instead of each
+paying for its own.
+"""
+
+import asyncio
+import logging
+from typing import NamedTuple, Optional, Union
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.model.invoice_job import InvoiceJob
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.service.db_service import DataBaseService
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.DEBUG)
+
+
+class PendingWrite(NamedTuple):
+    """
+    This class represents the transaction rows of one caller waiting to be committed.
+
+    Attributes:
+        rows (list[dict]): The MobileDataPurchaseTransaction column dictionaries.
+        enqueue_invoice_jobs (bool): Whether to insert a pending InvoiceJob per row.
+        future (asyncio.Future): The future resolved with the number of rows once they are
+            committed, or with the error of their commit.
+    """
+
+    rows: list[dict]
+    enqueue_invoice_jobs: bool
+    future: asyncio.Future
+
+
+class WriteBehindWriter:
+    """
+    This class commits the transaction rows of all callers from a single writer task. The writer
+    takes the first pending write, keeps collecting the writes that arrive within max_delay
+    seconds until it holds max_batch_rows rows, and commits them in one database transaction.
+    If a group fails, its writes are committed again one by one, so only the callers whose rows
+    cannot be written get the error. The rows of a write are never split into chunks, so they are
+    committed whole and their error is the database error itself, not a TransactionChunkError.
+
+    Attributes:
+        db_service (DataBaseService): The database service the rows are written through, with
+            an AsyncSession if its async engine is enabled.
+        max_batch_rows (int): The number of collected rows after which a group is committed at
+            once.
+        max_delay (float): The number of seconds the writer waits for more writes after the first
+            write of a group.
+    """
+
+    def __init__(
+        self,
+        db_service: DataBaseService,
+        max_batch_rows: int = 5000,
+        max_delay: float = 0.01,
+    ) -> None:
+        if max_batch_rows < 1:
+            raise ValueError("max_batch_rows must be at least 1")
+        if max_delay < 0:
+            raise ValueError("max_delay must not be negative")
+
+        self.db_service: DataBaseService = db_service
+        self.max_batch_rows: int = max_batch_rows
+        self.max_delay: float = max_delay
+        self._pending_writes: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+        This method starts the writer task. It is called when the FastAPI application is started.
+        """
+        logger.info("Starting the write-behind transaction writer")
+        self._pending_writes = asyncio.Queue()
+        self._writer = asyncio.create_task(self._run(), name="write-behind-writer")
+
+    async def shutdown(self) -> None:
+        """
+        This method commits the writes already handed to the writer and stops the writer task.
+        It is called when the FastAPI application is stopped.
+        """
+        if self._writer is None:
+            return
+        logger.info("Shutting down the write-behind transaction writer")
+        writer: asyncio.Task = self._writer
+        self._writer = None
+        # The writer commits everything queued before the sentinel, then stops
+        self._pending_writes.put_nowait(None)  # type: ignore
+        await writer
+
+    async def write(self, rows: list[dict], enqueue_invoice_jobs: bool = False) -> int:
+        """
+        This method hands transaction rows to the writer and waits until they are committed, so
+        they are as durable as the synchronous PRAGMA of the database makes a commit. It returns
+        the number of rows written, and raises the error of their commit if they could not be
+        written. Rows whose caller is cancelled before the writer takes them are not written.
+
+        Args:
+            rows (list[dict]): The MobileDataPurchaseTransaction column dictionaries.
+            enqueue_invoice_jobs (bool): Whether to insert a pending InvoiceJob per row in the
+                same database transaction.
+        """
+        if self._writer is None:
+            raise RuntimeError("The write-behind writer is not running")
+        if not rows:
+            return 0
+
+        future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._pending_writes.put_nowait(  # type: ignore
+            PendingWrite(rows, enqueue_invoice_jobs, future)
+        )
+        return await future
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping: bool = False
+        while not stopping:
+            first_write: Optional[PendingWrite] = await self._pending_writes.get()  # type: ignore
+            if first_write is None:
+                break
+
+            group: list[PendingWrite] = [first_write]
+            row_count: int = len(first_write.rows)
+            deadline: float = loop.time() + self.max_delay
+            while row_count < self.max_batch_rows:
+                pending_write: Optional[PendingWrite]
+                try:
+                    pending_write = self._pending_writes.get_nowait()  # type: ignore
+                except asyncio.QueueEmpty:
+                    remaining: float = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        pending_write = await asyncio.wait_for(
+                            self._pending_writes.get(), remaining  # type: ignore
+                        )
+                    except asyncio.TimeoutError:
+                        break
+                if pending_write is None:
+                    stopping = True
+                    break
+                group.append(pending_write)
+                row_count += len(pending_write.rows)
+
+            await self._commit_group(group)
+
+    async def _commit_group(self, group: list[PendingWrite]) -> None:
+        # Callers cancelled while their rows were waiting no longer expect them to be written
+        group = [
+            pending_write for pending_write in group if not pending_write.future.done()
+        ]
+        if not group:
+            return
+
+        try:
+            await self._commit(group)
+        # Any error is handed to the callers, since an error escaping the writer would stop it
+        except Exception as error:
+            if len(group) == 1:
+                _resolve(group[0], error=error)
+                return
+            logger.warning(
+                f"Failed to commit a group of {len(group)} writes "
+                f"({type(error).__name__}), committing them one by one"
+            )
+            for pending_write in group:
+                await self._commit_group([pending_write])
+            return
+
+        for pending_write in group:
+            _resolve(pending_write, row_count=len(pending_write.rows))
+
+    async def _commit(self, group: list[PendingWrite]) -> None:
+        transaction_rows: list[dict] = [
+            row for pending_write in group for row in pending_write.rows
+        ]
+        invoice_job_rows: list[dict] = DataBaseService.build_invoice_job_rows(
+            row
+            for pending_write in group
+            if pending_write.enqueue_invoice_jobs
+            for row in pending_write.rows
+        )
+        logger.info(
+            f"Committing {len(transaction_rows)} transactions of {len(group)} writes to the "
+            "database"
+        )
+        session: Union[Session, AsyncSession]
+        async with self.db_service.request_session() as session:
+            if isinstance(session, AsyncSession):
+                try:
+                    await session.execute(
+                        insert(MobileDataPurchaseTransaction), transaction_rows
+                    )
+                    if invoice_job_rows:
+                        await session.execute(insert(InvoiceJob), invoice_job_rows)
+                    await session.commit()
+                except SQLAlchemyError:
+                    await session.rollback()
+                    raise
+            else:
+                await asyncio.to_thread(
+                    _commit_rows, session, transaction_rows, invoice_job_rows
+                )
+
+
+def _commit_rows(
+    session: Session, transaction_rows: list[dict], invoice_job_rows: list[dict]
+) -> None:
+    try:
+        session.execute(insert(MobileDataPurchaseTransaction), transaction_rows)
+        if invoice_job_rows:
+            session.execute(insert(InvoiceJob), invoice_job_rows)
+        session.commit()
+    except SQLAlchemyError:
+        session.rollback()
+        raise
+
+
+def _resolve(
+    pending_write: PendingWrite,
+    row_count: int = 0,
+    error: Optional[BaseException] = None,
+) -> None:
+    if pending_write.future.done():
+        return
+    if error is not None:
+        pending_write.future.set_exception(error)
+    else:
+        pending_write.future.set_result(row_count)
@@ -1,12 +1,14 @@
 """
 This module contains the interface for the validation functions. It includes a function to validate
-a list of mobile data sell orders and a function to validate a single mobile data sell order.
+a list of mobile data sell orders, a function to validate a single mobile data sell order, and a
+function to validate a columnar batch of sell orders.
 """
 
 import logging
-from app.validation.validator import CreditRequestValidator
+from app.validation.validator import CreditRequestValidator, ValidationCutoffs
 from app.model.mobile_data_sell_order import MobileDataSellOrder
-from copy import deepcopy
+from app.model.sell_order_batch import SellOrderBatch, decode_error_mask
+from typing import Iterator, Optional
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -15,79 +17,142 @@ logging.basicConfig(level=logging.DEBUG)
 def validate_sell_orders(
     sell_orders: list[MobileDataSellOrder],
     validator: CreditRequestValidator,
+    consume_input: bool = False,
 ) -> list[MobileDataSellOrder]:
     """
-    This function validates a list of mobile data sell orders.
+    This function validates a list of mobile data sell orders. The rules are evaluated over the
+    whole list at once with CreditRequestValidator.validate_batch, and each resulting error bitmask
+    is decoded onto a shallow copy of its order. The input orders are never modified.
 
     Args:
         sell_orders (list[MobileDataSellOrder]): The list of mobile data sell orders to be validated.
         validator (CreditRequestValidator): The validator for validating the credit requests.
+        consume_input (bool): If True, each input order is removed from sell_orders as soon as its
+            validated copy has been made, so the batch is not held in memory twice. The list is
+            empty when the function returns.
     """
-    validated_sell_orders = []
-    for sell_order in sell_orders:
-        logger.info(
-            f"Validating mobile data sell order for BAN: {sell_order.billing_account_number}"
-        )
-        validated_sell_orders.append(validate_sell_order(sell_order, validator))
+    logger.info(f"Validating {len(sell_orders)} mobile data sell orders")
+
+    error_mask = validator.validate_batch(
+        SellOrderBatch.from_sell_orders(sell_orders, encode_errors=False)
+    )
+
+    unvalidated_sell_orders: Iterator[MobileDataSellOrder] = (
+        _consume(sell_orders) if consume_input else iter(sell_orders)
+    )
 
-    return validated_sell_orders
+    return [
+        apply_validation_errors(sell_order, decode_error_mask(row_error_mask))
+        for sell_order, row_error_mask in zip(
+            unvalidated_sell_orders, error_mask.tolist()
+        )
+    ]
 
 
 def validate_sell_order(
-    sell_order: MobileDataSellOrder, validator: CreditRequestValidator
+    sell_order: MobileDataSellOrder,
+    validator: CreditRequestValidator,
+    cutoffs: Optional[ValidationCutoffs] = None,
 ) -> MobileDataSellOrder:
     """
     This function validates a single mobile data sell order. It does so by calling the individual
-    validation functions and appending any errors to the validation_errors attribute of the
-    MobileDataSellOrder object.
+    validation functions and returning a copy of the MobileDataSellOrder object with any errors
+    appended to its validation_errors attribute.
 
     Args:
         sell_order (MobileDataSellOrder): The mobile data sell order to be validated.
         validator (CreditRequestValidator): The validator for validating the credit requests.
+        cutoffs (ValidationCutoffs, optional): The date cutoffs to validate against. A single
+            snapshot is taken for the order if not provided.
     """
-    validated_sell_order = deepcopy(sell_order)
+    if cutoffs is None:
+        cutoffs = validator.snapshot_cutoffs()
+
+    validation_errors: list[str] = []
 
     # Step 1: Validate that the requestor is of legal age
     logger.info("Validating the customer is of legal age")
-    if not validator.is_customer_of_legal_age(validated_sell_order.date_of_birth):
-        validated_sell_order.validation_errors.append("Customer is not of legal age")
+    if not validator.is_customer_of_legal_age(sell_order.date_of_birth, cutoffs):
+        validation_errors.append("Customer is not of legal age")
 
     # Step 2: Validate the credit card number length
     logger.info("Validating the credit card number length")
     if not validator.is_credit_card_number_length_valid(
-        validated_sell_order.credit_card_number,
+        sell_order.credit_card_number,
     ):
-        validated_sell_order.validation_errors.append(
-            "Credit card number length is invalid"
-        )
+        validation_errors.append("Credit card number length is invalid")
 
     # Step 3: Validate the credit card number
     logger.info("Validating the credit card number")
-    if not validator.is_credit_card_number_valid(
-        validated_sell_order.credit_card_number
-    ):
-        validated_sell_order.validation_errors.append("Credit card number is invalid")
+    if not validator.is_credit_card_number_valid(sell_order.credit_card_number):
+        validation_errors.append("Credit card number is invalid")
 
     # Step 4: Validate the credit card cvv
     logger.info("Validating the credit card cvv")
     if not validator.is_cvv_valid(
-        validated_sell_order.credit_card_cvv,
+        sell_order.credit_card_cvv,
     ):
-        validated_sell_order.validation_errors.append("CVV length is invalid")
+        validation_errors.append("CVV length is invalid")
 
     # Step 5: Validate the credit card expiration date
     logger.info("Validating the credit card expiration date")
     if not validator.is_credit_card_expired(
-        validated_sell_order.credit_card_expiration_date
+        sell_order.credit_card_expiration_date, cutoffs
     ):
-        validated_sell_order.validation_errors.append("Credit card has expired")
+        validation_errors.append("Credit card has expired")
+
+    # Step 6: Copy the order with the errors, rejected if validation errors present
+    return apply_validation_errors(sell_order, validation_errors)
 
-    # Step 6: Set status to rejected if validation errors present
-    if validated_sell_order.validation_errors:
+
+def apply_validation_errors(
+    sell_order: MobileDataSellOrder, validation_errors: list[str]
+) -> MobileDataSellOrder:
+    """
+    This function returns a shallow copy of a sell order with the given validation errors appended
+    and its status set to rejected if it has any validation errors. Only the validation_errors
+    list is new; the remaining fields are shared with the original, immutable values.
+
+    Args:
+        sell_order (MobileDataSellOrder): The mobile data sell order that was validated.
+        validation_errors (list[str]): The validation errors found for the order.
+    """
+    all_validation_errors: list[str] = [
+        *sell_order.validation_errors,
+        *validation_errors,
+    ]
+    update: dict = {"validation_errors": all_validation_errors}
+
+    if all_validation_errors:
         logger.info(
             "Rejecting due to validation errors: %s",
-            validated_sell_order.validation_errors,
+            all_validation_errors,
         )
-        validated_sell_order.status = "Rejected"
+        update["status"] = "Rejected"
+
+    return sell_order.model_copy(update=update)
+
+
+def _consume(sell_orders: list[MobileDataSellOrder]) -> Iterator[MobileDataSellOrder]:
+    """
+    This function yields the orders of a list in order while removing each one from the list.
+    """
+    sell_orders.reverse()
+    while sell_orders:
+        yield sell_orders.pop()
+
+
+def validate_sell_order_batch(
+    batch: SellOrderBatch, validator: CreditRequestValidator
+) -> SellOrderBatch:
+    """
+    This function validates a columnar batch of mobile data sell orders. It returns a batch sharing
+    the columns of the input batch, with the validation error bitmask of every row set.
+
+    Args:
+        batch (SellOrderBatch): The batch of mobile data sell orders to be validated.
+        validator (CreditRequestValidator): The validator for validating the credit requests.
+    """
+    logger.info(f"Validating a batch of {len(batch)} mobile data sell orders")
 
-    return validated_sell_order
+    return batch.with_error_mask(validator.validate_batch(batch))
@@ -1,9 +1,28 @@
 """
 This module contains the validation functions used to validate the customer's information. These
-functions are used by the validation_interface module to validate the customer's information.
+functions are used by the validation_interface module to validate the customer's information, either
+one order at a time or over the columns of a whole SellOrderBatch.
 """
 
 import datetime
+from typing import Callable, NamedTuple, Optional
+import numpy as np
+from app.model.sell_order_batch import ERROR_MASK_DTYPE, SellOrderBatch, SellOrderError
+from app.validation.luhn import LuhnValidator
+
+
+class ValidationCutoffs(NamedTuple):
+    """
+    This class holds the date cutoffs of one validation batch, computed from a single clock
+    reading so every order in the batch is checked against the same instant.
+
+    Attributes:
+        birth_cutoff (datetime.date): The latest date of birth of a customer of legal age.
+        expiry_cutoff (datetime.datetime): Cards expiring on or before this instant are expired.
+    """
+
+    birth_cutoff: datetime.date
+    expiry_cutoff: datetime.datetime
 
 
 class CreditRequestValidator:
@@ -16,6 +35,7 @@ class CreditRequestValidator:
         maximum_cvv_length,
         days_in_year,
         luhn_validator,
+        clock: Optional[Callable[[], datetime.datetime]] = None,
     ):
         self.legal_age = legal_age
         self.minimum_card_number_length = minimum_card_number_length
@@ -24,24 +44,38 @@ class CreditRequestValidator:
         self.maximum_cvv_length = maximum_cvv_length
         self.days_in_year = days_in_year
         self.luhn_validator = luhn_validator
+        self.clock = clock
 
-    def is_customer_of_legal_age(self, date_of_birth: datetime.datetime) -> bool:
+    def snapshot_cutoffs(self) -> ValidationCutoffs:
+        """
+        This function reads the clock once and computes the legal age birth cutoff and the card
+        expiry cutoff for a batch. The clock defaults to datetime.datetime.now.
+        """
+        now: datetime.datetime = (
+            self.clock() if self.clock is not None else datetime.datetime.now()
+        )
+        return ValidationCutoffs(
+            birth_cutoff=self._legal_age_birth_cutoff(now).date(),
+            expiry_cutoff=now,
+        )
+
+    def is_customer_of_legal_age(
+        self,
+        date_of_birth: datetime.datetime,
+        cutoffs: Optional[ValidationCutoffs] = None,
+    ) -> bool:
         """
         This function checks if the customer is of legal age.
 
         Args:
             date_of_birth (datetime.datetime): The date of birth of the customer.
+            cutoffs (ValidationCutoffs, optional): The cutoffs of the current batch. A fresh
+                snapshot is taken if not provided.
         """
-        age: int = datetime.datetime.now().year - date_of_birth.year
-        if date_of_birth.month > datetime.datetime.now().month:
-            age -= 1
-        elif date_of_birth.month == datetime.datetime.now().month:
-            if date_of_birth.day > datetime.datetime.now().day:
-                age -= 1
+        if cutoffs is None:
+            cutoffs = self.snapshot_cutoffs()
 
-        if age < self.legal_age:
-            return False
-        return True
+        return date_of_birth.date() <= cutoffs.birth_cutoff
 
     def is_credit_card_number_length_valid(
         self,
@@ -92,14 +126,98 @@ class CreditRequestValidator:
         return True
 
     def is_credit_card_expired(
-        self, credit_card_expiration_date: datetime.datetime
+        self,
+        credit_card_expiration_date: datetime.datetime,
+        cutoffs: Optional[ValidationCutoffs] = None,
     ) -> bool:
         """
         This function checks if the credit card expiration date is in the future.
 
         Args:
             credit_card_expiration_date (datetime.datetime): The credit card expiration date to be validated.
+            cutoffs (ValidationCutoffs, optional): The cutoffs of the current batch. A fresh
+                snapshot is taken if not provided.
         """
-        if credit_card_expiration_date <= datetime.datetime.now():
-            return False
-        return True
+        if cutoffs is None:
+            cutoffs = self.snapshot_cutoffs()
+
+        return credit_card_expiration_date > cutoffs.expiry_cutoff
+
+    def validate_batch(
+        self,
+        batch: SellOrderBatch,
+        cutoffs: Optional[ValidationCutoffs] = None,
+    ) -> np.ndarray:
+        """
+        This function evaluates every validation rule over the columns of a batch at once. It
+        returns the SellOrderError bitmask of every row, zero for rows that pass all rules. The
+        Luhn validator is applied once per distinct credit card number.
+
+        Args:
+            batch (SellOrderBatch): The batch of sell orders to be validated.
+            cutoffs (ValidationCutoffs, optional): The cutoffs to validate against. A fresh
+                snapshot is taken if not provided.
+        """
+        if cutoffs is None:
+            cutoffs = self.snapshot_cutoffs()
+
+        error_mask: np.ndarray = np.zeros(len(batch), dtype=ERROR_MASK_DTYPE)
+        if not len(batch):
+            return error_mask
+
+        # A customer is of legal age if they were born on or before the birth cutoff date
+        day_after_birth_cutoff = np.datetime64(cutoffs.birth_cutoff, "D") + 1
+        error_mask[batch.date_of_birth >= day_after_birth_cutoff] |= ERROR_MASK_DTYPE(
+            SellOrderError.NOT_OF_LEGAL_AGE
+        )
+
+        card_number_lengths: np.ndarray = np.char.str_len(batch.credit_card_number)
+        error_mask[
+            (card_number_lengths < self.minimum_card_number_length)
+            | (card_number_lengths > self.maximum_card_number_length)
+        ] |= ERROR_MASK_DTYPE(SellOrderError.CARD_NUMBER_LENGTH_INVALID)
+
+        unique_card_numbers, card_number_positions = np.unique(
+            batch.credit_card_number, return_inverse=True
+        )
+        unique_card_numbers_valid: np.ndarray = np.array(
+            self._validate_luhn_many(unique_card_numbers.tolist()), dtype=bool
+        )
+        error_mask[
+            ~unique_card_numbers_valid[card_number_positions.ravel()]
+        ] |= ERROR_MASK_DTYPE(SellOrderError.CARD_NUMBER_INVALID)
+
+        cvv_lengths: np.ndarray = np.char.str_len(batch.credit_card_cvv)
+        error_mask[
+            (cvv_lengths < self.minimum_cvv_length)
+            | (cvv_lengths > self.maximum_cvv_length)
+        ] |= ERROR_MASK_DTYPE(SellOrderError.CVV_LENGTH_INVALID)
+
+        error_mask[
+            batch.credit_card_expiration_date
+            <= np.datetime64(cutoffs.expiry_cutoff, "us")
+        ] |= ERROR_MASK_DTYPE(SellOrderError.CARD_EXPIRED)
+
+        return error_mask
+
+    def _validate_luhn_many(self, credit_card_numbers: list[str]) -> list[bool]:
+        """
+        This function runs the Luhn validator over many numbers, using its batch form when the
+        validator is a LuhnValidator. Other callables are called once per number.
+        """
+        if isinstance(self.luhn_validator, LuhnValidator):
+            return self.luhn_validator.validate_many(credit_card_numbers)
+        return [
+            bool(self.luhn_validator(credit_card_number))
+            for credit_card_number in credit_card_numbers
+        ]
+
+    def _legal_age_birth_cutoff(self, now: datetime.datetime) -> datetime.datetime:
+        """
+        This function returns the latest date of birth of a customer who is of legal age on the
+        given date. A February 29 cutoff falls back to February 28 in non-leap years.
+        """
+        try:
+            return now.replace(year=now.year - self.legal_age)
+        except ValueError:
+            return now.replace(year=now.year - self.legal_age, day=28)
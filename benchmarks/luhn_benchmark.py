@@ -0,0 +1,57 @@
+"""
+This module contains a micro-benchmark comparing luhncheck.is_luhn with the built-in Luhn
+implementation in app.validation.luhn, with and without its cache. The card numbers are drawn from a
+small pool so that they repeat, as they do in real batch files.
+
+Usage:
+    python -m benchmarks.luhn_benchmark [number_of_cards] [distinct_cards]
+"""
+
+import random
+import sys
+import timeit
+from luhncheck import is_luhn
+from app.validation.luhn import LuhnValidator, is_luhn_valid
+
+
+def build_card_numbers(number_of_cards: int, distinct_cards: int) -> list[str]:
+    """
+    This function builds a list of random 16 digit card numbers drawn from a pool of
+    distinct_cards numbers.
+    """
+    random_generator = random.Random(42)
+    pool: list[str] = [
+        "".join(random_generator.choice("0123456789") for _ in range(16))
+        for _ in range(distinct_cards)
+    ]
+    return [random_generator.choice(pool) for _ in range(number_of_cards)]
+
+
+def run_benchmark(number_of_cards: int, distinct_cards: int, repeat: int = 5) -> None:
+    """
+    This function times each Luhn implementation over the same card numbers and prints the best
+    time of each.
+    """
+    card_numbers: list[str] = build_card_numbers(number_of_cards, distinct_cards)
+    cached_validator = LuhnValidator(cache_size=4096)
+
+    candidates = {
+        "luhncheck.is_luhn": lambda: [is_luhn(number) for number in card_numbers],
+        "is_luhn_valid": lambda: [is_luhn_valid(number) for number in card_numbers],
+        "LuhnValidator(cache_size=None).validate_many": lambda: LuhnValidator(
+            cache_size=None
+        ).validate_many(card_numbers),
+        "LuhnValidator(cache_size=4096).validate_many": lambda: cached_validator.validate_many(
+            card_numbers
+        ),
+    }
+
+    print(f"{number_of_cards} card numbers, {distinct_cards} distinct")
+    for name, candidate in candidates.items():
+        best: float = min(timeit.repeat(candidate, number=1, repeat=repeat))
+        print(f"{name:<48} {best * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    arguments = [int(argument) for argument in sys.argv[1:3]]
+    run_benchmark(*(arguments + [100_000, 1_000][len(arguments) :]))
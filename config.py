@@ -1,6 +1,144 @@
+from typing import Optional, Union
+
 # Database Configurations
 PATH_TO_DB_FILE = r"sqlite:///C:\Users\t767284\Documents\repos\MobileDataSalesAPI\appdata\database\mobile_data_sales_api.db"
 
+# Maximum number of transactions committed together; set to None to commit each batch at once
+DB_WRITE_CHUNK_SIZE: Optional[int] = 500
+
+# SQLite PRAGMAs applied to every new connection, selected by SQLITE_PROFILE
+SQLITE_PROFILE: str = "performance"
+SQLITE_PROFILES: dict[str, dict[str, Union[str, int]]] = {
+    # SQLite defaults: rollback journal, synchronous=FULL, default cache, no mmap
+    "default": {},
+    # WAL lets readers run while the API is writing; synchronous=NORMAL is durable in WAL mode
+    # except for the last transactions before a power loss
+    "performance": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    # WAL with a full fsync on every commit
+    "durable": {
+        "busy_timeout": 5000,
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+}
+DB_POOL_SIZE: int = 5
+DB_MAX_OVERFLOW: int = 10
+
+# Use an aiosqlite AsyncSession for request handling so writes do not block the event loop
+DB_ASYNC_ENABLED: bool = True
+
+# Group-commit the transactions of concurrent purchase requests from one background writer
+# instead of committing each request through its own session. Off by default: each chunk of a
+# request is then committed whole, so DB_WRITE_CHUNK_SIZE is unused and a failed write reports the
+# database error instead of the TransactionChunkError of the chunk that failed
+DB_WRITE_BEHIND_ENABLED: bool = False
+# Number of collected transactions after which the writer commits a group at once
+DB_WRITE_BEHIND_MAX_BATCH_ROWS: int = 5000
+# Seconds the writer waits for the writes of other requests before committing a group
+DB_WRITE_BEHIND_MAX_DELAY: float = 0.01
+
+# Ingestion Variables
+INGESTION_CHUNK_SIZE: int = 1000
+
+# Stage Execution Variables
+# Each stage of a purchase request runs on the "thread" or "process" pool of the stage executor.
+# Process pool stages need picklable arguments, so the validator must not use a lambda clock.
+EXECUTOR_THREAD_WORKERS: int = 8
+EXECUTOR_PROCESS_WORKERS: int = 0
+EXECUTOR_STAGE_POOLS: dict[str, str] = {
+    "parse": "thread",
+    "validate": "thread",
+    "record": "thread",
+    "invoice": "thread",
+}
+# Maximum number of concurrent calls of each stage across all requests
+EXECUTOR_STAGE_CONCURRENCY: dict[str, int] = {
+    "parse": 4,
+    "validate": 4,
+    "record": 2,
+    "invoice": 4,
+}
+# Number of chunks of one purchase request each stage works on at the same time. Every stage hands
+# its chunks on in upload order. The record stage always has one worker, since it writes through
+# the request's single database session, and so does the invoice stage, so the invoices of a BAN
+# ordered twice are rendered in upload order.
+PIPELINE_STAGE_WORKERS: dict[str, int] = {
+    "parse": 1,
+    "validate": 2,
+}
+# Maximum number of chunks of one purchase request waiting in front of each stage
+PIPELINE_QUEUE_SIZE: int = 2
+
+# Batch Job Variables
+# Directory the uploads of batch jobs are kept in until they have been processed
+BATCH_JOB_UPLOAD_PATH: str = "appdata/batch_jobs"
+# Number of batch jobs processed at the same time
+BATCH_JOB_WORKERS: int = 1
+# Seconds an idle batch job worker waits before polling for new jobs again
+BATCH_JOB_POLL_INTERVAL: float = 1.0
+# Number of failed attempts after which a batch job is marked as failed
+BATCH_JOB_MAX_ATTEMPTS: int = 3
+# Seconds after which a batch job whose worker stopped touching it is resumed by another worker
+BATCH_JOB_LEASE_TIMEOUT: float = 5 * 60
+# Seconds between two touches of a running batch job; shorter than the lease
+BATCH_JOB_HEARTBEAT_INTERVAL: float = 30.0
+
+# Idempotency Variables
+# Purchase requests are identified by their Idempotency-Key header, or by a hash of their body.
+# Seconds the stored response of a completed purchase request is replayed to its retries
+IDEMPOTENCY_TTL: float = 24 * 60 * 60
+# Seconds after its last touch after which an unfinished purchase request is presumed lost and
+# may run again
+IDEMPOTENCY_STALE_AFTER: float = 15 * 60
+# Seconds between two purges of the expired idempotency records
+IDEMPOTENCY_PURGE_INTERVAL: float = 60 * 60
+# Seconds between two touches of a running purchase request, which keep it from being presumed
+# lost; must be shorter than IDEMPOTENCY_STALE_AFTER
+IDEMPOTENCY_HEARTBEAT_INTERVAL: float = 60.0
+# Seconds a retry waits for the original purchase request before getting a 409
+IDEMPOTENCY_WAIT_TIMEOUT: float = 60.0
+# Seconds between two checks of an original purchase request running in another worker process
+IDEMPOTENCY_POLL_INTERVAL: float = 0.5
+# Largest response body stored for replay; retries of larger responses are processed again
+IDEMPOTENCY_MAX_STORED_BYTES: int = 16 * 1024 * 1024
+# Bytes of a request body kept in memory while it is hashed, before it is spooled to disk
+IDEMPOTENCY_SPOOL_MEMORY_BYTES: int = 1024 * 1024
+# Largest body of a purchase request without an Idempotency-Key that is hashed to deduplicate it;
+# larger uploads are processed as they arrive, and need an Idempotency-Key to be deduplicated
+IDEMPOTENCY_MAX_SPOOLED_BYTES: int = 16 * 1024 * 1024
+
+# Admission Control Variables
+# Purchase requests and batch job uploads over these caps wait for a slot, and are rejected with
+# 429 (wait queue full) or 503 (wait timed out) and a Retry-After header. Uploads larger than the
+# byte cap get a 413.
+ADMISSION_MAX_IN_FLIGHT_REQUESTS: int = 8
+ADMISSION_MAX_IN_FLIGHT_BYTES: int = 256 * 1024 * 1024
+# Bytes counted for a purchase request sent without a Content-Length header; it gets a 413 once it
+# sends more
+ADMISSION_UNKNOWN_LENGTH_BYTES: int = 16 * 1024 * 1024
+# Maximum number of purchase requests waiting for admission; 0 rejects them at once
+ADMISSION_MAX_WAITING: int = 16
+# Seconds a purchase request waits for admission before it is rejected
+ADMISSION_WAIT_TIMEOUT: float = 10.0
+# Seconds rejected clients are told to wait before retrying
+ADMISSION_RETRY_AFTER: int = 5
+
+# Transaction Query Variables
+# Number of transactions per page of GET /transactions when the request does not set a limit
+TRANSACTION_QUERY_PAGE_SIZE: int = 100
+# Largest page of GET /transactions a request may ask for
+TRANSACTION_QUERY_MAX_PAGE_SIZE: int = 1000
+
 # Validation Variables
 LEGAL_AGE: int = 18
 DAYS_IN_YEAR: float = 365.25
@@ -11,8 +149,48 @@ MAXIMUM_CARD_NUMBER_LENGTH: int = 19
 MINIMUM_CVV_LENGTH: int = 3
 MAXIMUM_CVV_LENGTH: int = 4
 
+# Maximum number of cached Luhn results; set to None to disable the cache
+LUHN_CACHE_SIZE: Optional[int] = 4096
+
 # Invoice Generation Variables
 INVOICE_TEMPLATE_PATH: str = "templates"
 PDF_OUTPUT_PATH: str = "appdata/pdfs"
 QR_CODE_BASE_URL: str = "https://telus.com/user"
 HTML_TEMPLATE: str = "invoice_template.html"
+# Stylesheet of the invoice template, parsed once per rendering thread instead of once per invoice
+INVOICE_STYLESHEET: str = "invoice_template.css"
+# How the invoices of a batch are laid out: "separate" lays out and writes each invoice on its own,
+# "split" lays out a whole chunk in one pass and splits its pages into per-BAN PDFs, and
+# "statement" also writes the whole chunk as one combined statement PDF
+INVOICE_DOCUMENT_MODE: str = "split"
+# Number of combined statement PDFs kept in PDF_OUTPUT_PATH in the "statement" document mode
+INVOICE_STATEMENT_RETENTION: int = 100
+# Image format of the invoice QR codes, "png" or "svg"; "svg" skips the PIL encode step
+QR_CODE_FORMAT: str = "png"
+# Maximum number of QR codes cached per invoice generator; set to None to disable the cache
+QR_CODE_CACHE_SIZE: Optional[int] = 1024
+
+# How the PDF invoices of a purchase request are generated: "eager" renders them before the request
+# returns, "queued" commits an invoice job with each transaction for the background workers, and
+# "lazy" renders nothing until an invoice is first downloaded from GET /invoices/{ban}
+INVOICE_RENDERING_MODE: str = "queued"
+# Number of background workers draining the invoice job queue
+INVOICE_QUEUE_WORKERS: int = 2
+# Maximum number of invoice jobs a worker claims at a time
+INVOICE_QUEUE_BATCH_SIZE: int = 64
+# Seconds an idle worker waits before polling the invoice job queue again
+INVOICE_QUEUE_POLL_INTERVAL: float = 1.0
+# Number of failed attempts after which an invoice job is marked as failed
+INVOICE_JOB_MAX_ATTEMPTS: int = 3
+# Seconds after which an invoice job whose worker stopped touching it is claimed by another worker
+INVOICE_JOB_LEASE_TIMEOUT: float = 5 * 60
+# Seconds between two touches of the invoice jobs a worker is rendering; shorter than the lease
+INVOICE_JOB_HEARTBEAT_INTERVAL: float = 30.0
+
+# Number of bytes of a PDF invoice read and streamed at a time into an invoice ZIP archive
+INVOICE_ARCHIVE_CHUNK_SIZE: int = 64 * 1024
+
+# Number of processes rendering PDF invoices in parallel; set to 0 to render on the stage executor
+INVOICE_RENDER_PROCESSES: int = 4
+# Number of invoices sent to a rendering process at a time
+INVOICE_RENDER_CHUNK_SIZE: int = 16
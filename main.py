@@ -5,32 +5,152 @@ Routes:
     /mobile-data-purchase-request
         purchase_request: Request
             The purchase request to be processed.
-        db_session: Annotated[Session, Depends(db_service.get_db_session)]
-            The database session to be used for the request.
+        db_session: Annotated[Union[Session, AsyncSession], Depends(db_session_dependency)]
+            The database session to be used for the request, async if config.DB_ASYNC_ENABLED.
 
         Returns:
             JSONResponse
-                The response to the purchase request.
+                The response to the purchase request, with the invoice status of every order.
+            StreamingResponse
+                One NDJSON line per order, with its invoice status, as soon as it is recorded and
+                its invoice handled, if the Accept header asks for application/x-ndjson. A
+                request that fails part way ends with an "Error" line.
         methods: POST
+
+        Requests over the admission caps of config.py get a 429 or 503 response with a
+        Retry-After header, and uploads larger than the byte cap, or than the
+        config.ADMISSION_UNKNOWN_LENGTH_BYTES a chunked upload is admitted with, a 413 response.
+
+        Retries with the same Idempotency-Key header, or without one the same body of at most
+        config.IDEMPOTENCY_MAX_SPOOLED_BYTES, get the stored response of the original request,
+        with an Idempotent-Replayed header, and wait for it if it is still running. Reusing an
+        Idempotency-Key for a different body or Accept header gets a 422 response.
+
+    /batch-jobs
+        purchase_request: Request
+            The purchase request to be processed in the background.
+
+        Returns:
+            JSONResponse
+                A 202 response with the id and status of the new batch job, once the upload has
+                been stored.
+        methods: POST
+
+        Uploads over the admission caps of config.py are rejected like purchase requests.
+
+    /batch-jobs/{job_id}
+        job_id: str
+            The id of a batch job.
+
+        Returns:
+            JSONResponse
+                The status and progress of the batch job.
+        methods: GET
+
+    /batch-jobs/{job_id}/results
+        job_id: str
+            The id of a batch job.
+
+        Returns:
+            StreamingResponse
+                One NDJSON line per order recorded by the batch job so far.
+        methods: GET
+
+    /transactions
+        billing_account_number: Optional[str]
+            Only return the transactions of this billing account number.
+        status: Optional[str]
+            Only return the transactions with this status, "Approved" or "Rejected".
+        created_from: Optional[datetime]
+            Only return the transactions created at or after this time.
+        created_to: Optional[datetime]
+            Only return the transactions created before this time.
+        cursor: Optional[str]
+            The next_cursor of the previous page.
+        limit: int
+            The maximum number of transactions in the page.
+
+        Returns:
+            JSONResponse
+                A page of the matching transactions, oldest first, with masked card numbers, and
+                the cursor of the next page.
+        methods: GET
+
+    /invoices/archive
+        upload_id: Optional[str]
+            The id of an upload, from the X-Upload-Id header of its purchase request response.
+        billing_account_number: Optional[list[str]]
+            Billing account numbers, repeated once per number.
+
+        Returns:
+            StreamingResponse
+                A ZIP archive of the PDF invoices of the upload and billing account numbers.
+        methods: GET
+
+    /invoices/{billing_account_number}
+        billing_account_number: str
+            The billing account number whose PDF invoice is downloaded.
+
+        Returns:
+            FileResponse
+                The PDF invoice, rendered on first access, or a 304 response if the If-None-Match
+                header matches its ETag.
+        methods: GET
+
+    /invoices/{billing_account_number}/status
+        billing_account_number: str
+            The billing account number whose invoice jobs are reported.
+
+        Returns:
+            JSONResponse
+                The status of every invoice job of the billing account number.
+        methods: GET
 """
 
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, Request, Depends, Query, Response
 from fastapi.responses import JSONResponse
 from app.service.db_service import DataBaseService
 from app.controller.api_request_handler import (
+    NDJSON_MEDIA_TYPE,
     handle_mobile_data_sell_request,
+    handle_mobile_data_sell_request_ndjson,
+)
+from app.controller.admission_middleware import AdmissionControlMiddleware
+from app.controller.idempotency_middleware import IdempotencyMiddleware
+from app.controller.batch_job_request_handler import (
+    handle_batch_job_create_request,
+    handle_batch_job_results_request,
+    handle_batch_job_status_request,
+)
+from app.controller.transaction_request_handler import (
+    handle_transaction_query_request,
+)
+from app.controller.invoice_request_handler import (
+    handle_invoice_archive_request,
+    handle_invoice_request,
+    handle_invoice_status_request,
 )
 from app.validation.validator import CreditRequestValidator
+from app.service.stage_executor import StageExecutor
+import datetime
 import logging
 from sqlalchemy.orm import Session
-from typing import Annotated
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Annotated, Optional, Union
 from contextlib import asynccontextmanager
 import config
-import qrcode  # type: ignore
-from app.service.invoice_generator import InvoiceGenerator
-from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML  # type: ignore
-from luhncheck import is_luhn
+import functools
+from app.service.invoice_generator import build_invoice_generator
+from app.service.parallel_invoice_renderer import ParallelInvoiceRenderer
+from app.service.invoice_job_queue import InvoiceJobQueue
+from app.service.invoice_cache import InvoiceCache
+from app.service.invoice_archive import InvoiceArchive
+from app.service.admission_controller import AdmissionController
+from app.service.batch_job_runner import BatchJobRunner
+from app.service.idempotency_store import IdempotencyStore
+from app.service.transaction_query import TransactionQuery
+from app.service.write_behind_writer import WriteBehindWriter
+from app.validation.luhn import LuhnValidator
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.DEBUG)
@@ -38,8 +158,27 @@ logging.basicConfig(level=logging.DEBUG)
 logger.info("Starting the FastAPI application")
 
 logger.info("Initializing Database")
-db_service = DataBaseService(config.PATH_TO_DB_FILE)
-db_session = Annotated[Session, Depends(db_service.get_db_session)]
+db_service = DataBaseService(
+    config.PATH_TO_DB_FILE,
+    sqlite_pragmas=config.SQLITE_PROFILES[config.SQLITE_PROFILE],
+    pool_size=config.DB_POOL_SIZE,
+    max_overflow=config.DB_MAX_OVERFLOW,
+    enable_async=config.DB_ASYNC_ENABLED,
+)
+transaction_writer = (
+    WriteBehindWriter(
+        db_service,
+        max_batch_rows=config.DB_WRITE_BEHIND_MAX_BATCH_ROWS,
+        max_delay=config.DB_WRITE_BEHIND_MAX_DELAY,
+    )
+    if config.DB_WRITE_BEHIND_ENABLED
+    else None
+)
+db_session_dependency = (
+    db_service.get_async_db_session
+    if config.DB_ASYNC_ENABLED
+    else db_service.get_db_session
+)
 
 logger.info("Initializing validator")
 validator = CreditRequestValidator(
@@ -49,60 +188,328 @@ validator = CreditRequestValidator(
     minimum_cvv_length=config.MINIMUM_CVV_LENGTH,
     maximum_cvv_length=config.MAXIMUM_CVV_LENGTH,
     days_in_year=config.DAYS_IN_YEAR,
-    luhn_validator=is_luhn,
+    luhn_validator=LuhnValidator(cache_size=config.LUHN_CACHE_SIZE),
 )
 
 logger.info("Initializing invoice generator")
-invoice_generator = InvoiceGenerator(
+invoice_generator_factory = functools.partial(
+    build_invoice_generator,
     invoice_template_path=config.INVOICE_TEMPLATE_PATH,
     pdf_output_path=config.PDF_OUTPUT_PATH,
     qr_code_base_url=config.QR_CODE_BASE_URL,
-    qr_code_template=qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=5,
-        border=2,
-    ),
     html_template=config.HTML_TEMPLATE,
-    html_template_environment=Environment(
-        loader=FileSystemLoader(config.INVOICE_TEMPLATE_PATH),
-    ),
-    html_factory=lambda s: HTML(string=s),
+    stylesheet=config.INVOICE_STYLESHEET,
+    qr_code_format=config.QR_CODE_FORMAT,
+    qr_code_cache_size=config.QR_CODE_CACHE_SIZE,
+    document_mode=config.INVOICE_DOCUMENT_MODE,
+    statement_retention=config.INVOICE_STATEMENT_RETENTION,
+)
+invoice_generator = invoice_generator_factory()
+invoice_renderer = (
+    ParallelInvoiceRenderer(
+        generator_factory=invoice_generator_factory,
+        max_workers=config.INVOICE_RENDER_PROCESSES,
+        chunk_size=config.INVOICE_RENDER_CHUNK_SIZE,
+    )
+    if config.INVOICE_RENDER_PROCESSES > 0
+    else None
+)
+
+logger.info("Initializing stage executor")
+stage_executor = StageExecutor(
+    thread_workers=config.EXECUTOR_THREAD_WORKERS,
+    process_workers=config.EXECUTOR_PROCESS_WORKERS,
+    stage_pools=config.EXECUTOR_STAGE_POOLS,
+    stage_concurrency=config.EXECUTOR_STAGE_CONCURRENCY,
+)
+
+logger.info("Initializing invoice job queue")
+invoice_job_queue = (
+    InvoiceJobQueue(
+        db_service,
+        invoice_generator,
+        invoice_renderer=invoice_renderer,
+        executor=stage_executor,
+        worker_count=config.INVOICE_QUEUE_WORKERS,
+        batch_size=config.INVOICE_QUEUE_BATCH_SIZE,
+        poll_interval=config.INVOICE_QUEUE_POLL_INTERVAL,
+        max_attempts=config.INVOICE_JOB_MAX_ATTEMPTS,
+        lease_timeout=config.INVOICE_JOB_LEASE_TIMEOUT,
+        heartbeat_interval=config.INVOICE_JOB_HEARTBEAT_INTERVAL,
+    )
+    if config.INVOICE_RENDERING_MODE == "queued"
+    else None
+)
+invoice_cache = InvoiceCache(
+    db_service,
+    invoice_generator,
+    config.PDF_OUTPUT_PATH,
+    executor=stage_executor,
+)
+invoice_archive = InvoiceArchive(
+    db_service, invoice_cache, chunk_size=config.INVOICE_ARCHIVE_CHUNK_SIZE
+)
+
+logger.info("Initializing batch job runner")
+batch_job_runner = BatchJobRunner(
+    db_service,
+    validator,
+    invoice_generator,
+    config.BATCH_JOB_UPLOAD_PATH,
+    executor=stage_executor,
+    invoice_renderer=invoice_renderer,
+    invoice_job_queue=invoice_job_queue,
+    invoice_cache=invoice_cache if config.INVOICE_RENDERING_MODE == "lazy" else None,
+    chunk_size=config.INGESTION_CHUNK_SIZE,
+    worker_count=config.BATCH_JOB_WORKERS,
+    poll_interval=config.BATCH_JOB_POLL_INTERVAL,
+    max_attempts=config.BATCH_JOB_MAX_ATTEMPTS,
+    lease_timeout=config.BATCH_JOB_LEASE_TIMEOUT,
+    heartbeat_interval=config.BATCH_JOB_HEARTBEAT_INTERVAL,
+)
+
+logger.info("Initializing idempotency store")
+idempotency_store = IdempotencyStore(
+    db_service,
+    ttl=config.IDEMPOTENCY_TTL,
+    stale_after=config.IDEMPOTENCY_STALE_AFTER,
+    purge_interval=config.IDEMPOTENCY_PURGE_INTERVAL,
+)
+
+logger.info("Initializing transaction query")
+transaction_query = TransactionQuery(db_service)
+
+logger.info("Initializing admission controller")
+admission_controller = AdmissionController(
+    max_in_flight_requests=config.ADMISSION_MAX_IN_FLIGHT_REQUESTS,
+    max_in_flight_bytes=config.ADMISSION_MAX_IN_FLIGHT_BYTES,
+    max_waiting=config.ADMISSION_MAX_WAITING,
+    wait_timeout=config.ADMISSION_WAIT_TIMEOUT,
+    retry_after=config.ADMISSION_RETRY_AFTER,
 )
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    This context manager initializes the database and tables when the FastAPI application is started
-    and closes the database connection when the FastAPI application is stopped.
+    This context manager initializes the database and tables and starts the transaction writer,
+    the stage executor, the invoice renderer, the invoice queue workers, the batch job workers and
+    the purge of the idempotency records when the FastAPI application is started, and shuts them
+    down when the FastAPI application is stopped.
     """
     logger.info("Initializing the database and tables")
     db_service.create_db_and_tables()
+    if config.DB_ASYNC_ENABLED:
+        await db_service.create_async_db_and_tables()
+    if transaction_writer is not None:
+        transaction_writer.start()
+    stage_executor.start()
+    if invoice_renderer is not None:
+        invoice_renderer.start()
+    if invoice_job_queue is not None:
+        invoice_job_queue.start()
+    batch_job_runner.start()
+    idempotency_store.start()
     yield
+    await idempotency_store.shutdown()
+    await batch_job_runner.shutdown()
+    if invoice_job_queue is not None:
+        await invoice_job_queue.shutdown()
+    if invoice_renderer is not None:
+        invoice_renderer.shutdown()
+    stage_executor.shutdown()
+    if transaction_writer is not None:
+        await transaction_writer.shutdown()
+    await db_service.close_async_db_connection()
     db_service.close_db_connection()
 
 
 app: FastAPI = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    IdempotencyMiddleware,
+    idempotency_store=idempotency_store,
+    paths=["/mobile-data-purchase-request"],
+    wait_timeout=config.IDEMPOTENCY_WAIT_TIMEOUT,
+    poll_interval=config.IDEMPOTENCY_POLL_INTERVAL,
+    max_stored_bytes=config.IDEMPOTENCY_MAX_STORED_BYTES,
+    spool_memory_bytes=config.IDEMPOTENCY_SPOOL_MEMORY_BYTES,
+    max_spooled_bytes=config.IDEMPOTENCY_MAX_SPOOLED_BYTES,
+    heartbeat_interval=config.IDEMPOTENCY_HEARTBEAT_INTERVAL,
+)
+# Added last so it runs first: an overloaded server rejects a request before its upload is
+# spooled to be hashed, and the admission caps bound the uploads being spooled
+app.add_middleware(
+    AdmissionControlMiddleware,
+    admission_controller=admission_controller,
+    paths=["/mobile-data-purchase-request", "/batch-jobs"],
+    unknown_length_bytes=config.ADMISSION_UNKNOWN_LENGTH_BYTES,
+)
 
 
 @app.post("/mobile-data-purchase-request")
 async def mobile_data_purchase_request_route(
     purchase_request: Request,
-    db_session: Annotated[Session, Depends(db_service.get_db_session)],
-) -> JSONResponse:
+    db_session: Annotated[Union[Session, AsyncSession], Depends(db_session_dependency)],
+) -> Response:
     """
     This route handles a mobile data purchase request. It takes a purchase request as input and
     feeds it to the handle_mobile_data_purchase_request function. The function processes the route
-    and returns a JSON response.
+    and returns a JSON response, or streams one NDJSON line per order if the client accepts
+    application/x-ndjson.
     """
 
     logger.info("Received a mobile data purchase request")
 
+    processing_options: dict = {
+        "chunk_size": config.INGESTION_CHUNK_SIZE,
+        "write_chunk_size": config.DB_WRITE_CHUNK_SIZE,
+        "executor": stage_executor,
+        "invoice_renderer": invoice_renderer,
+        "invoice_job_queue": invoice_job_queue,
+        "invoice_cache": (
+            invoice_cache if config.INVOICE_RENDERING_MODE == "lazy" else None
+        ),
+        "transaction_writer": transaction_writer,
+        "stage_workers": config.PIPELINE_STAGE_WORKERS,
+        "queue_size": config.PIPELINE_QUEUE_SIZE,
+    }
+
+    if NDJSON_MEDIA_TYPE in purchase_request.headers.get("accept", ""):
+        logger.info("Streaming the results of the mobile data purchase request")
+        # The dependency session is closed before a streamed body runs, so the stream opens its own
+        return handle_mobile_data_sell_request_ndjson(
+            purchase_request,
+            db_service,
+            validator,
+            invoice_generator,
+            **processing_options,
+        )
+
     response: JSONResponse = await handle_mobile_data_sell_request(
-        purchase_request, db_session, validator, invoice_generator
+        purchase_request,
+        db_session,
+        validator,
+        invoice_generator,
+        **processing_options,
     )
 
     logger.info("Successfully completed the mobile data purchase request")
 
     return response
+
+
+@app.post("/batch-jobs")
+async def batch_job_route(purchase_request: Request) -> JSONResponse:
+    """
+    This route stores a mobile data purchase request as a batch job and returns its id at once.
+    The job is processed in the background and resumes from its last checkpoint after a restart.
+    """
+
+    logger.info("Received a batch job request")
+
+    return await handle_batch_job_create_request(purchase_request, batch_job_runner)
+
+
+@app.get("/batch-jobs/{job_id}")
+async def batch_job_status_route(job_id: str) -> JSONResponse:
+    """
+    This route reports the status and progress of a batch job.
+    """
+
+    logger.info(f"Received a batch job status request for job {job_id}")
+
+    return await handle_batch_job_status_request(job_id, batch_job_runner)
+
+
+@app.get("/batch-jobs/{job_id}/results")
+async def batch_job_results_route(job_id: str) -> Response:
+    """
+    This route streams the results of a batch job as NDJSON lines.
+    """
+
+    logger.info(f"Received a batch job results request for job {job_id}")
+
+    return await handle_batch_job_results_request(job_id, batch_job_runner)
+
+
+@app.get("/transactions")
+async def transaction_query_route(
+    billing_account_number: Optional[str] = None,
+    status: Optional[str] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Annotated[
+        int, Query(ge=1, le=config.TRANSACTION_QUERY_MAX_PAGE_SIZE)
+    ] = config.TRANSACTION_QUERY_PAGE_SIZE,
+) -> JSONResponse:
+    """
+    This route returns a page of the recorded transactions matching the billing account number,
+    status and creation date range, oldest first. Pages are read through the secondary indexes of
+    the transaction table with keyset pagination; pass the next_cursor of a page to get the next.
+    """
+
+    logger.info("Received a transaction query request")
+
+    return await handle_transaction_query_request(
+        transaction_query,
+        limit,
+        cursor,
+        billing_account_number,
+        status,
+        created_from,
+        created_to,
+    )
+
+
+# Declared before /invoices/{billing_account_number} so "archive" is not taken for a BAN
+@app.get("/invoices/archive")
+async def invoice_archive_route(
+    upload_id: Optional[str] = None,
+    billing_account_number: Annotated[Optional[list[str]], Query()] = None,
+) -> Response:
+    """
+    This route streams a ZIP archive of the PDF invoices of an upload or of a set of billing
+    account numbers. The PDFs are stored without recompression.
+    """
+
+    logger.info("Received an invoice archive request")
+
+    return await handle_invoice_archive_request(
+        upload_id, billing_account_number, invoice_archive
+    )
+
+
+@app.get("/invoices/{billing_account_number}")
+async def invoice_route(billing_account_number: str, request: Request) -> Response:
+    """
+    This route returns the PDF invoice of a billing account number. The invoice is rendered from
+    the latest recorded transaction on first access and served from disk afterwards.
+    """
+
+    logger.info(f"Received an invoice request for BAN {billing_account_number}")
+
+    return await handle_invoice_request(
+        billing_account_number,
+        request.headers.get("if-none-match"),
+        invoice_cache,
+    )
+
+
+@app.get("/invoices/{billing_account_number}/status")
+async def invoice_status_route(billing_account_number: str) -> JSONResponse:
+    """
+    This route reports the status of the PDF invoice jobs of a billing account number. Invoices are
+    only queued when config.INVOICE_RENDERING_MODE is "queued".
+    """
+
+    logger.info(f"Received an invoice status request for BAN {billing_account_number}")
+
+    if invoice_job_queue is None:
+        return JSONResponse(
+            status_code=404,
+            content={"detail": "Invoices are not queued"},
+        )
+    return await handle_invoice_status_request(
+        billing_account_number, invoice_job_queue
+    )
@@ -1,5 +1,9 @@
 # tests/conftest.py
+import os
 import pytest
+from sqlalchemy.orm import Session
+from app.model.invoice_render_result import InvoiceRenderResult
+from app.model.sell_order_batch import SellOrderBatch
 from app.service.db_service import DataBaseService
 
 
@@ -9,3 +13,79 @@ def db_service():
     service = DataBaseService("sqlite:///:memory:")
     service.create_db_and_tables()
     return service
+
+
+class FakeInvoiceGenerator:
+    """
+    This class stands in for the InvoiceGenerator, which needs WeasyPrint. The invoices of orders
+    named "Broken", or of the broken_bans, fail; if broken is set, every call raises instead.
+    """
+
+    def __init__(self, pdf_output_path="", broken=False, broken_bans=()):
+        self.pdf_output_path = pdf_output_path
+        self.broken = broken
+        self.broken_bans = broken_bans
+        self.rendered_names = []
+        self.invoiced_bans = []
+
+    def _render(self, sell_order):
+        if self.broken:
+            raise RuntimeError("Broken template")
+        self.rendered_names.append(sell_order.name)
+        self.invoiced_bans.append(sell_order.billing_account_number)
+        return os.path.join(
+            self.pdf_output_path, f"invoice_{sell_order.billing_account_number}.pdf"
+        )
+
+    def generate_pdf_invoice(self, sell_order):
+        output_path = self._render(sell_order)
+        with open(output_path, "w") as pdf_file:
+            pdf_file.write(sell_order.name)
+        return output_path
+
+    def generate_pdf_invoice_results(self, sell_orders):
+        results = []
+        for sell_order in sell_orders:
+            output_path = self._render(sell_order)
+            failed = (
+                sell_order.name == "Broken"
+                or sell_order.billing_account_number in self.broken_bans
+            )
+            results.append(
+                InvoiceRenderResult(
+                    billing_account_number=sell_order.billing_account_number,
+                    success=not failed,
+                    output_path=output_path,
+                    error="Broken template" if failed else None,
+                )
+            )
+        return results
+
+    def generate_pdf_invoice_batch(self, batch):
+        return self.generate_pdf_invoice_results(batch.iter_sell_orders())
+
+
+def record_orders(
+    db_service,
+    names,
+    billing_account_numbers=None,
+    upload_id=None,
+    enqueue_invoice_jobs=False,
+):
+    # The billing account number of each order defaults to its index
+    billing_account_numbers = billing_account_numbers or [
+        str(index) for index in range(len(names))
+    ]
+    batch, _ = SellOrderBatch.from_rows(
+        [
+            [name, "01/01/1990", "5105105105105100", "12/30", "123", ban, "5GB"]
+            for name, ban in zip(names, billing_account_numbers)
+        ]
+    )
+    with Session(db_service.engine) as session:
+        DataBaseService.record_transaction_batch(
+            batch,
+            session,
+            enqueue_invoice_jobs=enqueue_invoice_jobs,
+            upload_id=upload_id,
+        )
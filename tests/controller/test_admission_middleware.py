@@ -0,0 +1,66 @@
+import asyncio
+import httpx
+from app.controller.admission_middleware import AdmissionControlMiddleware
+from app.service.admission_controller import AdmissionController
+
+
+def _admitted_app(unknown_length_bytes=8):
+    uploads = []
+
+    async def app(scope, receive, send):
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        uploads.append(body)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    admission_controller = AdmissionController(
+        max_in_flight_requests=1, max_in_flight_bytes=1024
+    )
+    middleware = AdmissionControlMiddleware(
+        app,
+        admission_controller,
+        paths=["/upload"],
+        unknown_length_bytes=unknown_length_bytes,
+    )
+    return middleware, admission_controller, uploads
+
+
+def _post_chunked(middleware, chunks):
+    async def content():
+        for chunk in chunks:
+            yield chunk
+
+    async def post():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await client.post("/upload", content=content())
+
+    return asyncio.run(post())
+
+
+def test_chunked_upload_within_its_admitted_size_is_passed_on():
+    middleware, admission_controller, uploads = _admitted_app()
+
+    response = _post_chunked(middleware, [b"1234", b"5678"])
+
+    assert response.status_code == 200
+    assert uploads == [b"12345678"]
+    assert admission_controller.in_flight_bytes == 0
+
+
+def test_chunked_upload_over_its_admitted_size_is_rejected():
+    middleware, admission_controller, uploads = _admitted_app()
+
+    response = _post_chunked(middleware, [b"1234", b"5678", b"9"])
+
+    assert response.status_code == 413
+    assert uploads == []
+    assert admission_controller.in_flight_requests == 0
+    assert admission_controller.in_flight_bytes == 0
@@ -0,0 +1,222 @@
+import asyncio
+import datetime
+import json
+import threading
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from luhncheck import is_luhn
+import config
+from sqlmodel import Session, func, select
+from starlette.requests import ClientDisconnect
+from app.controller.api_request_handler import (
+    NDJSON_MEDIA_TYPE,
+    handle_mobile_data_sell_request,
+    handle_mobile_data_sell_request_ndjson,
+)
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.service.db_service import DataBaseService
+from app.service.stage_executor import StageExecutor
+from app.service.write_behind_writer import WriteBehindWriter
+from app.validation.validator import CreditRequestValidator
+from tests.conftest import FakeInvoiceGenerator
+
+validator = CreditRequestValidator(
+    config.LEGAL_AGE,
+    config.MINIMUM_CARD_NUMBER_LENGTH,
+    config.MAXIMUM_CARD_NUMBER_LENGTH,
+    config.MINIMUM_CVV_LENGTH,
+    config.MAXIMUM_CVV_LENGTH,
+    config.DAYS_IN_YEAR,
+    is_luhn,
+    clock=lambda: datetime.datetime(2023, 10, 1, 0, 0, 0),
+)
+
+
+def _ndjson_app(db_service, invoice_generator=None):
+    app = FastAPI()
+
+    @app.post("/mobile-data-purchase-request")
+    async def route(purchase_request: Request):
+        return handle_mobile_data_sell_request_ndjson(
+            purchase_request,
+            db_service,
+            validator,
+            invoice_generator or FakeInvoiceGenerator(),
+            chunk_size=2,
+        )
+
+    return app
+
+
+def test_ndjson_route_streams_one_line_per_row(tmp_path):
+    db_service = DataBaseService(f"sqlite:///{tmp_path / 'test.db'}")
+    db_service.create_db_and_tables()
+    with open("appdata/test_csvs/test_file.csv", "rb") as test_file:
+        upload = test_file.read()
+
+    with TestClient(
+        _ndjson_app(db_service, FakeInvoiceGenerator(broken_bans=["988769"]))
+    ) as client:
+        response = client.post(
+            "/mobile-data-purchase-request",
+            content=upload,
+            headers={"Accept": NDJSON_MEDIA_TYPE},
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(NDJSON_MEDIA_TYPE)
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result["row_index"] for result in results] == [0, 1, 2, 3, 4]
+    assert [
+        result["row_index"]
+        for result in results
+        if result["billing_account_number"] == "987654321"
+    ] == [0, 4]
+    assert [result["invoice_status"] for result in results] == [
+        "Generated",
+        "Generated",
+        "Failed",
+        "Generated",
+        "Generated",
+    ]
+    assert results[2]["invoice_error"] == "Broken template"
+    assert "invoice_error" not in results[0]
+    db_service.close_db_connection()
+
+
+class InterruptedUpload:
+    """
+    This class is a request whose upload fails with an error, by default a client disconnect,
+    once its first rows have been recorded.
+    """
+
+    def __init__(self, db_service, content, error=None):
+        self.db_service = db_service
+        self.content = content
+        self.error = error or ClientDisconnect()
+
+    async def stream(self):
+        yield self.content
+        while not _count(self.db_service, MobileDataPurchaseTransaction):
+            await asyncio.sleep(0.01)
+        raise self.error
+
+
+def _count(db_service, model):
+    with Session(db_service.engine) as session:
+        return session.exec(select(func.count()).select_from(model)).one()
+
+
+def test_failed_upload_discards_its_recorded_transactions(tmp_path):
+    db_service = DataBaseService(f"sqlite:///{tmp_path / 'test.db'}")
+    db_service.create_db_and_tables()
+    with open("appdata/test_csvs/test_file.csv", "rb") as test_file:
+        upload = InterruptedUpload(db_service, test_file.read())
+
+    async def upload_and_disconnect():
+        with Session(db_service.engine) as session:
+            await handle_mobile_data_sell_request(
+                upload, session, validator, FakeInvoiceGenerator(), chunk_size=2
+            )
+
+    with pytest.raises(ClientDisconnect):
+        asyncio.run(upload_and_disconnect())
+
+    assert _count(db_service, MobileDataPurchaseTransaction) == 0
+    db_service.close_db_connection()
+
+
+def test_failed_ndjson_stream_ends_with_an_error_line(tmp_path):
+    db_service = DataBaseService(f"sqlite:///{tmp_path / 'test.db'}")
+    db_service.create_db_and_tables()
+    with open("appdata/test_csvs/test_file.csv", "rb") as test_file:
+        upload = InterruptedUpload(
+            db_service, test_file.read(), RuntimeError("Storage failure")
+        )
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def stream_response():
+        response = handle_mobile_data_sell_request_ndjson(
+            upload, db_service, validator, FakeInvoiceGenerator(), chunk_size=2
+        )
+        await response({"type": "http"}, None, send)
+
+    asyncio.run(stream_response())
+
+    assert messages[0]["status"] == 200
+    assert messages[-1] == {
+        "type": "http.response.body",
+        "body": b"",
+        "more_body": False,
+    }
+    body = b"".join(message.get("body", b"") for message in messages[1:])
+    error_line = json.loads(body.decode().splitlines()[-1])
+    assert error_line == {
+        "status": "Error",
+        "upload_id": dict(messages[0]["headers"])[b"x-upload-id"].decode(),
+        "error": "RuntimeError: Storage failure",
+    }
+    assert _count(db_service, MobileDataPurchaseTransaction) == 0
+    db_service.close_db_connection()
+
+
+class Upload:
+    """
+    This class is a request whose upload is streamed in one piece.
+    """
+
+    def __init__(self, content):
+        self.content = content
+
+    async def stream(self):
+        yield self.content
+
+
+def test_write_behind_rows_are_built_on_the_executor(db_service, monkeypatch):
+    build_transaction_rows_from_batch = (
+        DataBaseService.build_transaction_rows_from_batch
+    )
+    build_threads = []
+
+    def build_rows(batch, upload_id):
+        build_threads.append(threading.current_thread())
+        return build_transaction_rows_from_batch(batch, upload_id)
+
+    monkeypatch.setattr(
+        DataBaseService,
+        "build_transaction_rows_from_batch",
+        staticmethod(build_rows),
+    )
+    with open("appdata/test_csvs/test_file.csv", "rb") as test_file:
+        upload = Upload(test_file.read())
+    executor = StageExecutor(thread_workers=1)
+    transaction_writer = WriteBehindWriter(db_service)
+
+    async def upload_rows():
+        executor.start()
+        transaction_writer.start()
+        try:
+            with Session(db_service.engine) as session:
+                return await handle_mobile_data_sell_request(
+                    upload,
+                    session,
+                    validator,
+                    FakeInvoiceGenerator(),
+                    chunk_size=2,
+                    executor=executor,
+                    transaction_writer=transaction_writer,
+                )
+        finally:
+            await transaction_writer.shutdown()
+            executor.shutdown()
+
+    response = asyncio.run(upload_rows())
+
+    assert response.status_code == 200
+    assert build_threads
+    assert threading.main_thread() not in build_threads
+    assert _count(db_service, MobileDataPurchaseTransaction) == 5
@@ -0,0 +1,186 @@
+import asyncio
+import httpx
+import pytest
+from app.controller.idempotency_middleware import IdempotencyMiddleware
+from app.service.db_service import DataBaseService
+from app.service.idempotency_store import IdempotencyStore
+
+
+def _idempotent_app(tmp_path, response_bodies, max_spooled_bytes=1024):
+    db_service = DataBaseService(f"sqlite:///{tmp_path / 'test.db'}")
+    db_service.create_db_and_tables()
+    calls = []
+
+    async def app(scope, receive, send):
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        calls.append(body)
+        response_body = response_bodies[len(calls) - 1]
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"application/x-ndjson")],
+            }
+        )
+        await send({"type": "http.response.body", "body": response_body})
+
+    middleware = IdempotencyMiddleware(
+        app,
+        IdempotencyStore(db_service, ttl=60, stale_after=10),
+        paths=["/upload"],
+        max_spooled_bytes=max_spooled_bytes,
+        heartbeat_interval=1,
+    )
+    return middleware, calls
+
+
+def _post_twice(middleware, **request_options):
+    async def post_twice():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            first = await client.post("/upload", **request_options)
+            second = await client.post("/upload", **request_options)
+        return first, second
+
+    return asyncio.run(post_twice())
+
+
+def test_retries_get_the_stored_response(tmp_path):
+    middleware, calls = _idempotent_app(tmp_path, [b'{"row_index": 0}\n'])
+
+    first, second = _post_twice(middleware, content=b"row")
+
+    assert len(calls) == 1
+    assert second.content == first.content == b'{"row_index": 0}\n'
+    assert second.headers["idempotent-replayed"] == "true"
+
+
+def test_empty_streamed_responses_are_not_stored(tmp_path):
+    middleware, calls = _idempotent_app(tmp_path, [b"", b'{"row_index": 0}\n'])
+
+    first, second = _post_twice(
+        middleware, content=b"row", headers={"Idempotency-Key": "1"}
+    )
+
+    assert len(calls) == 2
+    assert first.content == b""
+    assert second.content == b'{"row_index": 0}\n'
+    assert "idempotent-replayed" not in second.headers
+
+
+def test_a_key_reused_for_a_different_request_is_rejected(tmp_path):
+    middleware, calls = _idempotent_app(tmp_path, [b"1"])
+
+    async def post_three_requests():
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return [
+                await client.post("/upload", content=body, headers=headers)
+                for body, headers in (
+                    (b"row", {"Idempotency-Key": "1"}),
+                    (b"other row", {"Idempotency-Key": "1"}),
+                    (
+                        b"row",
+                        {"Idempotency-Key": "1", "Accept": "application/x-ndjson"},
+                    ),
+                )
+            ]
+
+    original, other_body, other_accept = asyncio.run(post_three_requests())
+
+    assert calls == [b"row"]
+    assert original.content == b"1"
+    assert other_body.status_code == other_accept.status_code == 422
+
+
+def test_large_bodies_without_a_key_are_not_deduplicated(tmp_path):
+    middleware, calls = _idempotent_app(tmp_path, [b"1", b"2"], max_spooled_bytes=4)
+
+    first, second = _post_twice(middleware, content=b"row 1\nrow 2\n")
+
+    assert calls == [b"row 1\nrow 2\n"] * 2
+    assert (first.content, second.content) == (b"1", b"2")
+
+
+def test_large_streamed_bodies_are_passed_on_in_full(tmp_path):
+    middleware, calls = _idempotent_app(tmp_path, [b"1"], max_spooled_bytes=4)
+
+    async def post_streamed_body():
+        async def body():
+            for block in (b"row 1\n", b"row 2\n", b"row 3\n"):
+                yield block
+
+        transport = httpx.ASGITransport(app=middleware)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await client.post("/upload", content=body())
+
+    response = asyncio.run(post_streamed_body())
+
+    assert response.content == b"1"
+    assert calls == [b"row 1\nrow 2\nrow 3\n"]
+
+
+def test_running_requests_are_kept_from_going_stale(tmp_path):
+    db_service = DataBaseService(f"sqlite:///{tmp_path / 'test.db'}")
+    db_service.create_db_and_tables()
+    idempotency_store = IdempotencyStore(db_service, ttl=60, stale_after=0.3)
+    calls = []
+
+    async def slow_app(scope, receive, send):
+        await receive()
+        calls.append(1)
+        await asyncio.sleep(1)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"done"})
+
+    # Two middlewares over one store stand in for two worker processes
+    workers = [
+        IdempotencyMiddleware(
+            slow_app,
+            idempotency_store,
+            paths=["/upload"],
+            poll_interval=0.05,
+            heartbeat_interval=0.1,
+        )
+        for _ in range(2)
+    ]
+
+    async def post(worker, delay):
+        await asyncio.sleep(delay)
+        transport = httpx.ASGITransport(app=worker)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await client.post(
+                "/upload", content=b"row", headers={"Idempotency-Key": "1"}
+            )
+
+    async def post_and_retry():
+        return await asyncio.gather(post(workers[0], 0), post(workers[1], 0.6))
+
+    original, retry = asyncio.run(post_and_retry())
+
+    assert len(calls) == 1
+    assert original.content == retry.content == b"done"
+    assert retry.headers["idempotent-replayed"] == "true"
+
+
+def test_heartbeat_must_be_shorter_than_stale_after(tmp_path):
+    db_service = DataBaseService(f"sqlite:///{tmp_path / 'test.db'}")
+    idempotency_store = IdempotencyStore(db_service, ttl=60, stale_after=10)
+
+    with pytest.raises(ValueError):
+        IdempotencyMiddleware(
+            None, idempotency_store, paths=["/upload"], heartbeat_interval=10
+        )
@@ -1,6 +1,6 @@
 import pytest
 from pydantic import ValidationError
-from app.model.mobile_data_sell_order import MobileDataSellOrder
+from app.model.mobile_data_sell_order import MobileDataSellOrder, SellOrderParseError
 
 
 def test_parse_date_of_birth():
@@ -104,3 +104,40 @@ def test_build_mobile_data_sell_order_from_list_invalid_date_of_birth():
 
     error_message = str(error_info.value)
     assert "date_of_birth" in error_message
+
+
+def test_build_mobile_data_sell_orders_from_rows():
+    rows = [
+        ["John Doe", "01/01/1990", "1234567890123456", "12/25", "123", "98765", "5GB"],
+        ["Jane Doe", "02/28/1985", "374245455400126", "08/25", "456", "12349", "1GB"],
+    ]
+
+    sell_orders, parse_errors = (
+        MobileDataSellOrder.build_mobile_data_sell_orders_from_rows(rows)
+    )
+
+    assert parse_errors == []
+    assert sell_orders == [
+        MobileDataSellOrder.build_mobile_data_sell_order_from_list(row) for row in rows
+    ]
+
+
+def test_build_mobile_data_sell_orders_from_rows_reports_row_errors():
+    rows = [
+        ["John Doe", "01/01/1990", "1234567890123456", "12/25", "123", "98765", "5GB"],
+        ["Jane Doe", "1985-02-28", "374245455400126", "8/2025", "456", "12349", "1GB"],
+        ["Dean Lawrence", "11/7/1976"],
+    ]
+
+    sell_orders, parse_errors = (
+        MobileDataSellOrder.build_mobile_data_sell_orders_from_rows(
+            rows, first_row_index=10
+        )
+    )
+
+    assert [sell_order.name for sell_order in sell_orders] == ["John Doe"]
+    assert [parse_error.row_index for parse_error in parse_errors] == [11, 12]
+    assert isinstance(parse_errors[0], SellOrderParseError)
+    assert parse_errors[0].errors[0].startswith("date_of_birth")
+    assert parse_errors[0].errors[1].startswith("credit_card_expiration_date")
+    assert parse_errors[1].errors == ["expected 7 fields, got 2"]
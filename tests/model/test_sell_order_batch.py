@@ -0,0 +1,90 @@
+import datetime
+import numpy as np
+import pytest
+from app.model.mobile_data_sell_order import MobileDataSellOrder
+from app.model.sell_order_batch import (
+    SellOrderBatch,
+    SellOrderError,
+    decode_error_codes,
+    decode_error_mask,
+    encode_error_messages,
+)
+
+test_rows = [
+    [
+        "John Doe",
+        "05/14/1990",
+        "406583246170089012345678",
+        "08/25",
+        "123",
+        "98765",
+        "5GB",
+    ],
+    ["Dean Lawrence", "11/7/1976", "374245455400126", "12/22", "456", "12349", "1GB"],
+    ["Jane Doe", "not a date", "374245455400126", "08/25", "123", "988769", "5GB"],
+]
+
+
+def test_decode_error_mask():
+    assert decode_error_mask(0) == []
+    assert decode_error_mask(
+        SellOrderError.CARD_EXPIRED | SellOrderError.NOT_OF_LEGAL_AGE
+    ) == ["Customer is not of legal age", "Credit card has expired"]
+
+
+def test_decode_error_codes():
+    assert decode_error_codes(0) == []
+    assert decode_error_codes(
+        SellOrderError.CARD_EXPIRED | SellOrderError.NOT_OF_LEGAL_AGE
+    ) == ["NOT_OF_LEGAL_AGE", "CARD_EXPIRED"]
+
+
+def test_encode_error_messages():
+    assert encode_error_messages(["CVV length is invalid"]) == (
+        SellOrderError.CVV_LENGTH_INVALID
+    )
+    with pytest.raises(ValueError):
+        encode_error_messages(["Invalid credit card number"])
+
+
+def test_from_rows():
+    batch, parse_errors = SellOrderBatch.from_rows(test_rows, first_row_index=5)
+
+    assert len(batch) == 2
+    assert [parse_error.row_index for parse_error in parse_errors] == [7]
+    assert batch.billing_account_number.tolist() == ["98765", "12349"]
+    assert batch.date_of_birth[1].item() == datetime.datetime(1976, 11, 7)
+    assert batch.error_mask.tolist() == [0, 0]
+    assert batch.to_sell_orders() == [
+        MobileDataSellOrder.build_mobile_data_sell_order_from_list(row)
+        for row in test_rows[:2]
+    ]
+
+
+def test_from_sell_orders_round_trip():
+    sell_order = MobileDataSellOrder.build_mobile_data_sell_order_from_list(
+        test_rows[0]
+    )
+    sell_order.status = "Rejected"
+    sell_order.validation_errors = ["Credit card has expired"]
+
+    batch = SellOrderBatch.from_sell_orders([sell_order])
+
+    assert batch.error_mask.tolist() == [SellOrderError.CARD_EXPIRED]
+    assert batch.sell_order_at(0) == sell_order
+
+
+def test_with_error_mask_and_slicing():
+    batch, _ = SellOrderBatch.from_rows(test_rows[:2])
+    validated_batch = batch.with_error_mask(
+        np.array([0, SellOrderError.CVV_LENGTH_INVALID])
+    )
+
+    assert batch.error_mask.tolist() == [0, 0]
+    assert validated_batch.statuses().tolist() == ["Approved", "Rejected"]
+    assert validated_batch.validation_errors_at(1) == ["CVV length is invalid"]
+    assert len(validated_batch[1:]) == 1
+    assert validated_batch[1:].status_at(0) == "Rejected"
+
+    with pytest.raises(ValueError):
+        batch.with_error_mask(np.array([0]))
@@ -0,0 +1,67 @@
+import asyncio
+import pytest
+from app.service.admission_controller import AdmissionController, AdmissionRejected
+
+
+def _rejection(admission_controller, request_bytes):
+    with pytest.raises(AdmissionRejected) as rejection:
+        asyncio.run(admission_controller.acquire(request_bytes))
+    return rejection.value
+
+
+def test_acquire_and_release_track_requests_and_bytes():
+    admission_controller = AdmissionController(2, 100)
+
+    asyncio.run(admission_controller.acquire(40))
+    asyncio.run(admission_controller.acquire(60))
+    assert admission_controller.in_flight_requests == 2
+    assert admission_controller.in_flight_bytes == 100
+
+    admission_controller.release(40)
+    assert admission_controller.in_flight_requests == 1
+    assert admission_controller.in_flight_bytes == 60
+
+
+def test_acquire_rejects_when_nothing_may_wait():
+    admission_controller = AdmissionController(1, 100, retry_after=7)
+    asyncio.run(admission_controller.acquire(10))
+
+    rejection = _rejection(admission_controller, 10)
+    assert (rejection.status_code, rejection.retry_after) == (429, 7)
+
+    rejection = _rejection(AdmissionController(1, 100), 101)
+    assert (rejection.status_code, rejection.retry_after) == (413, None)
+
+
+def test_acquire_rejects_over_the_byte_cap():
+    admission_controller = AdmissionController(10, 100)
+    asyncio.run(admission_controller.acquire(80))
+
+    assert _rejection(admission_controller, 30).status_code == 429
+
+
+def test_waiting_request_is_admitted_on_release():
+    admission_controller = AdmissionController(1, 100, max_waiting=1)
+
+    async def wait_for_slot():
+        await admission_controller.acquire(10)
+        waiting = asyncio.create_task(admission_controller.acquire(20))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejection:
+            await admission_controller.acquire(30)
+        admission_controller.release(10)
+        await waiting
+        return rejection.value.status_code
+
+    assert asyncio.run(wait_for_slot()) == 429
+    assert admission_controller.in_flight_requests == 1
+    assert admission_controller.in_flight_bytes == 20
+
+
+def test_waiting_request_times_out():
+    admission_controller = AdmissionController(1, 100, max_waiting=1, wait_timeout=0.01)
+    asyncio.run(admission_controller.acquire(10))
+
+    assert _rejection(admission_controller, 10).status_code == 503
+    assert admission_controller.in_flight_requests == 1
+    assert admission_controller._waiters == []
@@ -0,0 +1,207 @@
+import asyncio
+import datetime
+import os
+import pytest
+from luhncheck import is_luhn
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+import config
+from app.model.batch_job import BatchJob
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.model.sell_order_batch import SellOrderBatch
+from app.service.batch_job_runner import BatchJobRunner
+from app.service.db_service import BatchJobLeaseLostError
+from app.validation.validator import CreditRequestValidator
+from tests.conftest import FakeInvoiceGenerator
+
+validator = CreditRequestValidator(
+    config.LEGAL_AGE,
+    config.MINIMUM_CARD_NUMBER_LENGTH,
+    config.MAXIMUM_CARD_NUMBER_LENGTH,
+    config.MINIMUM_CVV_LENGTH,
+    config.MAXIMUM_CVV_LENGTH,
+    config.DAYS_IN_YEAR,
+    is_luhn,
+    clock=lambda: datetime.datetime(2023, 10, 1, 0, 0, 0),
+)
+
+upload = (
+    "John Doe,01/01/1990,5105105105105100,12/30,123,1,5GB\n"
+    "Jane Doe,not a date,5105105105105100,12/30,123,2,5GB\n"
+    "Young Doe,01/01/2015,5105105105105100,12/30,123,3,5GB\n"
+    "Dean Doe,01/01/1980,5105105105105100,12/30,123,4,1GB\n"
+    "Anna Doe,01/01/1985,5105105105105100,12/30,123,5,1GB\n"
+).encode()
+
+
+async def _byte_stream(content):
+    yield content[:20]
+    yield content[20:]
+
+
+def _batch_job_runner(db_service, tmp_path, broken=False, max_attempts=3):
+    return BatchJobRunner(
+        db_service,
+        validator,
+        FakeInvoiceGenerator(broken=broken),
+        str(tmp_path / "uploads"),
+        chunk_size=2,
+        max_attempts=max_attempts,
+    )
+
+
+def _recorded_bans(db_service, job_id):
+    statement = (
+        select(MobileDataPurchaseTransaction.billing_account_number)
+        .where(MobileDataPurchaseTransaction.upload_id == job_id)
+        .order_by(MobileDataPurchaseTransaction.billing_account_number)
+    )
+    with Session(db_service.engine) as session:
+        return list(session.scalars(statement))
+
+
+def _record_first_chunk(db_service, job):
+    first_batch_runner = BatchJobRunner(
+        db_service, validator, FakeInvoiceGenerator(), "", chunk_size=3
+    )
+    chunks = first_batch_runner._remaining_row_chunks(job.upload_path, 0)
+
+    async def record_first_chunk():
+        first_row_index, rows = await chunks.__anext__()
+        await chunks.aclose()
+        batch, parse_errors = SellOrderBatch.from_rows(rows, first_row_index)
+        first_batch_runner.record_chunk(job.id, batch, parse_errors, 3, job.attempts)
+
+    asyncio.run(record_first_chunk())
+
+
+def _expire_leases(db_service):
+    with Session(db_service.engine) as session:
+        session.execute(
+            update(BatchJob).values(
+                updated_at=datetime.datetime.now() - datetime.timedelta(hours=1)
+            )
+        )
+        session.commit()
+
+
+def test_create_job_stores_the_upload(db_service, tmp_path):
+    batch_job_runner = _batch_job_runner(db_service, tmp_path)
+
+    job = asyncio.run(batch_job_runner.create_job(_byte_stream(upload)))
+
+    assert open(job.upload_path, "rb").read() == upload
+    assert batch_job_runner.get_job(job.id).status == "pending"
+
+
+def test_process_next_job_records_every_chunk(db_service, tmp_path):
+    batch_job_runner = _batch_job_runner(db_service, tmp_path)
+    job = asyncio.run(batch_job_runner.create_job(_byte_stream(upload)))
+
+    assert asyncio.run(batch_job_runner.process_next_job())
+    assert not asyncio.run(batch_job_runner.process_next_job())
+
+    completed_job = batch_job_runner.get_job(job.id)
+    assert completed_job.status == "done"
+    assert (
+        completed_job.next_row_index,
+        completed_job.rows_recorded,
+        completed_job.rows_unparseable,
+    ) == (5, 4, 1)
+    assert _recorded_bans(db_service, job.id) == ["1", "3", "4", "5"]
+    assert batch_job_runner.invoice_generator.invoiced_bans == ["1", "3", "4", "5"]
+    assert not os.path.exists(job.upload_path)
+
+    parse_errors = batch_job_runner.load_parse_error_page(job.id, 0, 10)
+    assert [parse_error.row_index for parse_error in parse_errors] == [1]
+    page = batch_job_runner.load_transaction_page(job.id, 0, 3)
+    assert [transaction.status for _, transaction in page] == [
+        "Approved",
+        "Rejected",
+        "Approved",
+    ]
+    next_page = batch_job_runner.load_transaction_page(job.id, page[-1][0], 3)
+    assert [transaction.billing_account_number for _, transaction in next_page] == ["5"]
+
+
+def test_interrupted_job_resumes_from_its_checkpoint(db_service, tmp_path):
+    batch_job_runner = _batch_job_runner(db_service, tmp_path)
+    job = asyncio.run(batch_job_runner.create_job(_byte_stream(upload)))
+    claimed_job = batch_job_runner.claim_job()
+
+    # The worker recorded the first chunk of three rows, but not its invoices, before it was
+    # stopped
+    _record_first_chunk(db_service, claimed_job)
+    _expire_leases(db_service)
+
+    assert asyncio.run(batch_job_runner.process_next_job())
+
+    resumed_job = batch_job_runner.get_job(job.id)
+    assert (resumed_job.status, resumed_job.attempts) == ("done", 2)
+    assert (resumed_job.rows_recorded, resumed_job.rows_invoiced) == (4, 4)
+    assert _recorded_bans(db_service, job.id) == ["1", "3", "4", "5"]
+    assert batch_job_runner.invoice_generator.invoiced_bans == ["1", "3", "4", "5"]
+
+
+def test_running_job_is_not_claimed_while_its_lease_is_live(db_service, tmp_path):
+    batch_job_runner = _batch_job_runner(db_service, tmp_path)
+    job = asyncio.run(batch_job_runner.create_job(_byte_stream(upload)))
+    batch_job_runner.claim_job()
+
+    assert batch_job_runner.claim_job() is None
+    assert batch_job_runner.get_job(job.id).status == "running"
+
+
+def test_taken_over_job_ignores_its_previous_worker(db_service, tmp_path):
+    batch_job_runner = _batch_job_runner(db_service, tmp_path)
+    job = asyncio.run(batch_job_runner.create_job(_byte_stream(upload)))
+    first_claim = batch_job_runner.claim_job()
+    _expire_leases(db_service)
+    second_claim = batch_job_runner.claim_job()
+
+    with pytest.raises(BatchJobLeaseLostError):
+        _record_first_chunk(db_service, first_claim)
+    batch_job_runner.complete_job(first_claim)
+
+    assert not batch_job_runner.renew_lease(first_claim)
+    assert batch_job_runner.renew_lease(second_claim)
+    taken_over_job = batch_job_runner.get_job(job.id)
+    assert (taken_over_job.status, taken_over_job.next_row_index) == ("running", 0)
+    assert _recorded_bans(db_service, job.id) == []
+    assert os.path.exists(job.upload_path)
+
+
+def test_expired_lease_on_last_attempt_fails(db_service, tmp_path):
+    batch_job_runner = _batch_job_runner(db_service, tmp_path, max_attempts=1)
+    job = asyncio.run(batch_job_runner.create_job(_byte_stream(upload)))
+    batch_job_runner.claim_job()
+    _expire_leases(db_service)
+
+    assert batch_job_runner.claim_job() is None
+    assert batch_job_runner.get_job(job.id).status == "failed"
+
+
+def test_invoice_failures_do_not_fail_the_job(db_service, tmp_path):
+    batch_job_runner = _batch_job_runner(db_service, tmp_path, broken=True)
+    job = asyncio.run(batch_job_runner.create_job(_byte_stream(upload)))
+
+    asyncio.run(batch_job_runner.process_next_job())
+
+    assert batch_job_runner.get_job(job.id).status == "done"
+    assert _recorded_bans(db_service, job.id) == ["1", "3", "4", "5"]
+
+
+def test_failed_job_is_retried_until_max_attempts(db_service, tmp_path):
+    batch_job_runner = _batch_job_runner(db_service, tmp_path, max_attempts=2)
+    job = asyncio.run(batch_job_runner.create_job(_byte_stream(upload)))
+    os.remove(job.upload_path)
+
+    asyncio.run(batch_job_runner.process_next_job())
+    assert batch_job_runner.get_job(job.id).status == "pending"
+
+    asyncio.run(batch_job_runner.process_next_job())
+    failed_job = batch_job_runner.get_job(job.id)
+    assert (failed_job.status, failed_job.attempts) == ("failed", 2)
+    assert failed_job.error.startswith("FileNotFoundError")
+    with Session(db_service.engine) as session:
+        assert session.scalar(select(func.count(BatchJob.id))) == 1
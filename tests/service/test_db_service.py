@@ -1,8 +1,22 @@
 from app.model.mobile_data_sell_order import MobileDataSellOrder
 from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
-from app.service.db_service import DataBaseService
-from sqlalchemy import inspect
+from app.model.invoice_job import InvoiceJob
+from app.model.sell_order_batch import SellOrderBatch, SellOrderError
+from app.service.db_service import (
+    DataBaseService,
+    TransactionChunkError,
+    async_database_url,
+)
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+import config
 from unittest.mock import MagicMock
+import asyncio
+import threading
+import time
+import pytest
 
 
 def test_create_db_and_tables(db_service):
@@ -67,3 +81,298 @@ def test_record_transactions(db_service):
     assert result[0].validation_errors == ""
     assert result[1].validation_errors == "Invalid credit card number"
     assert result[0].credit_card_number == sample_orders[0].credit_card_number
+
+
+def test_record_transaction_batch(db_service):
+    batch, _ = SellOrderBatch.from_rows(
+        [
+            [
+                "John Doe",
+                "01/01/1990",
+                "1234567890123456",
+                "12/25",
+                "123",
+                "98765",
+                "5GB",
+            ],
+            [
+                "Jane Doe",
+                "02/02/1992",
+                "6543210987654321",
+                "11/24",
+                "456",
+                "1234",
+                "2GB",
+            ],
+        ]
+    )
+    batch = batch.with_error_mask(
+        [0, SellOrderError.CARD_NUMBER_INVALID | SellOrderError.CARD_EXPIRED]
+    )
+
+    session = next(db_service.get_db_session())
+    DataBaseService.record_transaction_batch(batch, session)
+
+    result = session.query(MobileDataPurchaseTransaction).all()
+    assert len(result) == 2
+    assert result[0].status == "Approved"
+    assert result[0].validation_errors == ""
+    assert result[1].status == "Rejected"
+    assert result[1].validation_errors == (
+        "Credit card number is invalid, Credit card has expired"
+    )
+
+
+def _sample_sell_order(name, billing_account_number):
+    return MobileDataSellOrder(
+        name=name,
+        date_of_birth="01/01/1990",
+        credit_card_number="1234567890123456",
+        credit_card_expiration_date="12/25",
+        credit_card_cvv="123",
+        billing_account_number=billing_account_number,
+        requested_mobile_data="10GB",
+        status="Rejected",
+        validation_errors=["Credit card number is invalid", "Credit card has expired"],
+    )
+
+
+def test_record_transactions_bulk(db_service):
+    sample_orders = [_sample_sell_order(f"Customer {i}", str(i)) for i in range(5)]
+
+    session = next(db_service.get_db_session())
+    rows_written = DataBaseService.record_transactions_bulk(
+        sample_orders, session, chunk_size=2
+    )
+
+    result = session.query(MobileDataPurchaseTransaction).all()
+    assert rows_written == 5
+    assert sorted(row.billing_account_number for row in result) == [
+        "0",
+        "1",
+        "2",
+        "3",
+        "4",
+    ]
+    assert len({row.id for row in result}) == 5
+    assert result[0].validation_errors == (
+        "Credit card number is invalid, Credit card has expired"
+    )
+
+
+def test_insert_transaction_rows_rolls_back_failed_chunk(db_service):
+    rows = DataBaseService.build_transaction_rows(
+        [_sample_sell_order(f"Customer {i}", str(i)) for i in range(4)]
+    )
+    rows[3]["name"] = None
+
+    session = next(db_service.get_db_session())
+    with pytest.raises(TransactionChunkError) as error_info:
+        DataBaseService.insert_transaction_rows(rows, session, chunk_size=2)
+
+    assert error_info.value.chunk_index == 1
+    assert error_info.value.first_row == 2
+    assert error_info.value.row_count == 2
+    assert session.query(MobileDataPurchaseTransaction).count() == 2
+
+
+def test_discard_upload_deletes_its_transactions_and_invoice_jobs(db_service):
+    session = next(db_service.get_db_session())
+    for upload_id, names in (
+        ("kept", ["Customer 0"]),
+        ("failed", ["Customer 1", "Customer 2"]),
+    ):
+        rows = DataBaseService.build_transaction_rows(
+            [_sample_sell_order(name, name[-1]) for name in names]
+        )
+        for row in rows:
+            row["upload_id"] = upload_id
+        DataBaseService.insert_transaction_rows(
+            rows, session, enqueue_invoice_jobs=True
+        )
+
+    discarded = DataBaseService.discard_upload("failed", session)
+
+    assert sorted(discarded) == ["1", "2"]
+    remaining = session.query(MobileDataPurchaseTransaction).all()
+    assert [row.upload_id for row in remaining] == ["kept"]
+    assert [job.transaction_id for job in session.query(InvoiceJob).all()] == [
+        remaining[0].id
+    ]
+
+
+def test_sqlite_profile_applied_on_connect(tmp_path):
+    db_service = DataBaseService(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        sqlite_pragmas=config.SQLITE_PROFILES["performance"],
+        pool_size=2,
+        max_overflow=1,
+    )
+    db_service.create_db_and_tables()
+
+    effective_pragmas = db_service.log_effective_pragmas()
+
+    assert isinstance(db_service.engine.pool, QueuePool)
+    assert db_service.engine.pool.size() == 2
+    assert effective_pragmas["journal_mode"] == "wal"
+    assert effective_pragmas["synchronous"] == 1
+    assert effective_pragmas["cache_size"] == -65536
+    assert effective_pragmas["temp_store"] == 2
+    assert effective_pragmas["busy_timeout"] == 5000
+    db_service.close_db_connection()
+
+
+def test_in_memory_database_pools_a_single_connection():
+    db_service = DataBaseService("sqlite:///:memory:", pool_size=2)
+
+    assert isinstance(db_service.engine.pool, QueuePool)
+    assert db_service.engine.pool.size() == 1
+    assert db_service.log_effective_pragmas() == {}
+
+
+def test_in_memory_database_is_used_by_one_thread_at_a_time(db_service):
+    active_connections = []
+    overlaps = []
+
+    def use_connection():
+        with db_service.engine.connect() as connection:
+            active_connections.append(connection)
+            overlaps.append(len(active_connections))
+            connection.execute(text("SELECT COUNT(*) FROM invoicejob")).scalar()
+            time.sleep(0.01)
+            active_connections.remove(connection)
+
+    threads = [threading.Thread(target=use_connection) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == [1, 1, 1, 1]
+
+
+def test_unsupported_sqlite_pragma():
+    with pytest.raises(ValueError):
+        DataBaseService("sqlite:///:memory:", sqlite_pragmas={"key": "secret"})
+    with pytest.raises(ValueError):
+        DataBaseService(
+            "sqlite:///:memory:", sqlite_pragmas={"journal_mode": "WAL; DROP TABLE x"}
+        )
+
+
+def test_async_database_url():
+    assert async_database_url("sqlite:///:memory:") == "sqlite+aiosqlite:///:memory:"
+    assert async_database_url("sqlite:///data/app.db") == (
+        "sqlite+aiosqlite:///data/app.db"
+    )
+    assert async_database_url("postgresql+asyncpg://db/app") == (
+        "postgresql+asyncpg://db/app"
+    )
+
+
+def test_get_async_db_session_requires_async_engine(db_service):
+    with pytest.raises(RuntimeError):
+        asyncio.run(db_service.get_async_db_session().__anext__())
+
+
+def test_request_session(db_service):
+    async def open_sessions():
+        async with db_service.request_session() as session:
+            sync_session = session
+        async_db_service = DataBaseService("sqlite:///:memory:", enable_async=True)
+        async with async_db_service.request_session() as session:
+            async_session = session
+        await async_db_service.close_async_db_connection()
+        return sync_session, async_session
+
+    sync_session, async_session = asyncio.run(open_sessions())
+
+    assert isinstance(sync_session, Session)
+    assert isinstance(async_session, AsyncSession)
+
+
+def test_record_transactions_async(tmp_path):
+    db_service = DataBaseService(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        sqlite_pragmas=config.SQLITE_PROFILES["performance"],
+        enable_async=True,
+    )
+    db_service.create_db_and_tables()
+    sample_orders = [_sample_sell_order(f"Customer {i}", str(i)) for i in range(3)]
+
+    async def record_and_count():
+        session_generator = db_service.get_async_db_session()
+        session = await session_generator.__anext__()
+        rows_written = await DataBaseService.record_transactions_async(
+            sample_orders, session, chunk_size=2
+        )
+        journal_mode = (await session.execute(text("PRAGMA journal_mode"))).scalar()
+        await session_generator.aclose()
+        await db_service.close_async_db_connection()
+        return rows_written, journal_mode
+
+    rows_written, journal_mode = asyncio.run(record_and_count())
+
+    session = next(db_service.get_db_session())
+    assert rows_written == 3
+    assert journal_mode == "wal"
+    assert session.scalar(select(func.count(MobileDataPurchaseTransaction.id))) == 3
+
+
+def test_record_transaction_batch_async_in_memory():
+    db_service = DataBaseService("sqlite:///:memory:", enable_async=True)
+    batch, _ = SellOrderBatch.from_rows(
+        [["John Doe", "01/01/1990", "1234567890123456", "12/25", "123", "98765", "5GB"]]
+    )
+
+    async def record_and_read():
+        await db_service.create_async_db_and_tables()
+        async with db_service.async_session_factory() as session:
+            await DataBaseService.record_transaction_batch_async(batch, session)
+            result = await session.execute(select(MobileDataPurchaseTransaction))
+            transactions = result.scalars().all()
+        await db_service.close_async_db_connection()
+        return transactions
+
+    transactions = asyncio.run(record_and_read())
+
+    assert [transaction.billing_account_number for transaction in transactions] == [
+        "98765"
+    ]
+
+
+def test_create_db_and_tables_adds_missing_columns(tmp_path):
+    path_to_db_file = f"sqlite:///{tmp_path / 'old.db'}"
+    db_service = DataBaseService(path_to_db_file)
+    with db_service.engine.begin() as connection:
+        connection.execute(
+            text(
+                "CREATE TABLE mobiledatapurchasetransaction (id VARCHAR, name VARCHAR, "
+                "date_of_birth DATETIME, credit_card_number VARCHAR, "
+                "credit_card_expiration_date DATETIME, credit_card_cvv VARCHAR, "
+                "billing_account_number VARCHAR, requested_mobile_data VARCHAR, "
+                "status VARCHAR, validation_errors VARCHAR, "
+                "PRIMARY KEY (id, credit_card_number))"
+            )
+        )
+
+    db_service.create_db_and_tables()
+
+    inspector = inspect(db_service.engine)
+    column_names = [
+        column["name"]
+        for column in inspector.get_columns("mobiledatapurchasetransaction")
+    ]
+    index_names = [
+        index["name"]
+        for index in inspector.get_indexes("mobiledatapurchasetransaction")
+    ]
+    assert "upload_id" in column_names
+    assert "ix_mobiledatapurchasetransaction_upload_id" in index_names
+    assert "created_at" in column_names
+    assert {
+        "ix_mobiledatapurchasetransaction_created_at",
+        "ix_mobiledatapurchasetransaction_billing_account_number_created_at",
+        "ix_mobiledatapurchasetransaction_status_created_at",
+    } <= set(index_names)
+    db_service.close_db_connection()
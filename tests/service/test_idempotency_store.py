@@ -0,0 +1,94 @@
+import datetime
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from app.model.idempotency_record import IdempotencyRecord
+from app.service.idempotency_store import IdempotencyStore
+
+
+def _idempotency_store(db_service):
+    return IdempotencyStore(db_service, ttl=60, stale_after=10)
+
+
+def _age_record(db_service, key, seconds):
+    with Session(db_service.engine) as session:
+        session.execute(
+            update(IdempotencyRecord)
+            .where(IdempotencyRecord.key == key)
+            .values(
+                updated_at=datetime.datetime.now() - datetime.timedelta(seconds=seconds)
+            )
+        )
+        session.commit()
+
+
+def test_claim_complete_and_replay(db_service):
+    idempotency_store = _idempotency_store(db_service)
+
+    assert idempotency_store.claim("key:1") is None
+    assert idempotency_store.claim("key:1").status == "in_progress"
+
+    idempotency_store.complete(
+        "key:1", 200, [("content-type", "application/json")], b'{"ok": true}'
+    )
+    record = idempotency_store.claim("key:1")
+
+    assert (record.status, record.status_code, record.response_body) == (
+        "completed",
+        200,
+        b'{"ok": true}',
+    )
+    assert record.response_headers == '[["content-type", "application/json"]]'
+
+
+def test_release_lets_the_next_request_run(db_service):
+    idempotency_store = _idempotency_store(db_service)
+    idempotency_store.claim("key:1")
+
+    idempotency_store.release("key:1")
+
+    assert idempotency_store.claim("key:1") is None
+
+
+def test_expired_records_are_claimed_again(db_service):
+    idempotency_store = _idempotency_store(db_service)
+    idempotency_store.claim("key:running")
+    idempotency_store.claim("key:completed")
+    idempotency_store.complete("key:completed", 200, [], b"")
+
+    _age_record(db_service, "key:running", 11)
+    _age_record(db_service, "key:completed", 11)
+
+    assert idempotency_store.claim("key:running") is None
+    assert idempotency_store.claim("key:completed").status == "completed"
+
+    _age_record(db_service, "key:completed", 61)
+
+    assert idempotency_store.claim("key:completed") is None
+    assert idempotency_store.claim("key:completed").status == "in_progress"
+
+
+def test_touch_keeps_a_running_record_claimed(db_service):
+    idempotency_store = _idempotency_store(db_service)
+    idempotency_store.claim("key:running")
+    _age_record(db_service, "key:running", 11)
+
+    idempotency_store.touch("key:running")
+
+    assert idempotency_store.claim("key:running").status == "in_progress"
+
+
+def test_purge_expired_deletes_only_expired_records(db_service):
+    idempotency_store = _idempotency_store(db_service)
+    for key in ("key:running", "key:stale", "key:completed", "key:expired"):
+        idempotency_store.claim(key)
+    idempotency_store.complete("key:completed", 200, [], b"")
+    idempotency_store.complete("key:expired", 200, [], b"")
+
+    _age_record(db_service, "key:stale", 11)
+    _age_record(db_service, "key:completed", 11)
+    _age_record(db_service, "key:expired", 61)
+
+    assert idempotency_store.purge_expired() == 2
+    with Session(db_service.engine) as session:
+        remaining = session.query(IdempotencyRecord.key).all()
+    assert sorted(key for key, in remaining) == ["key:completed", "key:running"]
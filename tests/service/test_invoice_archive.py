@@ -0,0 +1,55 @@
+import asyncio
+import io
+import zipfile
+from app.service.invoice_archive import InvoiceArchive
+from tests.conftest import record_orders
+
+
+class FakeInvoiceCache:
+    def __init__(self, tmp_path):
+        self.tmp_path = tmp_path
+
+    async def get_invoice(self, billing_account_number):
+        if billing_account_number == "missing":
+            return None
+        invoice_path = self.tmp_path / f"invoice_{billing_account_number}.pdf"
+        invoice_path.write_bytes(b"%PDF " + billing_account_number.encode() * 10)
+        return str(invoice_path)
+
+
+def _read_archive(invoice_archive, billing_account_numbers):
+    async def collect():
+        return [
+            chunk async for chunk in invoice_archive.stream(billing_account_numbers)
+        ]
+
+    chunks = asyncio.run(collect())
+    return chunks, zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+
+
+def test_load_upload_billing_account_numbers(db_service):
+    record_orders(db_service, ["John Doe"] * 3, ["3", "1", "3"], "upload-1")
+    record_orders(db_service, ["John Doe"], ["2"], "upload-2")
+    invoice_archive = InvoiceArchive(db_service, FakeInvoiceCache(None))
+
+    assert invoice_archive.load_upload_billing_account_numbers("upload-1") == [
+        "3",
+        "1",
+    ]
+    assert invoice_archive.load_upload_billing_account_numbers("unknown") == []
+
+
+def test_stream_invoice_archive(db_service, tmp_path):
+    invoice_archive = InvoiceArchive(
+        db_service, FakeInvoiceCache(tmp_path), chunk_size=8
+    )
+
+    chunks, archive = _read_archive(invoice_archive, ["1", "missing", "2", "1"])
+
+    assert len(chunks) > 3
+    assert archive.namelist() == ["invoice_1.pdf", "invoice_2.pdf"]
+    assert archive.read("invoice_2.pdf") == b"%PDF " + b"2" * 10
+    assert all(
+        entry.compress_type == zipfile.ZIP_STORED for entry in archive.infolist()
+    )
+    assert archive.testzip() is None
@@ -0,0 +1,105 @@
+import asyncio
+import time
+from app.service.invoice_cache import InvoiceCache, etag_matches, invoice_etag
+from tests.conftest import FakeInvoiceGenerator, record_orders
+
+
+def _invoice_cache(db_service, tmp_path):
+    return InvoiceCache(db_service, FakeInvoiceGenerator(str(tmp_path)), str(tmp_path))
+
+
+def test_get_invoice_renders_once(db_service, tmp_path):
+    record_orders(db_service, ["John Doe"], ["98765"])
+    invoice_cache = _invoice_cache(db_service, tmp_path)
+
+    async def download_twice():
+        return await asyncio.gather(
+            invoice_cache.get_invoice("98765"), invoice_cache.get_invoice("98765")
+        )
+
+    first_path, second_path = asyncio.run(download_twice())
+    third_path = asyncio.run(invoice_cache.get_invoice("98765"))
+
+    assert (
+        first_path == second_path == third_path == str(tmp_path / "invoice_98765.pdf")
+    )
+    assert invoice_cache.invoice_generator.rendered_names == ["John Doe"]
+
+
+def test_get_invoice_unknown_billing_account_number(db_service, tmp_path):
+    invoice_cache = _invoice_cache(db_service, tmp_path)
+
+    assert asyncio.run(invoice_cache.get_invoice("98765")) is None
+
+
+def test_invalidate_renders_the_latest_transaction(db_service, tmp_path):
+    record_orders(db_service, ["John Doe"], ["98765"])
+    invoice_cache = _invoice_cache(db_service, tmp_path)
+    asyncio.run(invoice_cache.get_invoice("98765"))
+
+    record_orders(db_service, ["Jane Doe"], ["98765"])
+    invoice_cache.invalidate(["98765", "12345"])
+    invoice_path = asyncio.run(invoice_cache.get_invoice("98765"))
+
+    assert open(invoice_path).read() == "Jane Doe"
+    assert invoice_cache.invoice_generator.rendered_names == ["John Doe", "Jane Doe"]
+
+
+def test_a_purchase_recorded_during_a_render_is_not_left_stale(db_service, tmp_path):
+    record_orders(db_service, ["John Doe"], ["98765"])
+    invoice_cache = _invoice_cache(db_service, tmp_path)
+    render = invoice_cache.invoice_generator.generate_pdf_invoice
+
+    def render_while_a_purchase_is_recorded(sell_order):
+        if sell_order.name == "John Doe":
+            record_orders(db_service, ["Jane Doe"], ["98765"])
+            invoice_cache.invalidate(["98765"])
+        return render(sell_order)
+
+    invoice_cache.invoice_generator.generate_pdf_invoice = (
+        render_while_a_purchase_is_recorded
+    )
+    invoice_path = asyncio.run(invoice_cache.get_invoice("98765"))
+
+    assert open(invoice_path).read() == "Jane Doe"
+    assert invoice_cache.invoice_generator.rendered_names == ["John Doe", "Jane Doe"]
+
+
+def test_requests_waiting_for_a_render_share_its_lock(db_service, tmp_path):
+    invoice_cache = _invoice_cache(db_service, tmp_path)
+    loads = {"running": 0, "most_running": 0}
+
+    def slow_load(billing_account_number):
+        loads["running"] += 1
+        loads["most_running"] = max(loads["most_running"], loads["running"])
+        time.sleep(0.05)
+        loads["running"] -= 1
+        return None
+
+    invoice_cache.load_latest_transaction = slow_load
+
+    async def download_three_times():
+        first = asyncio.create_task(invoice_cache.get_invoice("98765"))
+        second = asyncio.create_task(invoice_cache.get_invoice("98765"))
+        await first
+        # The second request still holds the lock, so the third one must wait for it
+        third = asyncio.create_task(invoice_cache.get_invoice("98765"))
+        await asyncio.gather(second, third)
+
+    asyncio.run(download_three_times())
+
+    assert loads["most_running"] == 1
+    assert invoice_cache._render_locks == {}
+
+
+def test_etag_matches(tmp_path):
+    invoice_path = tmp_path / "invoice_98765.pdf"
+    invoice_path.write_text("PDF")
+    etag = invoice_etag(str(invoice_path))
+
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
@@ -0,0 +1,160 @@
+import os
+import re
+import threading
+import pytest
+import config
+from app.model.mobile_data_sell_order import MobileDataSellOrder
+
+try:
+    from app.service.invoice_generator import (
+        SEPARATE_DOCUMENTS,
+        SPLIT_DOCUMENT,
+        STATEMENT_DOCUMENT,
+        STATEMENT_FILE_PREFIX,
+        _invoice_page_ranges,
+        build_invoice_generator,
+    )
+except (ImportError, OSError) as error:
+    # WeasyPrint raises an OSError when the Pango system libraries are missing
+    pytest.skip(f"WeasyPrint is not available: {error}", allow_module_level=True)
+
+BILLING_ACCOUNT_NUMBERS = ["111", "222", "333"]
+
+
+def _sell_order(billing_account_number):
+    return MobileDataSellOrder(
+        name=f"Customer {billing_account_number}",
+        date_of_birth="01/01/1990",
+        credit_card_number="4065832461700890",
+        credit_card_expiration_date="12/25",
+        credit_card_cvv="123",
+        billing_account_number=billing_account_number,
+        requested_mobile_data="5GB",
+        status="Approved",
+        validation_errors=[],
+    )
+
+
+def _invoice_generator(tmp_path, document_mode, **options):
+    return build_invoice_generator(
+        invoice_template_path=config.INVOICE_TEMPLATE_PATH,
+        pdf_output_path=str(tmp_path),
+        qr_code_base_url=config.QR_CODE_BASE_URL,
+        html_template=config.HTML_TEMPLATE,
+        stylesheet=config.INVOICE_STYLESHEET,
+        document_mode=document_mode,
+        **options,
+    )
+
+
+def _pdf_page_count(path):
+    with open(path, "rb") as pdf_file:
+        return len(re.findall(rb"/Type\s*/Page(?!s)", pdf_file.read()))
+
+
+def test_split_document_gives_each_invoice_exactly_its_own_pages(tmp_path):
+    invoice_generator = _invoice_generator(tmp_path, SPLIT_DOCUMENT)
+    sell_orders = [_sell_order(ban) for ban in BILLING_ACCOUNT_NUMBERS]
+
+    document = invoice_generator.render_invoice_document(sell_orders)
+    page_ranges = _invoice_page_ranges(document, len(sell_orders))
+
+    assert sum(len(pages) for pages in page_ranges) == len(document.pages)
+    for index, pages in enumerate(page_ranges):
+        assert pages
+        assert {
+            anchor
+            for page in pages
+            for anchor in page.anchors
+            if anchor.startswith("invoice-")
+        } == {f"invoice-{index}"}
+
+
+def test_split_document_writes_one_pdf_per_billing_account_number(tmp_path):
+    invoice_generator = _invoice_generator(tmp_path, SPLIT_DOCUMENT)
+    sell_orders = [_sell_order(ban) for ban in BILLING_ACCOUNT_NUMBERS]
+    page_ranges = _invoice_page_ranges(
+        invoice_generator.render_invoice_document(sell_orders), len(sell_orders)
+    )
+
+    output_paths = invoice_generator.generate_pdf_invoices_single_pass(sell_orders)
+
+    assert output_paths == [
+        os.path.join(tmp_path, f"invoice_{ban}.pdf") for ban in BILLING_ACCOUNT_NUMBERS
+    ]
+    assert [_pdf_page_count(path) for path in output_paths] == [
+        len(pages) for pages in page_ranges
+    ]
+
+
+def test_statement_document_writes_per_ban_pdfs_and_bounded_statements(tmp_path):
+    invoice_generator = _invoice_generator(
+        tmp_path, STATEMENT_DOCUMENT, statement_retention=2
+    )
+    sell_orders = [_sell_order(ban) for ban in BILLING_ACCOUNT_NUMBERS]
+
+    for _ in range(3):
+        output_paths = invoice_generator.generate_pdf_invoices_single_pass(sell_orders)
+
+    assert output_paths == [
+        os.path.join(tmp_path, f"invoice_{ban}.pdf") for ban in BILLING_ACCOUNT_NUMBERS
+    ]
+    assert all(os.path.exists(path) for path in output_paths)
+    assert (
+        len(
+            [
+                name
+                for name in os.listdir(tmp_path)
+                if name.startswith(STATEMENT_FILE_PREFIX)
+            ]
+        )
+        == 2
+    )
+
+
+def test_invoice_template_is_compiled_once(tmp_path):
+    invoice_generator = _invoice_generator(tmp_path, SEPARATE_DOCUMENTS)
+    invoice_template = invoice_generator.invoice_template
+    get_template_calls = []
+    invoice_generator.html_template_environment.get_template = (
+        lambda *args, **kwargs: get_template_calls.append(args)
+    )
+
+    html = invoice_generator._render_html_invoices(
+        [_sell_order(ban) for ban in BILLING_ACCOUNT_NUMBERS]
+    )
+
+    assert invoice_generator.invoice_template is invoice_template
+    assert get_template_calls == []
+    assert [f'id="invoice-{index}"' in html for index in range(3)] == [True] * 3
+
+
+def test_stylesheet_defaults_to_the_shipped_stylesheet(tmp_path):
+    invoice_generator = build_invoice_generator(
+        invoice_template_path=config.INVOICE_TEMPLATE_PATH,
+        pdf_output_path=str(tmp_path),
+        qr_code_base_url=config.QR_CODE_BASE_URL,
+        html_template=config.HTML_TEMPLATE,
+    )
+
+    assert invoice_generator.stylesheet == config.INVOICE_STYLESHEET
+    assert len(invoice_generator.rendering_context().stylesheets) == 1
+
+
+def test_rendering_context_is_reused_per_thread(tmp_path):
+    invoice_generator = _invoice_generator(tmp_path, SEPARATE_DOCUMENTS)
+    other_thread_contexts = []
+
+    context = invoice_generator.rendering_context()
+    invoice_generator.generate_pdf_invoice(_sell_order("111"))
+    thread = threading.Thread(
+        target=lambda: other_thread_contexts.append(
+            invoice_generator.rendering_context()
+        )
+    )
+    thread.start()
+    thread.join()
+
+    assert invoice_generator.rendering_context() is context
+    assert other_thread_contexts[0] is not context
+    assert other_thread_contexts[0].font_config is not context.font_config
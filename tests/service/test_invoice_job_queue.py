@@ -0,0 +1,177 @@
+import asyncio
+import datetime
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from app.model.invoice_job import InvoiceJob
+from app.model.invoice_render_result import InvoiceRenderResult
+from app.service.invoice_job_queue import InvoiceJobQueue
+from tests.conftest import FakeInvoiceGenerator, record_orders
+
+
+def _invoice_job_queue(db_service, max_attempts=2):
+    return InvoiceJobQueue(
+        db_service,
+        FakeInvoiceGenerator(),
+        batch_size=10,
+        max_attempts=max_attempts,
+    )
+
+
+def test_record_transaction_batch_enqueues_invoice_jobs(db_service):
+    record_orders(db_service, ["John Doe", "Jane Doe"], enqueue_invoice_jobs=True)
+
+    jobs = _invoice_job_queue(db_service).get_jobs("1")
+
+    assert [(job.billing_account_number, job.status) for job in jobs] == [
+        ("1", "pending")
+    ]
+
+
+def test_process_next_batch(db_service):
+    record_orders(db_service, ["John Doe", "Broken"], enqueue_invoice_jobs=True)
+    invoice_job_queue = _invoice_job_queue(db_service)
+
+    assert asyncio.run(invoice_job_queue.process_next_batch()) == 2
+
+    assert invoice_job_queue.invoice_generator.rendered_names == ["John Doe", "Broken"]
+    done_job = invoice_job_queue.get_jobs("0")[0]
+    assert done_job.status == "done"
+    assert done_job.output_path == "invoice_0.pdf"
+    retried_job = invoice_job_queue.get_jobs("1")[0]
+    assert retried_job.status == "pending"
+    assert retried_job.error == "Broken template"
+
+
+def test_failed_job_gives_up_after_max_attempts(db_service):
+    record_orders(db_service, ["Broken"], enqueue_invoice_jobs=True)
+    invoice_job_queue = _invoice_job_queue(db_service, max_attempts=2)
+
+    assert asyncio.run(invoice_job_queue.process_next_batch()) == 1
+    assert asyncio.run(invoice_job_queue.process_next_batch()) == 1
+    assert asyncio.run(invoice_job_queue.process_next_batch()) == 0
+
+    failed_job = invoice_job_queue.get_jobs("0")[0]
+    assert failed_job.status == "failed"
+    assert failed_job.attempts == 2
+
+
+def test_claim_jobs_does_not_claim_twice(db_service):
+    record_orders(
+        db_service, ["John Doe", "Jane Doe", "Jim Doe"], enqueue_invoice_jobs=True
+    )
+    invoice_job_queue = _invoice_job_queue(db_service)
+
+    first_claim = invoice_job_queue.claim_jobs(2)
+    second_claim = invoice_job_queue.claim_jobs(2)
+
+    assert len(first_claim) == 2
+    assert len(second_claim) == 1
+    assert {job.id for job in first_claim}.isdisjoint(job.id for job in second_claim)
+    assert all(job.attempts == 1 for job in first_claim + second_claim)
+
+
+def _expire_leases(db_service):
+    with Session(db_service.engine) as session:
+        session.execute(
+            update(InvoiceJob).values(
+                updated_at=datetime.datetime.now() - datetime.timedelta(hours=1)
+            )
+        )
+        session.commit()
+
+
+def test_claim_jobs_leaves_live_leases_alone(db_service):
+    record_orders(db_service, ["John Doe"], enqueue_invoice_jobs=True)
+    invoice_job_queue = _invoice_job_queue(db_service)
+    invoice_job_queue.claim_jobs(10)
+
+    assert invoice_job_queue.claim_jobs(10) == []
+    assert invoice_job_queue.get_jobs("0")[0].status == "rendering"
+
+
+def test_claim_jobs_takes_over_expired_leases(db_service):
+    record_orders(db_service, ["John Doe"], enqueue_invoice_jobs=True)
+    invoice_job_queue = _invoice_job_queue(db_service)
+    [first_claim] = invoice_job_queue.claim_jobs(10)
+    _expire_leases(db_service)
+
+    [second_claim] = invoice_job_queue.claim_jobs(10)
+    invoice_job_queue.complete_jobs(
+        [first_claim],
+        [InvoiceRenderResult(billing_account_number="0", success=True)],
+    )
+
+    assert second_claim.attempts == first_claim.attempts + 1
+    job = invoice_job_queue.get_jobs("0")[0]
+    assert job.status == "rendering"
+    assert job.output_path is None
+
+
+def test_expired_lease_on_last_attempt_fails(db_service):
+    record_orders(db_service, ["John Doe"], enqueue_invoice_jobs=True)
+    invoice_job_queue = _invoice_job_queue(db_service, max_attempts=1)
+    invoice_job_queue.claim_jobs(10)
+    _expire_leases(db_service)
+
+    assert invoice_job_queue.claim_jobs(10) == []
+    assert invoice_job_queue.get_jobs("0")[0].status == "failed"
+
+
+def test_renew_leases_keeps_jobs_claimed(db_service):
+    record_orders(db_service, ["John Doe"], enqueue_invoice_jobs=True)
+    invoice_job_queue = _invoice_job_queue(db_service)
+    [job] = invoice_job_queue.claim_jobs(10)
+    _expire_leases(db_service)
+
+    assert invoice_job_queue.renew_leases({job.id: job.attempts}) == 1
+    assert invoice_job_queue.claim_jobs(10) == []
+
+
+def test_release_jobs_puts_them_back_to_pending(db_service):
+    record_orders(db_service, ["John Doe"], enqueue_invoice_jobs=True)
+    invoice_job_queue = _invoice_job_queue(db_service)
+    [job] = invoice_job_queue.claim_jobs(10)
+
+    assert invoice_job_queue.release_jobs({job.id: job.attempts}) == 1
+    assert invoice_job_queue.get_jobs("0")[0].status == "pending"
+
+
+def test_orphaned_job_fails(db_service):
+    record_orders(db_service, ["John Doe"], enqueue_invoice_jobs=True)
+    with Session(db_service.engine) as session:
+        session.execute(update(InvoiceJob).values(transaction_id="missing"))
+        session.commit()
+    invoice_job_queue = _invoice_job_queue(db_service, max_attempts=1)
+
+    asyncio.run(invoice_job_queue.process_next_batch())
+
+    orphaned_job = invoice_job_queue.get_jobs("0")[0]
+    assert orphaned_job.status == "failed"
+    assert invoice_job_queue.invoice_generator.rendered_names == []
+
+
+def test_workers_drain_the_queue(db_service):
+    record_orders(db_service, ["John Doe", "Jane Doe"], enqueue_invoice_jobs=True)
+    invoice_job_queue = InvoiceJobQueue(
+        db_service, FakeInvoiceGenerator(), worker_count=2, poll_interval=0.01
+    )
+
+    async def drain():
+        invoice_job_queue.start()
+        invoice_job_queue.notify()
+        for _ in range(100):
+            if all(
+                job.status == "done"
+                for ban in ("0", "1")
+                for job in invoice_job_queue.get_jobs(ban)
+            ):
+                break
+            await asyncio.sleep(0.01)
+        await invoice_job_queue.shutdown()
+
+    asyncio.run(drain())
+
+    assert [invoice_job_queue.get_jobs(ban)[0].status for ban in ("0", "1")] == [
+        "done",
+        "done",
+    ]
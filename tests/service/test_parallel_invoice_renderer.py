@@ -0,0 +1,69 @@
+import asyncio
+import os
+import pytest
+from app.model.sell_order_batch import SellOrderBatch
+from app.service.parallel_invoice_renderer import ParallelInvoiceRenderer
+from tests.conftest import FakeInvoiceGenerator
+
+
+def _worker_invoice_generator():
+    # Built in the worker process, so the output paths show which process rendered them
+    return FakeInvoiceGenerator(pdf_output_path=str(os.getpid()))
+
+
+def _test_batch(size):
+    batch, _ = SellOrderBatch.from_rows(
+        [
+            [
+                "Broken" if index == 3 else f"Customer {index}",
+                "01/01/1990",
+                "5105105105105100",
+                "12/30",
+                "123",
+                str(index),
+                "5GB",
+            ]
+            for index in range(size)
+        ]
+    )
+    return batch
+
+
+@pytest.fixture
+def invoice_renderer():
+    renderer = ParallelInvoiceRenderer(
+        generator_factory=_worker_invoice_generator, max_workers=2, chunk_size=2
+    )
+    renderer.start()
+    yield renderer
+    renderer.shutdown()
+
+
+def test_render_batch(invoice_renderer):
+    results = invoice_renderer.render_batch(_test_batch(5))
+
+    assert [result.billing_account_number for result in results] == [
+        "0",
+        "1",
+        "2",
+        "3",
+        "4",
+    ]
+    assert [result.success for result in results] == [True, True, True, False, True]
+    assert all(
+        not result.output_path.startswith(f"{os.getpid()}/") for result in results
+    )
+
+
+def test_render_batch_async(invoice_renderer):
+    results = asyncio.run(invoice_renderer.render_batch_async(_test_batch(3)))
+
+    assert [result.billing_account_number for result in results] == ["0", "1", "2"]
+
+
+def test_render_before_start():
+    renderer = ParallelInvoiceRenderer(
+        generator_factory=_worker_invoice_generator, max_workers=1
+    )
+    with pytest.raises(RuntimeError):
+        renderer.render_batch(_test_batch(1))
@@ -1,6 +1,17 @@
-from app.service.parser import parse_csv_content, parse_text_from_binary
-from app.model.mobile_data_sell_order import MobileDataSellOrder
-
+from app.service.parser import (
+    parse_csv_content,
+    parse_text_from_binary,
+    stream_rows_from_binary,
+    stream_sell_order_batches,
+    stream_sell_orders,
+)
+from app.model.mobile_data_sell_order import (
+    UNDECODABLE_ROW_ERROR,
+    InvalidSellOrderRowsError,
+    MobileDataSellOrder,
+)
+import asyncio
+import pytest
 
 test_csv = b"John Doe,05/14/1990,406583246170089012345678,08/25,123,987654321,5GB\r\nDean Lawrence,11/7/1976,374245455400126,12/22,456,12349,1GB\r\nJane Doe,02/28/1985,374245455400126,08/25,123,988769,5GB\r\nJared Stevens,09/30/1982,374245455400126,12/25,456,432345,1GB\r\nRay Lopez,03/15/1995,406583246170089012345678,08/25,123,987654321,5GB\r\n"
 
@@ -126,3 +137,95 @@ def test_parse_csv_content():
 
     test_csv_actual_result = parse_csv_content(test_csv)
     assert test_csv_actual_result == test_csv_expected_result
+
+
+async def _byte_stream(content: bytes, block_size: int):
+    for start in range(0, len(content), block_size):
+        yield content[start : start + block_size]
+
+
+async def _collect(async_iterator):
+    return [item async for item in async_iterator]
+
+
+def test_stream_rows_from_binary_matches_parse_text_from_binary():
+    for block_size in (1, 7, 64, len(test_csv)):
+        chunks = asyncio.run(
+            _collect(stream_rows_from_binary(_byte_stream(test_csv, block_size)))
+        )
+        rows = [row for chunk in chunks for row in chunk]
+        assert rows == parse_text_from_binary(test_csv)
+
+
+def test_stream_rows_from_binary_multibyte_split_and_no_trailing_newline():
+    content = "Zoë Brontë,05/14/1990\nJosé Núñez,11/07/1976".encode("utf-8")
+    chunks = asyncio.run(_collect(stream_rows_from_binary(_byte_stream(content, 3))))
+    rows = [row for chunk in chunks for row in chunk]
+    assert rows == [["Zoë Brontë", "05/14/1990"], ["José Núñez", "11/07/1976"]]
+
+
+def test_stream_sell_orders_chunks():
+    chunks = asyncio.run(_collect(stream_sell_orders(_byte_stream(test_csv, 10), 2)))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    assert [order for chunk in chunks for order in chunk] == parse_csv_content(test_csv)
+
+
+def test_parse_csv_content_invalid_rows():
+    with pytest.raises(InvalidSellOrderRowsError) as error_info:
+        parse_csv_content(test_csv + b"Bad Row,13/45/1990,1,08/25,123,1,5GB\r\n")
+
+    assert [error.row_index for error in error_info.value.parse_errors] == [5]
+
+
+def test_stream_sell_orders_reports_parse_errors():
+    parse_errors = []
+    content = b"Bad Row,1990-01-01,1,08/25,123,1,5GB\r\n" + test_csv
+    chunks = asyncio.run(
+        _collect(
+            stream_sell_orders(
+                _byte_stream(content, 10), 2, on_parse_error=parse_errors.append
+            )
+        )
+    )
+
+    assert [len(chunk) for chunk in chunks] == [1, 2, 2]
+    assert [error.row_index for error in parse_errors] == [0]
+
+
+def test_stream_sell_order_batches():
+    batches = asyncio.run(
+        _collect(stream_sell_order_batches(_byte_stream(test_csv, 10), 3))
+    )
+
+    assert [len(batch) for batch in batches] == [3, 2]
+    assert [
+        sell_order for batch in batches for sell_order in batch.to_sell_orders()
+    ] == parse_csv_content(test_csv)
+
+
+def test_stream_rows_from_binary_quoted_newline_split_across_blocks():
+    content = b'"John\nDoe",05/14/1990\nJane Doe,02/28/1985\n'
+    for block_size in (1, 3, 8, len(content)):
+        chunks = asyncio.run(
+            _collect(stream_rows_from_binary(_byte_stream(content, block_size)))
+        )
+        rows = [row for chunk in chunks for row in chunk]
+        assert rows == [["John\nDoe", "05/14/1990"], ["Jane Doe", "02/28/1985"]]
+        assert rows == parse_text_from_binary(content)
+
+
+def test_stream_sell_order_batches_reports_undecodable_rows():
+    parse_errors = []
+    content = test_csv[:-2] + b"\xff\r\n" + test_csv
+    batches = asyncio.run(
+        _collect(
+            stream_sell_order_batches(
+                _byte_stream(content, 64), 3, on_parse_error=parse_errors.append
+            )
+        )
+    )
+
+    assert sum(len(batch) for batch in batches) == 9
+    assert [error.row_index for error in parse_errors] == [4]
+    assert parse_errors[0].errors == [UNDECODABLE_ROW_ERROR]
+    assert parse_errors[0].row[-1] == "5GB�"
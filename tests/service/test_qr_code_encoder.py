@@ -0,0 +1,72 @@
+import base64
+import pytest
+import qrcode  # type: ignore
+from app.service.qr_code_encoder import QRCodeEncoder
+
+
+def _template():
+    return qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=5,
+        border=2,
+    )
+
+
+def test_qr_code_encoder_does_not_grow_the_template():
+    template = _template()
+    qr_code_encoder = QRCodeEncoder(
+        "https://example.com/user", template, cache_size=None
+    )
+
+    first_qr_code = qr_code_encoder("123456789")
+    for billing_account_number in range(100):
+        qr_code_encoder(str(billing_account_number))
+
+    assert template.data_list == []
+    assert qr_code_encoder("123456789") == first_qr_code
+
+
+def test_qr_code_encoder_png():
+    qr_code_encoder = QRCodeEncoder("https://example.com/user", _template())
+
+    qr_code = base64.b64decode(qr_code_encoder("123456789"))
+
+    assert qr_code.startswith(b"\x89PNG")
+    assert qr_code_encoder.mime_type == "image/png"
+
+
+def test_qr_code_encoder_svg():
+    qr_code_encoder = QRCodeEncoder(
+        "https://example.com/user", _template(), image_format="svg"
+    )
+
+    qr_code = base64.b64decode(qr_code_encoder("123456789"))
+
+    assert qr_code.startswith(b"<svg")
+    assert qr_code_encoder.mime_type == "image/svg+xml"
+
+
+def test_qr_code_encoder_cache():
+    qr_code_encoder = QRCodeEncoder(
+        "https://example.com/user", _template(), cache_size=2
+    )
+
+    for billing_account_number in ["1", "2", "1", "3"]:
+        qr_code_encoder(billing_account_number)
+
+    assert qr_code_encoder.cache_info().hits == 1
+    assert qr_code_encoder.cache_info().currsize == 2
+
+
+def test_qr_code_encoder_unknown_format():
+    with pytest.raises(ValueError):
+        QRCodeEncoder("https://example.com/user", _template(), image_format="gif")
+
+
+def test_qr_code_encoder_builds_codes_with_its_own_version():
+    qr_code_encoder = QRCodeEncoder(
+        "https://example.com/user", _template(), qr_code_version=3
+    )
+
+    assert qr_code_encoder.new_qr_code().version == 3
@@ -0,0 +1,90 @@
+import asyncio
+import math
+import os
+import threading
+import time
+import pytest
+from app.service.stage_executor import (
+    INVOICE_STAGE,
+    VALIDATE_STAGE,
+    StageExecutor,
+    run_stage,
+)
+
+
+def _thread_name(_):
+    return threading.current_thread().name
+
+
+def test_run_on_thread_pool():
+    stage_executor = StageExecutor(thread_workers=2)
+    stage_executor.start()
+
+    thread_name = asyncio.run(stage_executor.run(VALIDATE_STAGE, _thread_name, None))
+    stage_executor.shutdown()
+
+    assert thread_name.startswith("stage")
+
+
+def test_run_on_process_pool():
+    stage_executor = StageExecutor(
+        thread_workers=1,
+        process_workers=1,
+        stage_pools={VALIDATE_STAGE: "process"},
+    )
+    stage_executor.start()
+
+    async def run_both():
+        return (
+            await stage_executor.run(VALIDATE_STAGE, os.getpid),
+            await stage_executor.run(INVOICE_STAGE, math.factorial, 5),
+        )
+
+    worker_pid, factorial = asyncio.run(run_both())
+    stage_executor.shutdown()
+
+    assert worker_pid != os.getpid()
+    assert factorial == 120
+
+
+def test_stage_concurrency_limit():
+    stage_executor = StageExecutor(
+        thread_workers=4, stage_concurrency={INVOICE_STAGE: 1}
+    )
+    stage_executor.start()
+    running = []
+    overlaps = []
+
+    def slow_stage():
+        running.append(1)
+        overlaps.append(len(running))
+        time.sleep(0.02)
+        running.pop()
+
+    async def run_many():
+        await asyncio.gather(
+            *(stage_executor.run(INVOICE_STAGE, slow_stage) for _ in range(4))
+        )
+
+    asyncio.run(run_many())
+    stage_executor.shutdown()
+
+    assert overlaps == [1, 1, 1, 1]
+
+
+def test_invalid_stage_pools():
+    with pytest.raises(ValueError):
+        StageExecutor(thread_workers=1, stage_pools={VALIDATE_STAGE: "gpu"})
+    with pytest.raises(ValueError):
+        StageExecutor(thread_workers=1, stage_pools={VALIDATE_STAGE: "process"})
+
+
+def test_run_before_start():
+    with pytest.raises(RuntimeError):
+        asyncio.run(StageExecutor(thread_workers=1).run(VALIDATE_STAGE, math.sqrt, 4))
+
+
+def test_run_stage_without_executor_runs_inline():
+    assert asyncio.run(run_stage(None, VALIDATE_STAGE, _thread_name, None)) == (
+        threading.current_thread().name
+    )
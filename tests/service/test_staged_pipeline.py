@@ -0,0 +1,131 @@
+import asyncio
+import pytest
+from app.service.staged_pipeline import PipelineStage, StagedPipeline
+
+
+async def _source(count, produced=None):
+    for chunk in range(count):
+        if produced is not None:
+            produced.append(chunk)
+        yield chunk
+
+
+def _collect(pipeline, source):
+    async def collect():
+        return [chunk async for chunk in pipeline.run(source)]
+
+    return asyncio.run(collect())
+
+
+def test_run_keeps_source_order_with_several_workers():
+    async def slow_for_even_chunks(chunk):
+        await asyncio.sleep(0.01 if chunk % 2 == 0 else 0)
+        return chunk * 10
+
+    async def increment(chunk):
+        return chunk + 1
+
+    pipeline = StagedPipeline(
+        [
+            PipelineStage("multiply", slow_for_even_chunks, workers=3),
+            PipelineStage("increment", increment, workers=2),
+        ]
+    )
+
+    assert _collect(pipeline, _source(10)) == [chunk * 10 + 1 for chunk in range(10)]
+
+
+def test_next_stage_receives_chunks_in_source_order():
+    recorded = []
+
+    async def validate(chunk):
+        # The first chunk is the slowest, so the later chunks finish validating first
+        await asyncio.sleep(0.03 if chunk == 0 else 0)
+        return chunk
+
+    async def record(chunk):
+        recorded.append(chunk)
+        return chunk
+
+    pipeline = StagedPipeline(
+        [
+            PipelineStage("validate", validate, workers=3),
+            PipelineStage("record", record),
+        ]
+    )
+
+    assert _collect(pipeline, _source(6)) == [0, 1, 2, 3, 4, 5]
+    assert recorded == [0, 1, 2, 3, 4, 5]
+
+
+def test_run_finishes_stages_after_the_output_stage():
+    invoiced = []
+
+    async def record(chunk):
+        return chunk
+
+    async def invoice(chunk):
+        await asyncio.sleep(0.01)
+        invoiced.append(chunk)
+        return chunk
+
+    pipeline = StagedPipeline(
+        [PipelineStage("record", record), PipelineStage("invoice", invoice, workers=2)],
+        output_stage="record",
+    )
+
+    assert _collect(pipeline, _source(5)) == [0, 1, 2, 3, 4]
+    assert sorted(invoiced) == [0, 1, 2, 3, 4]
+
+
+def test_run_applies_backpressure_to_the_source():
+    produced = []
+
+    async def run():
+        blocked = asyncio.Event()
+
+        async def blocking_stage(chunk):
+            await blocked.wait()
+            return chunk
+
+        pipeline = StagedPipeline(
+            [PipelineStage("block", blocking_stage)], queue_size=1
+        )
+        results = pipeline.run(_source(100, produced))
+        next_result = asyncio.ensure_future(results.__anext__())
+        await asyncio.sleep(0.05)
+        # One chunk in the worker, one in the queue and one held by the feeder
+        produced_while_blocked = len(produced)
+        blocked.set()
+        first_result = await next_result
+        await results.aclose()
+        return produced_while_blocked, first_result
+
+    produced_while_blocked, first_result = asyncio.run(run())
+
+    assert produced_while_blocked == 3
+    assert first_result == 0
+
+
+def test_run_raises_stage_errors():
+    async def fail_on_third_chunk(chunk):
+        if chunk == 2:
+            raise ValueError("chunk 2 is invalid")
+        return chunk
+
+    pipeline = StagedPipeline([PipelineStage("check", fail_on_third_chunk)])
+
+    with pytest.raises(ValueError, match="chunk 2 is invalid"):
+        _collect(pipeline, _source(5))
+
+
+def test_pipeline_rejects_invalid_configuration():
+    async def identity(chunk):
+        return chunk
+
+    with pytest.raises(ValueError):
+        StagedPipeline([])
+    with pytest.raises(ValueError):
+        StagedPipeline([PipelineStage("identity", identity, workers=0)])
+    with pytest.raises(ValueError):
+        StagedPipeline([PipelineStage("identity", identity)], output_stage="missing")
@@ -0,0 +1,130 @@
+import datetime
+import pytest
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+from app.controller.transaction_request_handler import mask_card_number
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.service.transaction_query import TransactionQuery, decode_cursor
+
+
+def _transaction_row(billing_account_number, status, created_at):
+    return {
+        "id": f"{billing_account_number}-{status}-{created_at}",
+        "name": "John Doe",
+        "date_of_birth": datetime.datetime(1990, 1, 1),
+        "credit_card_number": "5105105105105100",
+        "credit_card_expiration_date": datetime.datetime(2030, 12, 1),
+        "credit_card_cvv": "123",
+        "billing_account_number": billing_account_number,
+        "requested_mobile_data": "5GB",
+        "status": status,
+        "validation_errors": "",
+        "created_at": created_at,
+    }
+
+
+def _record(db_service, rows):
+    with Session(db_service.engine) as session:
+        session.execute(insert(MobileDataPurchaseTransaction), rows)
+        session.commit()
+
+
+def _all_pages(transaction_query, limit, **filters):
+    pages = []
+    cursor = None
+    while True:
+        page = transaction_query.find_transactions(limit, cursor, **filters)
+        pages.append([transaction.id for transaction in page.transactions])
+        if page.next_cursor is None:
+            return pages
+        cursor = page.next_cursor
+
+
+def test_find_transactions_filters_and_pages(db_service):
+    day = datetime.datetime(2023, 10, 1)
+    _record(
+        db_service,
+        [
+            _transaction_row("1", "Approved", day),
+            _transaction_row("2", "Rejected", day),
+            _transaction_row("1", "Rejected", day + datetime.timedelta(days=1)),
+            _transaction_row("1", "Approved", day + datetime.timedelta(days=2)),
+        ],
+    )
+    transaction_query = TransactionQuery(db_service)
+
+    assert _all_pages(transaction_query, 2, billing_account_number="1") == [
+        ["1-Approved-2023-10-01 00:00:00", "1-Rejected-2023-10-02 00:00:00"],
+        ["1-Approved-2023-10-03 00:00:00"],
+    ]
+    assert _all_pages(transaction_query, 10, status="Rejected") == [
+        ["2-Rejected-2023-10-01 00:00:00", "1-Rejected-2023-10-02 00:00:00"]
+    ]
+    assert _all_pages(
+        transaction_query,
+        1,
+        created_from=day + datetime.timedelta(days=1),
+        created_to=day + datetime.timedelta(days=2),
+    ) == [["1-Rejected-2023-10-02 00:00:00"], []]
+
+
+def test_rows_without_creation_date_are_paged_first(db_service):
+    _record(
+        db_service,
+        [
+            _transaction_row("1", "Approved", None),
+            _transaction_row("2", "Approved", None),
+            _transaction_row("3", "Approved", datetime.datetime(2023, 10, 1)),
+        ],
+    )
+    # Transactions recorded before the created_at column was added have no creation date
+    with Session(db_service.engine) as session:
+        session.execute(
+            text(
+                "UPDATE mobiledatapurchasetransaction SET created_at = NULL "
+                "WHERE id LIKE '%-None'"
+            )
+        )
+        session.commit()
+    transaction_query = TransactionQuery(db_service)
+
+    assert _all_pages(transaction_query, 1) == [
+        ["1-Approved-None"],
+        ["2-Approved-None"],
+        ["3-Approved-2023-10-01 00:00:00"],
+        [],
+    ]
+
+
+def test_filtered_queries_use_the_secondary_indexes(db_service):
+    with Session(db_service.engine) as session:
+        plans = {
+            query: " ".join(
+                row[-1]
+                for row in session.execute(
+                    text(
+                        "EXPLAIN QUERY PLAN SELECT * FROM mobiledatapurchasetransaction "
+                        f"WHERE {query} ORDER BY created_at, rowid LIMIT 100"
+                    )
+                )
+            )
+            for query in (
+                "billing_account_number = '1'",
+                "status = 'Approved' AND created_at >= '2023-10-01'",
+                "created_at >= '2023-10-01'",
+            )
+        }
+
+    for plan in plans.values():
+        assert "INDEX ix_mobiledatapurchasetransaction_" in plan
+        assert "TEMP B-TREE" not in plan
+
+
+def test_invalid_cursor():
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor")
+
+
+def test_mask_card_number():
+    assert mask_card_number("5105105105105100") == "************5100"
+    assert mask_card_number("510") == "510"
@@ -0,0 +1,118 @@
+import asyncio
+import datetime
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.model.invoice_job import InvoiceJob
+from app.model.mobile_data_purchase_transaction import MobileDataPurchaseTransaction
+from app.service.write_behind_writer import WriteBehindWriter
+
+
+def _transaction_row(transaction_id):
+    return {
+        "id": transaction_id,
+        "name": "John Doe",
+        "date_of_birth": datetime.datetime(1990, 1, 1),
+        "credit_card_number": "5105105105105100",
+        "credit_card_expiration_date": datetime.datetime(2030, 12, 1),
+        "credit_card_cvv": "123",
+        "billing_account_number": transaction_id,
+        "requested_mobile_data": "5GB",
+        "status": "Approved",
+        "validation_errors": "",
+    }
+
+
+def _count_commits(db_service):
+    commits = []
+    event.listen(db_service.engine, "commit", lambda connection: commits.append(1))
+    return commits
+
+
+def _count(db_service, model):
+    with Session(db_service.engine) as session:
+        return session.scalar(select(func.count()).select_from(model))
+
+
+async def _write_concurrently(transaction_writer, writes):
+    transaction_writer.start()
+    results = await asyncio.gather(
+        *(transaction_writer.write(*write) for write in writes),
+        return_exceptions=True,
+    )
+    await transaction_writer.shutdown()
+    return results
+
+
+def test_concurrent_writes_are_committed_together(db_service):
+    commits = _count_commits(db_service)
+    transaction_writer = WriteBehindWriter(
+        db_service, max_batch_rows=100, max_delay=0.1
+    )
+
+    results = asyncio.run(
+        _write_concurrently(
+            transaction_writer,
+            [
+                ([_transaction_row("1"), _transaction_row("2")], True),
+                ([_transaction_row("3")], False),
+                ([_transaction_row("4")], True),
+            ],
+        )
+    )
+
+    assert results == [2, 1, 1]
+    assert len(commits) == 1
+    assert _count(db_service, MobileDataPurchaseTransaction) == 4
+    assert _count(db_service, InvoiceJob) == 3
+
+
+def test_groups_are_committed_at_max_batch_rows(db_service):
+    commits = _count_commits(db_service)
+    transaction_writer = WriteBehindWriter(db_service, max_batch_rows=2, max_delay=0.1)
+
+    results = asyncio.run(
+        _write_concurrently(
+            transaction_writer,
+            [([_transaction_row(str(index))], False) for index in range(5)],
+        )
+    )
+
+    assert results == [1] * 5
+    assert len(commits) == 3
+
+
+def test_failed_write_only_fails_its_caller(db_service):
+    transaction_writer = WriteBehindWriter(db_service, max_delay=0.1)
+
+    results = asyncio.run(
+        _write_concurrently(
+            transaction_writer,
+            [
+                ([_transaction_row("1")], False),
+                ([_transaction_row("2"), _transaction_row("2")], False),
+                ([_transaction_row("3")], False),
+            ],
+        )
+    )
+
+    assert results[0] == 1 and results[2] == 1
+    assert isinstance(results[1], IntegrityError)
+    assert _count(db_service, MobileDataPurchaseTransaction) == 2
+
+
+def test_shutdown_commits_pending_writes(db_service):
+    transaction_writer = WriteBehindWriter(db_service, max_delay=60)
+
+    async def write_and_shut_down():
+        transaction_writer.start()
+        write = asyncio.create_task(transaction_writer.write([_transaction_row("1")]))
+        await asyncio.sleep(0)
+        await transaction_writer.shutdown()
+        with pytest.raises(RuntimeError):
+            await transaction_writer.write([_transaction_row("2")])
+        return await write
+
+    assert asyncio.run(write_and_shut_down()) == 1
+    assert _count(db_service, MobileDataPurchaseTransaction) == 1
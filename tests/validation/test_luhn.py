@@ -0,0 +1,51 @@
+import pickle
+import random
+from luhncheck import is_luhn
+from app.validation.luhn import LuhnValidator, is_luhn_valid
+
+
+def test_is_luhn_valid_known_numbers():
+    assert is_luhn_valid("2222405343248877")
+    assert is_luhn_valid("5105105105105100")
+    assert is_luhn_valid("3742-4545 5400126")
+    assert not is_luhn_valid("1234567890123456")
+    assert not is_luhn_valid("")
+    assert not is_luhn_valid("51051051051051OO")
+
+
+def test_is_luhn_valid_matches_luhncheck():
+    random_generator = random.Random(0)
+    for _ in range(5000):
+        number = "".join(
+            random_generator.choice("0123456789")
+            for _ in range(random_generator.randint(1, 24))
+        )
+        assert is_luhn_valid(number) == is_luhn(number), number
+
+
+def test_luhn_validator_cache():
+    luhn_validator = LuhnValidator(cache_size=2)
+
+    assert luhn_validator.validate_many(
+        ["5105105105105100", "1234567890123456", "5105105105105100"]
+    ) == [True, False, True]
+    assert luhn_validator.cache_info().hits == 1
+    assert luhn_validator.cache_info().currsize == 2
+
+
+def test_luhn_validator_without_cache():
+    luhn_validator = LuhnValidator(cache_size=None)
+
+    assert luhn_validator("5105105105105100")
+    assert luhn_validator.cache_info() is None
+
+
+def test_luhn_validator_pickles_without_cache_contents():
+    luhn_validator = LuhnValidator(cache_size=8)
+    luhn_validator("5105105105105100")
+
+    unpickled_validator = pickle.loads(pickle.dumps(luhn_validator))
+
+    assert unpickled_validator.cache_size == 8
+    assert unpickled_validator.cache_info().currsize == 0
+    assert unpickled_validator("5105105105105100")
@@ -1,4 +1,6 @@
 from app.validation.validator import CreditRequestValidator
+from app.model.sell_order_batch import SellOrderBatch, SellOrderError
+from app.validation.luhn import LuhnValidator
 import config
 from luhncheck import is_luhn
 import datetime
@@ -132,3 +134,173 @@ def test_is_credit_card_expired_expired_for_one_month(mock_datetime):
 def test_is_credit_card_expired_expired_date_of_expiration(mock_datetime):
     mock_datetime.datetime.now.return_value = datetime.datetime(2023, 10, 1, 0, 0, 0)
     assert not validator.is_credit_card_expired(datetime.datetime(2023, 10, 1, 0, 0, 0))
+
+
+def _batch_of(
+    dates_of_birth=(datetime.datetime(1990, 1, 1),),
+    credit_card_numbers=("5105105105105100",),
+    expiration_dates=(datetime.datetime(2030, 1, 1),),
+    cvvs=("123",),
+):
+    size = max(
+        len(dates_of_birth), len(credit_card_numbers), len(expiration_dates), len(cvvs)
+    )
+    return SellOrderBatch.from_columns(
+        name=["John Doe"] * size,
+        date_of_birth=list(dates_of_birth) * (size // len(dates_of_birth)),
+        credit_card_number=list(credit_card_numbers)
+        * (size // len(credit_card_numbers)),
+        credit_card_expiration_date=list(expiration_dates)
+        * (size // len(expiration_dates)),
+        credit_card_cvv=list(cvvs) * (size // len(cvvs)),
+        billing_account_number=["1234"] * size,
+        requested_mobile_data=["5GB"] * size,
+    )
+
+
+@mock.patch("app.validation.validator.datetime")
+def test_validate_batch_legal_age(mock_datetime):
+    mock_datetime.datetime.now.return_value = datetime.datetime(2023, 10, 1, 12, 0, 0)
+    batch = _batch_of(
+        dates_of_birth=(
+            datetime.datetime(2004, 10, 1),
+            datetime.datetime(2005, 10, 1, 23, 59),
+            datetime.datetime(2005, 10, 2),
+            datetime.datetime(2006, 10, 1),
+        )
+    )
+
+    assert validator.validate_batch(batch).tolist() == [
+        0,
+        0,
+        SellOrderError.NOT_OF_LEGAL_AGE,
+        SellOrderError.NOT_OF_LEGAL_AGE,
+    ]
+
+
+@mock.patch("app.validation.validator.datetime")
+def test_validate_batch_legal_age_leap_day(mock_datetime):
+    mock_datetime.datetime.now.return_value = datetime.datetime(2024, 2, 29, 0, 0, 0)
+    batch = _batch_of(
+        dates_of_birth=(datetime.datetime(2006, 2, 28), datetime.datetime(2006, 3, 1))
+    )
+
+    assert validator.validate_batch(batch).tolist() == [
+        0,
+        SellOrderError.NOT_OF_LEGAL_AGE,
+    ]
+
+
+@mock.patch("app.validation.validator.datetime")
+def test_validate_batch_card_rules(mock_datetime):
+    mock_datetime.datetime.now.return_value = datetime.datetime(2023, 10, 1, 0, 0, 0)
+    batch = _batch_of(
+        credit_card_numbers=(
+            "5105105105105100",
+            "1234567890123456",
+            "123456789111",
+            "5105105105105100",
+        ),
+        expiration_dates=(
+            datetime.datetime(2023, 11, 1),
+            datetime.datetime(2024, 10, 1),
+            datetime.datetime(2024, 10, 1),
+            datetime.datetime(2023, 10, 1),
+        ),
+        cvvs=("123", "12", "1234", "12345"),
+    )
+
+    assert validator.validate_batch(batch).tolist() == [
+        0,
+        SellOrderError.CARD_NUMBER_INVALID | SellOrderError.CVV_LENGTH_INVALID,
+        SellOrderError.CARD_NUMBER_LENGTH_INVALID | SellOrderError.CARD_NUMBER_INVALID,
+        SellOrderError.CVV_LENGTH_INVALID | SellOrderError.CARD_EXPIRED,
+    ]
+
+
+def test_validate_batch_calls_luhn_validator_once_per_card_number():
+    luhn_validator = mock.Mock(return_value=True)
+    counting_validator = CreditRequestValidator(
+        config.LEGAL_AGE,
+        config.MINIMUM_CARD_NUMBER_LENGTH,
+        config.MAXIMUM_CARD_NUMBER_LENGTH,
+        config.MINIMUM_CVV_LENGTH,
+        config.MAXIMUM_CVV_LENGTH,
+        config.DAYS_IN_YEAR,
+        luhn_validator,
+    )
+    batch = _batch_of(credit_card_numbers=("5105105105105100", "2222405343248877") * 3)
+
+    counting_validator.validate_batch(batch)
+
+    assert luhn_validator.call_count == 2
+
+
+def test_validate_batch_uses_validate_many():
+    batched_validator = _validator_with_clock(None)
+    batched_validator.luhn_validator = LuhnValidator()
+    batch = _batch_of(credit_card_numbers=("5105105105105100", "1234567890123456") * 2)
+
+    assert (
+        batched_validator.validate_batch(batch).tolist()
+        == [
+            0,
+            SellOrderError.CARD_NUMBER_INVALID,
+        ]
+        * 2
+    )
+    assert batched_validator.luhn_validator.cache_info().misses == 2
+
+
+def test_validate_batch_empty():
+    assert len(validator.validate_batch(_batch_of()[:0])) == 0
+
+
+def _validator_with_clock(clock):
+    return CreditRequestValidator(
+        config.LEGAL_AGE,
+        config.MINIMUM_CARD_NUMBER_LENGTH,
+        config.MAXIMUM_CARD_NUMBER_LENGTH,
+        config.MINIMUM_CVV_LENGTH,
+        config.MAXIMUM_CVV_LENGTH,
+        config.DAYS_IN_YEAR,
+        is_luhn,
+        clock=clock,
+    )
+
+
+def test_snapshot_cutoffs_uses_injected_clock():
+    clock = mock.Mock(return_value=datetime.datetime(2023, 10, 1, 12, 30, 0))
+    clocked_validator = _validator_with_clock(clock)
+
+    cutoffs = clocked_validator.snapshot_cutoffs()
+
+    assert cutoffs.birth_cutoff == datetime.date(2005, 10, 1)
+    assert cutoffs.expiry_cutoff == datetime.datetime(2023, 10, 1, 12, 30, 0)
+    assert clock.call_count == 1
+
+
+def test_snapshot_cutoffs_leap_day():
+    clocked_validator = _validator_with_clock(lambda: datetime.datetime(2024, 2, 29))
+
+    assert clocked_validator.snapshot_cutoffs().birth_cutoff == datetime.date(
+        2006, 2, 28
+    )
+
+
+def test_scalar_checks_reuse_batch_cutoffs():
+    clock = mock.Mock(return_value=datetime.datetime(2023, 10, 1, 0, 0, 0))
+    clocked_validator = _validator_with_clock(clock)
+    cutoffs = clocked_validator.snapshot_cutoffs()
+
+    assert clocked_validator.is_customer_of_legal_age(
+        datetime.datetime(2005, 10, 1), cutoffs
+    )
+    assert not clocked_validator.is_customer_of_legal_age(
+        datetime.datetime(2005, 10, 2), cutoffs
+    )
+    assert not clocked_validator.is_credit_card_expired(
+        datetime.datetime(2023, 10, 1), cutoffs
+    )
+    assert clocked_validator.validate_batch(_batch_of(), cutoffs).tolist() == [0]
+    assert clock.call_count == 1
@@ -1,7 +1,9 @@
 from app.validation.validation_interface import (
     validate_sell_orders,
     validate_sell_order,
+    validate_sell_order_batch,
 )
+from app.model.sell_order_batch import SellOrderBatch
 from app.validation.validator import CreditRequestValidator
 from app.model.mobile_data_sell_order import MobileDataSellOrder
 import config
@@ -17,6 +19,7 @@ validator = CreditRequestValidator(
     config.MAXIMUM_CVV_LENGTH,
     config.DAYS_IN_YEAR,
     is_luhn,
+    clock=lambda: datetime.datetime(2023, 10, 1, 0, 0, 0),
 )
 
 test_user_no_errors = MobileDataSellOrder(
@@ -165,3 +168,66 @@ def test_validate_sell_order():
         "CVV length is invalid",
         "Credit card has expired",
     ]
+
+
+def test_validate_sell_order_batch_matches_validate_sell_orders():
+    sell_orders = [
+        test_user_no_errors,
+        test_user_expired_card,
+        test_user_invalid_cvv,
+        test_user_invalid_card_number,
+        test_user_invalid_card_number_length,
+        test_user_not_of_legal_age,
+        test_user_invalid_cvv_and_card_number,
+        test_user_all_errors,
+    ]
+
+    validated_batch = validate_sell_order_batch(
+        SellOrderBatch.from_sell_orders(sell_orders), validator
+    )
+
+    assert validated_batch.to_sell_orders() == validate_sell_orders(
+        sell_orders, validator
+    )
+
+
+def test_validate_sell_orders_does_not_modify_input():
+    sell_orders = [test_user_no_errors, test_user_all_errors]
+    snapshots = [deepcopy(sell_order) for sell_order in sell_orders]
+
+    validated_sell_orders = validate_sell_orders(sell_orders, validator)
+
+    assert sell_orders == snapshots
+    assert validated_sell_orders[1].validation_errors is not (
+        test_user_all_errors.validation_errors
+    )
+
+
+def test_validate_sell_orders_consume_input():
+    sell_orders = [
+        test_user_no_errors,
+        test_user_invalid_cvv,
+        test_user_all_errors,
+    ]
+    expected_sell_orders = validate_sell_orders(list(sell_orders), validator)
+
+    validated_sell_orders = validate_sell_orders(
+        sell_orders, validator, consume_input=True
+    )
+
+    assert sell_orders == []
+    assert validated_sell_orders == expected_sell_orders
+
+
+def test_validate_sell_order_keeps_existing_errors():
+    sell_order = test_user_invalid_cvv.model_copy(
+        update={"validation_errors": ["Flagged upstream"]}
+    )
+
+    validated_sell_order = validate_sell_order(sell_order, validator)
+
+    assert sell_order.validation_errors == ["Flagged upstream"]
+    assert validated_sell_order.validation_errors[:2] == [
+        "Flagged upstream",
+        "CVV length is invalid",
+    ]